@@ -0,0 +1,81 @@
+import argparse
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+
+import synthetic
+from panel import Panel
+from panel_store import store_panel, open_store
+
+# Total worker memory when N processes each read the full ZHVI panel: either
+# unpickled from the parent (what passing the fetch_data frame or a Panel to a
+# pool does) or attached read-only from the memory-mapped panel store.
+# Memory is proportional set size (PSS, from /proc/<pid>/smaps_rollup), so
+# pages shared between workers are counted once overall.
+
+
+def _pss_mb():
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Pss:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def _worker(mode, source, queue, done):
+    base = _pss_mb()
+    if mode == "pickle":
+        values = source.get()
+    else:
+        values = open_store(source).values
+    # Touch every page, as a per-metro regression or resample would
+    # (in row blocks, so the reduction's temporaries stay small)
+    total = sum(float(np.nansum(values[i:i + 1024], dtype=np.float64)) for i in range(0, len(values), 1024))
+    queue.put((_pss_mb() - base, total))
+    # Stay alive until every worker has reported, so shared pages are split between them
+    done.wait()
+
+
+def measure(mode, n_workers, panel, path):
+    ctx = mp.get_context("fork")
+    queue, done = ctx.Queue(), ctx.Event()
+    sources = [ctx.Queue() if mode == "pickle" else path for _ in range(n_workers)]
+    procs = [ctx.Process(target=_worker, args=(mode, s, queue, done)) for s in sources]
+    for p in procs:
+        p.start()
+    if mode == "pickle":
+        for s in sources:
+            s.put(panel.values)
+    results = [queue.get() for _ in procs]
+    done.set()
+    for p in procs:
+        p.join()
+    return sum(r[0] for r in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker memory: pickled panel vs. memory-mapped panel store.")
+    parser.add_argument("--regions", type=int, default=30000, help="Rows in the synthetic panel (ZIP scale)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    df = synthetic.zillow_wide(args.regions, geography="zip")
+    panel = Panel.from_wide(df)
+    del df
+    with tempfile.TemporaryDirectory() as tmp:
+        path = store_panel(panel, tmp)
+        size = panel.values.nbytes / 2 ** 20
+        print(f"Panel: {args.regions} regions x {len(panel.periods)} months, values {size:.0f} MB")
+        print(f"{'workers':>8} {'pickled (MB)':>14} {'mapped (MB)':>13}")
+        for n in args.workers:
+            print(f"{n:>8} {measure('pickle', n, panel, path):>14.0f} {measure('store', n, panel, path):>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+os.chdir(os.path.join(HERE, ".."))
+
+import synthetic
+import fetch_migration_history as migration
+from region_index import get_index, CENSUS_GEO_COL
+
+# Speedup of the join-based fetch_migration_history.process_data over the
+# previous per-city iterrows loop, on a synthetic Census response with
+# --metros CBSAs x 11 period codes x all four migration variables.
+
+
+def process_data_iterrows(df):
+    """The pre-vectorization implementation, kept as the reference."""
+    df['RNETMIG'] = pd.to_numeric(df['RNETMIG'], errors='coerce')
+    df['PERIOD_CODE'] = pd.to_numeric(df['PERIOD_CODE'], errors='coerce')
+    period_map = {code: 2008 + code for code in range(3, 12)}
+    df = df[df['PERIOD_CODE'].isin(period_map.keys())].copy()
+    df['Year'] = df['PERIOD_CODE'].map(period_map)
+    df['CBSA'] = pd.to_numeric(df[CENSUS_GEO_COL], errors='coerce')
+    names = df.drop_duplicates('CBSA')
+    index = get_index().extended(names['NAME'], names['CBSA'])
+    rows_by_cbsa = df.groupby('CBSA')
+    cohort_data = []
+    for cohort_name, cities in migration.COHORTS.items():
+        for city in cities:
+            cbsa = index.lookup(city)
+            if cbsa is not None and cbsa in rows_by_cbsa.groups:
+                for _, row in rows_by_cbsa.get_group(cbsa).iterrows():
+                    cohort_data.append({"Cohort": cohort_name, "City": city,
+                                        "Year": row['Year'], "NetMigrationRate": row['RNETMIG']})
+    return pd.DataFrame(cohort_data)
+
+
+def process_all_iterrows(df):
+    """Row-by-row version of the all-metro, all-variable table (what the loop would need)."""
+    variables = migration.MIGRATION_VARIABLES
+    for var in variables + ['PERIOD_CODE']:
+        df[var] = pd.to_numeric(df[var], errors='coerce')
+    df = df[df['PERIOD_CODE'].between(3, 11)]
+    out = []
+    for _, row in df.iterrows():
+        rec = {"CBSA": int(row[CENSUS_GEO_COL]), "NAME": row['NAME'], "Year": 2008 + int(row['PERIOD_CODE'])}
+        for var in variables:
+            rec[var] = row[var]
+        out.append(rec)
+    return pd.DataFrame(out)
+
+
+def best_of(func, frame, repeats):
+    times = []
+    for _ in range(repeats):
+        data = frame.copy()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = func(data)
+            times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized Census processing.")
+    parser.add_argument('--metros', type=int, default=935)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = synthetic.census_components(args.metros, variables=migration.MIGRATION_VARIABLES)
+    frame = pd.DataFrame(rows[1:], columns=rows[0])
+    print(f"Census frame: {len(frame)} rows ({args.metros} metros x 11 periods x {len(migration.MIGRATION_VARIABLES)} variables)")
+
+    t_old, old = best_of(process_data_iterrows, frame, args.repeats)
+    t_new, new = best_of(migration.process_data, frame, args.repeats)
+    pd.testing.assert_frame_equal(old.reset_index(drop=True), new.reset_index(drop=True), check_dtype=False)
+    print(f"  cohort rows   iterrows {t_old * 1000:8.1f} ms   join {t_new * 1000:8.1f} ms   {t_old / t_new:6.1f}x")
+
+    t_old, old = best_of(process_all_iterrows, frame, args.repeats)
+    t_new, new = best_of(migration.metro_table, frame, args.repeats)
+    assert len(old) == len(new)
+    print(f"  all metros    iterrows {t_old * 1000:8.1f} ms   join {t_new * 1000:8.1f} ms   {t_old / t_new:6.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+
+import synthetic
+from panel import Panel
+from normalize import pct_change_from_baseline
+from render import render_all
+import metro_multiples
+
+# Wall time to render the per-metro small multiples for a synthetic metro file:
+# pages drawn one after another, on the process pool, and a re-run with
+# nothing changed (every page skipped by its cache key).
+
+
+def _timed(charts, manifest, **kwargs):
+    start = time.perf_counter()
+    render_all(charts, manifest_path=manifest, **kwargs)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Small-multiples render time: serial vs. pool vs. cached.")
+    parser.add_argument("--regions", type=int, default=900)
+    parser.add_argument("--workers", type=int, default=None, help="Pool size (default: all cores)")
+    args = parser.parse_args()
+
+    df = synthetic.zillow_wide(args.regions, start="2018-01")
+    panel = Panel.from_wide(df)
+    pct = pct_change_from_baseline(panel.values, panel.dates, metro_multiples.BASELINE).astype(np.float32)
+    with tempfile.TemporaryDirectory() as tmp:
+        charts = metro_multiples.page_charts(panel, pct, output_dir=tmp)
+        manifest = os.path.join(tmp, "manifest.json")
+        serial = _timed(charts, manifest, workers=1, force=True)
+        pooled = _timed(charts, manifest, workers=args.workers, force=True)
+        cached = _timed(charts, manifest, workers=args.workers)
+    print(f"\n{args.regions} metros, {len(charts)} pages, {os.cpu_count()} cores")
+    print(f"  serial  {serial:8.2f}s")
+    print(f"  pool    {pooled:8.2f}s")
+    print(f"  cached  {cached:8.2f}s")
+
+
+if __name__ == "__main__":
+    main()
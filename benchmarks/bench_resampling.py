@@ -0,0 +1,62 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+
+import resampling
+
+# Bootstrap/permutation draws per second as the pool grows, for the cohort
+# panel size and for every metro split into cohorts. Workers = 0 is the
+# in-process path run_inference takes below SERIAL_CELLS; every pool is started
+# once and passed in, so its startup cost is not in the rate.
+
+
+def _cohorts(n_cities, n_cohorts=5, seed=0):
+    rng = np.random.default_rng(seed)
+    labels = np.array([f"Cohort {i % n_cohorts}" for i in range(n_cities)], dtype=object)
+    return rng.normal(40, 10, size=n_cities), labels
+
+
+def _rate(values, labels, draws, executor, repeats):
+    best = 0.0
+    for _ in range(repeats):
+        df, rate = resampling.run_inference(values, labels, draws, workers=1, executor=executor)
+        best = max(best, rate)
+    return best, df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resampling draws/sec vs. worker count.")
+    parser.add_argument("--cities", type=int, nargs="+", default=[25, 900])
+    parser.add_argument("--draws", type=int, default=resampling.DEFAULT_DRAWS)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4, 8])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} cores, {args.draws} draws per pair, chunks of ~{resampling.CHUNK_CELLS} cells")
+    print(f"{'cities':>7} {'cells':>12} {'workers':>8} {'draws/s':>12} {'speedup':>8}")
+    for n in args.cities:
+        values, labels = _cohorts(n)
+        cells = resampling.work_cells(labels, args.draws)
+        reference = None
+        for workers in args.workers:
+            if workers == 0:
+                rate, df = _rate(values, labels, args.draws, None, args.repeats)
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    rate, df = _rate(values, labels, args.draws, executor, args.repeats)
+            if reference is None:
+                reference = (rate, df)
+            # Seeds are per chunk, so the pool size must not change any result
+            assert df.equals(reference[1]), f"results differ with {workers} workers"
+            print(f"{n:7d} {cells:12,d} {workers or 'inline':>8} {rate:12,.0f} {rate / reference[0]:7.2f}x")
+    print(f"run_inference stays inline below {resampling.SERIAL_CELLS:,} cells")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+
+import synthetic
+import zip_rollup
+
+# Peak traced memory of the streaming ZIP -> metro rollup as the ZIP file
+# grows, against reading the same file whole with pandas. ZIPs are spread
+# over a fixed set of metros, as in the real file (~30k ZIPs, ~900 metros).
+BLOCK = 5000
+
+
+def write_zip_file(path, n_zips, n_metros):
+    # Written in blocks so the generator itself stays small
+    with open(path, "w") as f:
+        for i, first in enumerate(range(0, n_zips, BLOCK)):
+            df = synthetic.zillow_wide(min(BLOCK, n_zips - first), geography="zip", seed=i)
+            df["RegionName"] = [f"{z:05d}" for z in range(first, first + len(df))]
+            df["Metro"] = [f"Synthetic City {z % n_metros}, CA" for z in range(first, first + len(df))]
+            df.to_csv(f, index=False, header=first == 0, float_format="%.6f")
+
+
+def _peak_mb(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ZIP rollup peak memory vs. file size.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 20000, 40000])
+    parser.add_argument("--metros", type=int, default=900)
+    parser.add_argument("--chunk-rows", type=int, default=zip_rollup.CHUNK_ROWS)
+    args = parser.parse_args()
+
+    import pandas as pd
+    print(f"{'ZIPs':>8} {'file MB':>8} {'rollup MB':>10} {'rollup s':>9} {'read_csv MB':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            path = os.path.join(tmp, f"zip_{n}.csv")
+            write_zip_file(path, n, args.metros)
+            with open(path, "rb") as f:
+                rollup_mb, seconds = _peak_mb(lambda: zip_rollup.rollup_stream(f, chunk_rows=args.chunk_rows))
+            whole_mb, _ = _peak_mb(lambda: pd.read_csv(path))
+            print(f"{n:8d} {os.path.getsize(path) / 1e6:8.1f} {rollup_mb:10.1f} {seconds:9.2f} {whole_mb:12.1f}")
+
+
+if __name__ == "__main__":
+    main()
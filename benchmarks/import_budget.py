@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Startup budget for the analysis modules.
+# Each module is imported in a fresh interpreter (best of N runs) and timed
+# against a bare `import numpy, pandas` baseline, so the budget is the cost the
+# repo's own import graph adds on top of the unavoidable dependencies. Heavy
+# optional libraries (matplotlib, statsmodels, ...) must stay lazy: importing a
+# module may not pull any of them in.
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(HERE, "..", "src")
+BUDGET_FILE = os.path.join(HERE, "import_budget.json")
+
+PROBE = """
+import sys, time, json
+t = time.perf_counter()
+import numpy, pandas
+{stmt}
+print(json.dumps({{"ms": (time.perf_counter() - t) * 1000, "modules": sorted(sys.modules)}}))
+"""
+
+
+def _probe(module=None):
+    stmt = f"import {module}" if module else ""
+    out = subprocess.run([sys.executable, "-c", PROBE.format(stmt=stmt)], cwd=SRC_DIR,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def measure(module, repeats):
+    """Best-of-`repeats` import time (ms) and the modules it leaves loaded."""
+    runs = [_probe(module) for _ in range(repeats)]
+    return min(r["ms"] for r in runs), set(runs[0]["modules"])
+
+
+def check(config):
+    repeats = config.get("repeats", 5)
+    baseline = min(_probe()["ms"] for _ in range(repeats))
+    print(f"Baseline (numpy + pandas): {baseline:.0f} ms")
+    rows, failed = [], False
+    for module, budget in config["budget_ms"].items():
+        total, loaded = measure(module, repeats)
+        extra = total - baseline
+        leaked = [m for m in config.get("forbidden", []) if m in loaded]
+        ok = extra <= budget and not leaked
+        failed |= not ok
+        rows.append({"module": module, "ms": round(total, 1), "extra_ms": round(extra, 1),
+                     "budget_ms": budget, "leaked": leaked, "ok": ok})
+        note = f"  imports {', '.join(leaked)}" if leaked else ""
+        print(f"  {module:<32} {extra:7.0f} ms / {budget:4d} ms  {'ok' if ok else 'OVER'}{note}")
+    return rows, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check module import times against the startup budget.")
+    parser.add_argument('--budget', default=BUDGET_FILE)
+    parser.add_argument('--json', help="Also write the measurements to this file")
+    args = parser.parse_args()
+    with open(args.budget) as f:
+        config = json.load(f)
+    rows, failed = check(config)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=1)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
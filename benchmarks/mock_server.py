@@ -0,0 +1,78 @@
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+# Local HTTP stand-in for files.zillowstatic.com and api.census.gov.
+# Serves fixed payloads by URL path (query strings are ignored), with ETag /
+# Last-Modified validators so the snapshot cache's revalidation path is
+# exercised, plus optional per-request latency and injected 503s or 429s (to
+# exercise retry/backoff).
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        path = urlparse(self.path).path
+        with server.lock:
+            server.requests.append(path)
+            failing = server.failures.get(path, 0) > 0
+            if failing:
+                server.failures[path] -= 1
+        if server.delay:
+            time.sleep(server.delay)
+        if failing:
+            self.send_error(server.failure_status)
+            return
+        route = server.routes.get(path)
+        if route is None:
+            self.send_error(404)
+            return
+        body, content_type = route
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", server.last_modified)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve(routes, delay=0.0, failures=None, failure_status=503):
+    """
+    Serves {path: (bytes, content type)} on an ephemeral localhost port.
+    `failures` maps a path to how many requests for it fail with
+    `failure_status` first.
+    Yields the server; its base URL is server.url and every requested path is
+    appended to server.requests.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    server.routes = routes
+    server.delay = delay
+    server.failures = dict(failures or {})
+    server.failure_status = failure_status
+    server.requests = []
+    server.lock = threading.Lock()
+    server.last_modified = formatdate(usegmt=True)
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,249 @@
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(HERE)
+sys.path.insert(0, os.path.join(REPO, "src"))
+
+import synthetic
+from mock_server import serve
+import zhvi_cache
+from zhvi_loader import load_zhvi
+import analysis_zoom_hierarchy as zoom
+import analysis_pre_trend_housing as pre_trend
+import analysis_mechanism_regression as mechanism
+import fetch_migration_history as migration
+import census_fetch
+from cohorts import COHORTS
+
+# Scaling benchmark for every data stage, run against synthetic Zillow/Census
+# data served from a local HTTP stand-in.
+# Scale 1x is the cohort-sized panel (BASE_REGIONS metros x 2000-2025); 1000x
+# is roughly the size of Zillow's ZIP-level file. Each stage is timed (best of
+# --repeats) and, in a separate run, its peak traced allocation is recorded.
+# Results go to a JSON file that --compare can diff against another commit's.
+BASE_REGIONS = 32
+DEFAULT_SCALES = (1, 10, 100, 1000)
+RESULTS_DIR = os.path.join(HERE, "results")
+ZHVI_PATH = "/research/public_csvs/zhvi/" + os.path.basename(zoom.DATA_URL)
+CENSUS_PATH = "/data/2019/pep/components"
+
+# Growth of time with input size above this exponent is reported as super-linear
+SUPERLINEAR_EXPONENT = 1.3
+# Stages faster than this are too noisy to judge scaling or regressions
+MIN_SECONDS = 0.1
+
+
+def _stages(server, workdir):
+    """(name, callable) for every benchmarked stage; later stages reuse earlier results."""
+    url = server.url + ZHVI_PATH
+    state = {}
+    counter = iter(range(10 ** 9))
+
+    def fresh_cache():
+        # Cold cache for every run so fetch + parse is always measured
+        zhvi_cache.CACHE_DIR = os.path.join(workdir, "cache", str(next(counter)))
+        census_fetch.CACHE_DIR = os.path.join(zhvi_cache.CACHE_DIR, "census")
+        return zhvi_cache.CACHE_DIR
+
+    def fetch_parse():
+        state['df'] = zhvi_cache.cached_fetch(url, cache_dir=fresh_cache())
+
+    def load_select():
+        fresh_cache()
+        cities = [c for cities in COHORTS.values() for c in cities]
+        load_zhvi(url, regions=cities, start='2018-01-01')
+
+    def zoom_process():
+        zoom.process_and_aggregate(state['df'])
+
+    def pre_trend_process():
+        pre_trend.process_and_aggregate(state['df'])
+
+    def census_single():
+        fresh_cache()
+        state['census'] = migration.fetch_census_data()
+
+    def census_history():
+        fresh_cache()
+        census_fetch.fetch_census_history(base=server.url + "/data")
+
+    def census_process():
+        state['mig'] = migration.process_data(state['census'].copy())
+        state['mig'].to_csv(mechanism.MIGRATION_CSV, index=False)
+
+    def mechanism_load_merge():
+        fresh_cache()
+        mechanism.load_and_merge_data()
+
+    return [
+        ('fetch_parse', fetch_parse),
+        ('load_select', load_select),
+        ('zoom_process_and_aggregate', zoom_process),
+        ('pre_trend_process_and_aggregate', pre_trend_process),
+        ('census_fetch', census_single),
+        ('census_history_fetch', census_history),
+        ('census_process_data', census_process),
+        ('mechanism_load_and_merge', mechanism_load_merge),
+    ]
+
+
+def census_routes(n_metros, seed):
+    """Synthetic responses for every Census vintage the fetcher requests."""
+    routes = {}
+    for spec in census_fetch.VINTAGES:
+        if 'periods' in spec:
+            rows = synthetic.census_components(n_metros, spec['periods'], spec['variables'],
+                                               spec['period_col'], seed=seed)
+        else:
+            columns = [tpl.format(year=y) for tpl in spec['columns'].values() for y in spec['years']]
+            rows = synthetic.census_wide(n_metros, columns, seed=seed)
+        routes[f"/data/{spec['vintage']}/{spec['dataset']}"] = (synthetic.census_json(rows), "application/json")
+    return routes
+
+
+def _run_quiet(func):
+    with contextlib.redirect_stdout(io.StringIO()):
+        func()
+
+
+def run_scale(scale, repeats, workdir):
+    n_regions = BASE_REGIONS * scale
+    df = synthetic.zillow_wide(n_regions, seed=scale)
+    n_months = df.shape[1] - 5
+    routes = census_routes(n_regions, seed=scale)
+    routes[ZHVI_PATH] = (synthetic.zillow_csv(df), "text/csv")
+    del df
+    rows = []
+    with serve(routes) as server:
+        # Point the analysis modules at the stand-in instead of the live endpoints
+        zhvi_cache.FIXTURE_DIR = None
+        mechanism.DATA_URL = server.url + ZHVI_PATH
+        migration.CENSUS_URL = server.url + CENSUS_PATH
+        for name, func in _stages(server, workdir):
+            times = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                _run_quiet(func)
+                times.append(time.perf_counter() - start)
+            tracemalloc.start()
+            _run_quiet(func)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            rows.append({
+                'stage': name, 'scale': scale, 'regions': n_regions, 'months': n_months,
+                'seconds': min(times), 'peak_bytes': peak,
+            })
+            print(f"  {scale:>5}x  {name:<34} {min(times):9.3f}s  {peak / 2**20:9.1f} MB")
+    shutil.rmtree(os.path.join(workdir, "cache"), ignore_errors=True)
+    return rows
+
+
+def scaling_exponents(rows):
+    """Log-log slope of time vs. scale between consecutive scales, per stage."""
+    df = pd.DataFrame(rows).sort_values(['stage', 'scale'])
+    out = []
+    for stage, g in df.groupby('stage', sort=False):
+        for a, b in zip(g.itertuples(), list(g.itertuples())[1:]):
+            if b.seconds < MIN_SECONDS or a.seconds <= 0:
+                continue
+            exponent = math.log(b.seconds / a.seconds) / math.log(b.scale / a.scale)
+            out.append({'stage': stage, 'from_scale': a.scale, 'to_scale': b.scale,
+                        'exponent': exponent, 'superlinear': exponent > SUPERLINEAR_EXPONENT})
+    return out
+
+
+def compare(rows, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        old = {(r['stage'], r['scale']): r for r in json.load(f)['results']}
+    regressions = []
+    print(f"\nComparison against {baseline_path}")
+    for r in rows:
+        prev = old.get((r['stage'], r['scale']))
+        if prev is None:
+            continue
+        ratio = r['seconds'] / prev['seconds'] if prev['seconds'] else float('inf')
+        slower = ratio > tolerance and r['seconds'] >= MIN_SECONDS
+        if slower:
+            regressions.append({**r, 'baseline_seconds': prev['seconds'], 'ratio': ratio})
+        print(f"  {r['scale']:>5}x  {r['stage']:<34} {ratio:6.2f}x{'  SLOWER' if slower else ''}")
+    return regressions
+
+
+def _git_revision():
+    try:
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO,
+                               capture_output=True, text=True).stdout.strip()
+        return rev + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time and memory-profile every stage on synthetic data.")
+    parser.add_argument('--scales', default=",".join(map(str, DEFAULT_SCALES)),
+                        help="Comma-separated multiples of the cohort-sized panel")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--out', help="Results JSON (default benchmarks/results/<revision>.json)")
+    parser.add_argument('--compare', help="Earlier results JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help="Slowdown ratio vs. --compare reported as a regression")
+    args = parser.parse_args()
+    scales = [int(s) for s in args.scales.split(",")]
+
+    revision = _git_revision()
+    workdir = tempfile.mkdtemp(prefix="zhvi-bench-")
+    os.makedirs(os.path.join(workdir, "data"))
+    os.makedirs(os.path.join(workdir, "output"))
+    shutil.copy(synthetic.CROSSWALK_CSV, os.path.join(workdir, "data"))
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        rows = []
+        for scale in scales:
+            rows += run_scale(scale, args.repeats, workdir)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    exponents = scaling_exponents(rows)
+    superlinear = [e for e in exponents if e['superlinear']]
+    for e in superlinear:
+        print(f"Super-linear: {e['stage']} grows as scale^{e['exponent']:.2f} "
+              f"from {e['from_scale']}x to {e['to_scale']}x")
+    regressions = compare(rows, args.compare, args.tolerance) if args.compare else []
+
+    out = args.out or os.path.join(RESULTS_DIR, f"{revision}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump({
+            'revision': revision,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'base_regions': BASE_REGIONS,
+            'repeats': args.repeats,
+            'results': rows,
+            'scaling': exponents,
+            'regressions': regressions,
+        }, f, indent=1)
+    print(f"Results saved to {out}")
+    sys.exit(1 if superlinear or regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Generators for Zillow- and Census-shaped test data.
+# The cohort metros from the CBSA crosswalk are always included (under their
+# Zillow RegionName / Census NAME spellings) so every analysis stage finds its
+# regions; the rest of the rows are filler metros or ZIPs with random-walk
+# prices, late series starts and scattered NaN gaps like the real files.
+HERE = os.path.dirname(os.path.abspath(__file__))
+CROSSWALK_CSV = os.path.join(HERE, "..", "data", "cbsa_crosswalk.csv")
+CENSUS_GEO_COL = "metropolitan statistical area/micropolitan statistical area"
+
+STATES = ["CA", "NY", "TX", "FL", "WA", "OR", "MT", "ID", "NC", "TN", "GA", "AZ", "NV", "IL", "MA", "ME"]
+
+
+def cohort_metros():
+    """(CBSA, Zillow name, Census name) for every crosswalk metro."""
+    xw = pd.read_csv(CROSSWALK_CSV)
+    # Census spells the metro as its first alias, or as the crosswalk name when there is none
+    census = [aliases.split("|")[0] if isinstance(aliases, str) else name
+              for name, aliases in zip(xw["Name"], xw["Aliases"])]
+    return list(zip(xw["CBSA"].astype(int), xw["Name"], census))
+
+
+def _filler_codes(n, taken):
+    # Synthetic CBSA codes that never collide with the crosswalk
+    codes = [c for c in range(10000, 10000 + n + len(taken)) if c not in taken]
+    return codes[:n]
+
+
+def zillow_wide(n_regions, start="2000-01", end="2025-12", geography="metro",
+                nan_frac=0.02, late_start_frac=0.2, seed=0):
+    """
+    Wide ZHVI frame with `n_regions` rows and one month-end column per month.
+    geography='metro' mimics Metro_zhvi_*.csv; 'zip' mimics Zip_zhvi_*.csv
+    (5-digit RegionName plus State/City/Metro/CountyName columns, with the
+    cohort metros as the Metro of the first ZIPs).
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.period_range(start, end, freq="M").to_timestamp(how="end").normalize()
+    n_months = len(dates)
+
+    # Log random walk: metro-specific level, drift and volatility
+    level = rng.normal(12.3, 0.45, size=(n_regions, 1))
+    drift = rng.normal(0.004, 0.002, size=(n_regions, 1))
+    vol = rng.uniform(0.003, 0.012, size=(n_regions, 1))
+    steps = drift + vol * rng.standard_normal((n_regions, n_months))
+    values = np.exp(level + np.cumsum(steps, axis=1))
+
+    # Series that start late (NaN prefix) and isolated missing months
+    late = rng.random(n_regions) < late_start_frac
+    first = np.where(late, rng.integers(0, n_months // 2, size=n_regions), 0)
+    values[np.arange(n_months)[None, :] < first[:, None]] = np.nan
+    values[rng.random(values.shape) < nan_frac] = np.nan
+
+    metros = cohort_metros()
+    if geography == "metro":
+        names = [name for _, name, _ in metros[:n_regions]]
+        names += [f"Synthetic City {i}, {STATES[i % len(STATES)]}" for i in range(len(names), n_regions)]
+        ids = pd.DataFrame({
+            "RegionID": np.arange(100, 100 + n_regions),
+            "SizeRank": np.arange(n_regions),
+            "RegionName": names,
+            "RegionType": "msa",
+            "StateName": [n.rsplit(", ", 1)[-1][:2] for n in names],
+        })
+    elif geography == "zip":
+        metro_names = [name for _, name, _ in metros]
+        metro = [metro_names[i % len(metro_names)] if i < 4 * len(metro_names)
+                 else f"Synthetic City {i // 20}, {STATES[(i // 20) % len(STATES)]}" for i in range(n_regions)]
+        state = [m.rsplit(", ", 1)[-1][:2] for m in metro]
+        ids = pd.DataFrame({
+            "RegionID": np.arange(60000, 60000 + n_regions),
+            "SizeRank": np.arange(n_regions),
+            "RegionName": [f"{z:05d}" for z in 1000 + np.arange(n_regions)],
+            "RegionType": "zip",
+            "StateName": state,
+            "State": state,
+            "City": [m.split(",")[0].split("-")[0] for m in metro],
+            "Metro": metro,
+            "CountyName": [f"County {i % 97}" for i in range(n_regions)],
+        })
+    else:
+        raise ValueError(f"Unknown geography '{geography}'")
+
+    df_vals = pd.DataFrame(values, columns=dates.strftime("%Y-%m-%d"))
+    return pd.concat([ids, df_vals], axis=1)
+
+
+def zillow_csv(df):
+    """CSV bytes in Zillow's layout."""
+    return df.to_csv(index=False, float_format="%.6f").encode()
+
+
+def _census_geos(n_metros):
+    metros = cohort_metros()[:n_metros]
+    taken = {code for code, _, _ in metros}
+    filler = _filler_codes(n_metros - len(metros), taken)
+    geos = [(code, f"{census} Metro Area") for code, _, census in metros]
+    geos += [(code, f"Synthetic City {i}, {STATES[i % len(STATES)]} Metro Area") for i, code in enumerate(filler)]
+    return geos
+
+
+def census_components(n_metros, period_codes=range(1, 12), variables=("RNETMIG",),
+                      period_col="PERIOD_CODE", seed=0):
+    """
+    Census PEP API response (list of lists, all strings) with one row per
+    metro and period code, e.g. pep/components or pep/population (DATE_CODE).
+    """
+    rng = np.random.default_rng(seed)
+    geos = _census_geos(n_metros)
+    header = ["NAME"] + list(variables) + [period_col, CENSUS_GEO_COL]
+    rows = [header]
+    rates = rng.normal(0, 6, size=(len(geos), len(variables)))
+    for p in period_codes:
+        noise = rng.normal(0, 2, size=rates.shape)
+        for (code, name), r in zip(geos, rates + noise):
+            rows.append([name] + [f"{v:.8f}" for v in r] + [str(p), str(code)])
+    return rows
+
+
+def census_wide(n_metros, columns, seed=0):
+    """Census API response with one row per metro and the given per-year columns."""
+    rng = np.random.default_rng(seed)
+    geos = _census_geos(n_metros)
+    rows = [["NAME"] + list(columns) + [CENSUS_GEO_COL]]
+    values = rng.normal(0, 6, size=(len(geos), len(columns)))
+    for (code, name), r in zip(geos, values):
+        rows.append([name] + [f"{v:.8f}" for v in r] + [str(code)])
+    return rows
+
+
+def census_json(rows):
+    return json.dumps(rows).encode()
@@ -1,81 +1,106 @@
+import argparse
+import os
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import statsmodels.api as sm
-import io
-import requests
-from analysis_zoom_hierarchy import fetch_data, DATA_URL, COHORTS, get_region_name
+from zhvi_loader import fetch_data
+from cohorts import DATA_URL, COHORTS
+from region_index import get_index, resolve_cohorts
+from fetch_migration_history import ALL_METROS_CSV, MIGRATION_CSV
+from panel import Panel
+from batch_ols import batched_ols, within_transform
+from render import Chart, render
+import tracing
+from tracing import traced
 
-# Input Paths
-MIGRATION_CSV = "data/migration_history_2011_2019.csv"
+# Cohort A (Wealth Exporters) - The target of the hypothesis
+TARGET_COHORT = "Cohort A: Wealth Exporters (The Core)"
 
-def load_and_merge_data():
-    print("Loading Migration Data...")
+def load_migration():
+    """
+    (CBSA, Year, NetMigrationRate, ...) for every metro with migration data.
+    Uses the all-metro Census table when it has been fetched
+    (fetch_migration_history.py --all-metros); otherwise the cohort file, with
+    each City mapped to its CBSA through the crosswalk.
+    """
+    if os.path.exists(ALL_METROS_CSV):
+        df_mig = pd.read_csv(ALL_METROS_CSV).rename(columns={'RNETMIG': 'NetMigrationRate'})
+        return df_mig.drop(columns=['Cohort', 'City'], errors='ignore')
     df_mig = pd.read_csv(MIGRATION_CSV)
+    df_mig['CBSA'] = get_index().codes(df_mig['City'])
+    return df_mig.loc[df_mig['CBSA'] >= 0, ['CBSA', 'Year', 'NetMigrationRate']]
+
+@traced()
+def load_and_merge_data(store=False):
+    print("Loading Migration Data...")
+    df_mig = load_migration()
     
     print("Loading Housing Data...")
-    df_housing = fetch_data(DATA_URL)
-    
-    # Process Housing Data
-    # 1. Filter for Cohort A (Wealth Exporters) - The target of the hypothesis
-    target_cohort = "Cohort A: Wealth Exporters (The Core)"
-    target_cities = COHORTS[target_cohort]
-    
-    available_regions = df_housing['RegionName'].unique()
-    found_regions = []
-    for city in target_cities:
-        r = get_region_name(city, available_regions)
-        if r: found_regions.append(r)
-        
-    df_housing = df_housing[df_housing['RegionName'].isin(found_regions)].copy()
-    
-    # 2. Reshape and Filter for 2011-2019
-    date_cols = [c for c in df_housing.columns if c not in ['RegionID', 'SizeRank', 'RegionName', 'RegionType', 'StateName']]
-    df_long = df_housing.melt(id_vars=['RegionName'], value_vars=date_cols, var_name='Date', value_name='ZHVI')
-    df_long['Date'] = pd.to_datetime(df_long['Date'])
-    df_long['Year'] = df_long['Date'].dt.year
-    
-    # 3. Annualize (Mean ZHVI per Year)
-    df_housing_annual = df_long.groupby(['RegionName', 'Year'])['ZHVI'].mean().reset_index()
-    
-    # 4. Merge
-    # We need to map RegionName (Housing) to City (Migration)
-    # Migration CSV has 'City' column (e.g. "San Francisco")
-    # Housing has 'RegionName' (e.g. "San Francisco, CA")
-    
-    # Let's create a mapping column in df_housing_annual
-    df_housing_annual['City_Key'] = df_housing_annual['RegionName'].apply(lambda x: x.split(',')[0])
-    # Handle special cases if any (e.g. "Los Angeles-Long Beach..." -> "Los Angeles")
-    # The migration script used fuzzy matching on the simple city name.
-    # Let's try to match back.
-    
-    merged_data = []
-    
-    for city_full in target_cities:
-        # city_full is "San Francisco, CA"
-        # Migration data uses "San Francisco" (simple name)
-        # We need to derive the simple name to match migration data
-        city_simple = city_full.split(',')[0]
-        
-        # Migration Data for this city
-        mig_subset = df_mig[(df_mig['Cohort'] == target_cohort) & (df_mig['City'] == city_simple)]
-        
-        # Housing Data for this city
-        # Find the region name again
-        region_name = get_region_name(city_full, available_regions)
-        if not region_name: continue
-        
-        housing_subset = df_housing_annual[df_housing_annual['RegionName'] == region_name]
-        
-        # Merge on Year
-        if not mig_subset.empty and not housing_subset.empty:
-            merged = pd.merge(mig_subset, housing_subset, on='Year', how='inner')
-            merged_data.append(merged)
-        
-    df_final = pd.concat(merged_data)
-    return df_final
+    if store:
+        # Mapped read-only from the shared panel store
+        from panel_store import fetch_panel
+        df_housing, path = fetch_panel(DATA_URL, start='2011-01-01', end='2019-12-31')
+        print(f"Panel store: {path}")
+    else:
+        # Every metro over the migration window (2011-2019)
+        df_housing = fetch_data(DATA_URL, start='2011-01-01', end='2019-12-31')
+    
+    return merge_housing_migration(df_housing, df_mig)
 
+@traced()
+def merge_housing_migration(df_housing, df_mig):
+    """
+    One keyed join of annual housing values and migration on (CBSA, Year), for
+    every metro in both. Cohort metros carry their cohort label; the rest
+    have Cohort NaN.
+    """
+    # 1. Compact panel of all metros (df_housing is the wide frame or a store-backed Panel)
+    panel = df_housing if isinstance(df_housing, Panel) else Panel.from_wide(df_housing)
+    if 'RegionType' in panel.meta.columns:
+        panel = panel.select((panel.meta['RegionType'] != 'country').to_numpy())
+    cohort_map = resolve_cohorts(COHORTS, panel.region_names)
+    panel = panel.with_cohorts(cohort_map)
+    print(panel.report())
+    
+    # 2. Annualize (Mean ZHVI per Year) directly on the wide matrix
+    df_housing_annual = panel.annual_mean()
+    n_years = len(df_housing_annual) // max(1, len(panel.regions))
+    
+    # 3. Region keys, resolved once per region and repeated over its years.
+    # Census names in the migration table resolve every metro, not just the crosswalk's
+    index = get_index()
+    if 'NAME' in df_mig.columns:
+        census = df_mig.drop_duplicates('CBSA')
+        index = index.extended(census['NAME'], census['CBSA'])
+    names = panel.region_names
+    df_housing_annual['CBSA'] = np.repeat(index.codes(names), n_years)
+    df_housing_annual['Cohort'] = np.repeat(np.asarray(panel.cohorts, dtype=object), n_years)
+    city = pd.Series(names).str.split(',').str[0].str.split('-').str[0].to_numpy()
+    df_housing_annual['City'] = np.repeat(city, n_years)
+    
+    # 4. Merge (one migration row per metro-year, or the join would duplicate housing rows)
+    keyed = df_housing_annual[(df_housing_annual['CBSA'] >= 0) & df_housing_annual['ZHVI'].notna()]
+    df_final = keyed.merge(df_mig, on=['CBSA', 'Year'], how='inner', validate='many_to_one')
+    print(f"Merged {df_final['RegionName'].nunique()} metros x {df_final['Year'].nunique()} years")
+    
+    # Cohort metros in COHORTS order, then the rest in panel order; years ascending
+    # within each (the row order the time-series diagnostics, e.g. Durbin-Watson, see)
+    order = list(dict.fromkeys([name for cities in cohort_map.values() for name in cities] + list(names)))
+    rank = df_final['RegionName'].map({name: i for i, name in enumerate(order)})
+    df_final = df_final.assign(_rank=rank).sort_values(['_rank', 'Year'], kind='stable')
+    return df_final.drop(columns='_rank').reset_index(drop=True)
+
+def target_rows(df, cohort=TARGET_COHORT):
+    """Rows of the hypothesis cohort; every merged metro when it is not among the cohorts in use."""
+    if cohort not in set(df['Cohort'].dropna()):
+        print(f"{cohort!r} not in the merged panel; using all {df['RegionName'].nunique()} metros")
+        return df
+    return df[df['Cohort'] == cohort]
+
+@traced()
 def run_regression(df):
+    import statsmodels.api as sm
     print("Running OLS Regression (Price ~ Net_Migration_Rate)...")
+    df = target_rows(df)
     
     # Y = ZHVI
     # X = NetMigrationRate
@@ -96,12 +121,65 @@ def run_regression(df):
     
     return model
 
-def plot_mechanism(df):
-    # Plot for San Francisco as the representative case
-    city = "San Francisco"
-    subset = df[df['City'] == city].sort_values('Year')
-    
-    fig, ax1 = plt.subplots(figsize=(10, 6))
+def _fe_fit(df, regressors, spec, group='all'):
+    # City and Year fixed effects absorbed by the within-transformation, SEs clustered by city
+    sample = df.dropna(subset=['ZHVI'] + regressors)
+    city = pd.factorize(sample['RegionName'])[0]
+    year = pd.factorize(sample['Year'])[0]
+    Z = within_transform(sample[['ZHVI'] + regressors].to_numpy(), [city, year])
+    absorbed = city.max() + year.max() + 1
+    table = batched_ols(Z[:, 0], Z[:, 1:], regressors, cov='cluster', clusters=city, absorbed=absorbed)
+    return table.assign(spec=spec, group=group)
+
+@traced()
+def run_batched_specs(df):
+    print("Running batched regressions (per-city, two-way FE, lagged migration)...")
+    df = df.sort_values(['RegionName', 'Year']).reset_index(drop=True)
+    
+    # Lagged migration: previous year's rate for the same metro (NaN across gaps)
+    by_city = df.groupby('RegionName')
+    prev_year = by_city['Year'].shift(1)
+    df['NetMigrationRate_lag1'] = by_city['NetMigrationRate'].shift(1).where(prev_year == df['Year'] - 1)
+    
+    const = np.ones(len(df))
+    X = np.column_stack([const, df['NetMigrationRate']])
+    X_lag = np.column_stack([const, df['NetMigrationRate'], df['NetMigrationRate_lag1']])
+    terms, terms_lag = ['const', 'NetMigrationRate'], ['const', 'NetMigrationRate', 'NetMigrationRate_lag1']
+    
+    # Hypothesis cohort (Cohort A) specs, as before
+    target = target_rows(df)
+    rows = target.index.to_numpy()
+    tables = [
+        # Baseline pooled spec (same point estimates as regression_results.txt, HC1 SEs)
+        batched_ols(target['ZHVI'], X[rows], terms, cov='HC1').assign(spec='pooled', group='all'),
+        # One regression per metro, all solved in one batched pass
+        batched_ols(target['ZHVI'], X[rows], terms, groups=target['RegionName'], cov='HC1').assign(spec='per_city'),
+        batched_ols(target['ZHVI'], X_lag[rows], terms_lag, groups=target['RegionName'], cov='HC1').assign(spec='per_city_lag'),
+        _fe_fit(target, ['NetMigrationRate'], 'twfe'),
+        _fe_fit(target, ['NetMigrationRate', 'NetMigrationRate_lag1'], 'twfe_lag'),
+    ]
+    # Full cross-section: every merged metro, and each cohort on its own
+    if len(target) < len(df):
+        cohort = df['Cohort'].fillna('Unassigned')
+        tables += [
+            batched_ols(df['ZHVI'], X, terms, cov='HC1').assign(spec='pooled_all', group='all'),
+            batched_ols(df['ZHVI'], X, terms, groups=cohort, cov='HC1').assign(spec='per_cohort'),
+            batched_ols(df['ZHVI'], X, terms, groups=df['RegionName'], cov='HC1').assign(spec='per_city_all'),
+            _fe_fit(df, ['NetMigrationRate'], 'twfe_all'),
+            _fe_fit(df, ['NetMigrationRate', 'NetMigrationRate_lag1'], 'twfe_all_lag'),
+        ]
+        for c in pd.unique(cohort):
+            members = df[cohort == c]
+            if members['RegionName'].nunique() > 1:
+                tables.append(_fe_fit(members, ['NetMigrationRate'], 'twfe_cohort', group=c))
+    table = pd.concat(tables)[['spec', 'group', 'term', 'coef', 'se', 't', 'p_value', 'r2', 'nobs']]
+    table.to_csv('output/batched_regressions.csv', index=False)
+    print("Batched regression table saved to output/batched_regressions.csv")
+    return table
+
+def draw_mechanism(fig, subset, style):
+    city = style['city']
+    ax1 = fig.subplots()
     
     color = 'tab:blue'
     ax1.set_xlabel('Year')
@@ -113,22 +191,42 @@ def plot_mechanism(df):
     
     color = 'tab:red'
     ax2.set_ylabel('Net Migration Rate (per 1k)', color=color)  # we already handled the x-label with ax1
-    bars = ax2.bar(subset['Year'], subset['NetMigrationRate'], color=color, alpha=0.3, label='Net Migration')
+    ax2.bar(subset['Year'], subset['NetMigrationRate'], color=color, alpha=0.3, label='Net Migration')
     ax2.tick_params(axis='y', labelcolor=color)
     ax2.axhline(0, color='black', linewidth=0.8, linestyle='--')
     
-    plt.title(f'The "Golden Handcuffs": {city} (2011-2019)\nPrices Rose While People Left')
+    ax1.set_title(f'The "Golden Handcuffs": {city} (2011-2019)\nPrices Rose While People Left')
     fig.tight_layout()  # otherwise the right y-label is slightly clipped
-    plt.savefig('output/mechanism_chart.png')
-    print("Chart saved to output/mechanism_chart.png")
 
-def main():
-    df = load_and_merge_data()
+def mechanism_chart(df, path='output/mechanism_chart.png'):
+    # Plot for San Francisco as the representative case
+    city = "San Francisco"
+    subset = df.loc[df['City'] == city, ['Year', 'ZHVI', 'NetMigrationRate']].sort_values('Year').reset_index(drop=True)
+    return Chart(path, draw_mechanism, subset, {'city': city, 'figsize': (10, 6)})
+
+@traced()
+def plot_mechanism(df):
+    render(mechanism_chart(df))
+
+def main(plots=True, store=False):
+    df = load_and_merge_data(store)
     if not df.empty:
         run_regression(df)
-        plot_mechanism(df)
+        run_batched_specs(df)
+        if plots:
+            plot_mechanism(df)
     else:
         print("No data found for regression.")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Housing price vs. net migration regressions.")
+    parser.add_argument('--no-plots', action='store_true',
+                        help="Fit and write the regressions only; never imports matplotlib")
+    parser.add_argument('--store', action='store_true',
+                        help="Read housing data from the memory-mapped panel store")
+    parser.add_argument('--trace', action='store_true',
+                        help="Record per-stage wall/CPU time and memory to output/trace_mechanism.json")
+    args = parser.parse_args()
+    tracing.enable(args.trace or tracing.ENABLED)
+    main(plots=not args.no_plots, store=args.store)
+    tracing.finish('output/trace_mechanism.json')
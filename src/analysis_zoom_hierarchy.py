@@ -1,141 +1,97 @@
+import argparse
 import pandas as pd
-import matplotlib.pyplot as plt
-import io
-import requests
+from zhvi_loader import fetch_data
+from region_index import resolve_cohorts
+from panel import Panel
+from normalize import pct_change_from_baseline, aggregate_cohorts, to_long
+from render import Chart, render, cohort_colors
+import tracing
+from tracing import traced
 
-# 1. Data Fetching
-DATA_URL = "https://files.zillowstatic.com/research/public_csvs/zhvi/Metro_zhvi_uc_sfrcondo_tier_0.33_0.67_sm_sa_month.csv"
-
-def fetch_data(url):
-    print(f"Fetching data from {url}...")
-    s = requests.get(url).content
-    df = pd.read_csv(io.StringIO(s.decode('utf-8')))
-    return df
-
-# 2. Cohort Definition
-COHORTS = {
-    "Cohort A: Wealth Exporters (The Core)": [
-        "San Francisco, CA", "New York, NY", "San Jose, CA", "Boston, MA",
-        "Los Angeles, CA", "Washington, DC", 
-        "Seattle, WA", "Chicago, IL"
-    ],
-    "Cohort B: Major Sunbelt Hubs (Urban Importers)": [
-        "Austin, TX", "Phoenix, AZ", "Miami, FL", "Tampa, FL",
-        "Dallas, TX", "Atlanta, GA", "Nashville, TN", 
-        "Las Vegas, NV", "Charlotte, NC"
-    ],
-    "Cohort C: Nature Enclaves (Scenic Importers)": [
-        "Bozeman, MT", "Bend, OR", "Coeur d'Alene, ID", "Asheville, NC",
-        "Reno, NV", "Spokane, WA", "Portland, ME", "Knoxville, TN"
-    ]
-}
+# 1. Data Fetching / 2. Cohort Definition
+# Shared with the other analyses; matplotlib is only imported when plotting
+from cohorts import DATA_URL, COHORTS
 
 def get_region_name(target_city, available_regions):
     """
     Finds the correct RegionName in the dataframe.
-    Handles exact matches and specific fuzzy cases like 'Bend, OR' -> 'Bend-Redmond, OR'.
+    Resolves exact matches and aliases like 'Bend, OR' -> 'Bend-Redmond, OR' through the CBSA index.
     """
-    if target_city in available_regions:
-        return target_city
-    
-    # Specific fuzzy match logic
-    if target_city == "Bend, OR":
-        # Look for Bend-Redmond
-        matches = [r for r in available_regions if "Bend" in r and "OR" in r]
-        if matches:
-            print(f"Fuzzy match: '{target_city}' -> '{matches[0]}'")
-            return matches[0]
-            
-    print(f"Warning: Could not find region for '{target_city}'")
-    return None
+    found = resolve_cohorts({target_city: [target_city]}, available_regions)[target_city]
+    return found[0] if found else None
 
+@traced()
 def process_and_aggregate(df):
-    available_regions = df['RegionName'].unique()
-    
-    # Map cohorts to actual region names found in data
-    cohort_map = {}
-    all_found_cities = []
-    
-    for cohort_name, cities in COHORTS.items():
-        cohort_map[cohort_name] = []
-        for city in cities:
-            actual_name = get_region_name(city, available_regions)
-            if actual_name:
-                cohort_map[cohort_name].append(actual_name)
-                all_found_cities.append(actual_name)
+    # `df` is the wide Zillow frame, or a Panel attached from the shared panel store
+    from_store = isinstance(df, Panel)
+    available_regions = df.region_names if from_store else df['RegionName'].unique()
     
-    # Filter Data
-    df_filtered = df[df['RegionName'].isin(all_found_cities)].copy()
+    # Map cohorts to actual region names found in data (CBSA index lookup)
+    cohort_map = resolve_cohorts(COHORTS, available_regions)
+    all_found_cities = [city for cities in cohort_map.values() for city in cities]
     
-    # Reshape
-    date_cols = [c for c in df.columns if c not in ['RegionID', 'SizeRank', 'RegionName', 'RegionType', 'StateName']]
-    df_long = df_filtered.melt(id_vars=['RegionName'], value_vars=date_cols, var_name='Date', value_name='ZHVI')
-    df_long['Date'] = pd.to_datetime(df_long['Date'])
+    if from_store:
+        # Only the cohort rows are copied out of the mapped matrix
+        panel = df.for_cohorts(cohort_map)
+    else:
+        # Filter Data
+        df_filtered = df[df['RegionName'].isin(all_found_cities)]
+        
+        # Reshape to a compact regions x months panel with cohort codes
+        panel = Panel.from_wide(df_filtered, cohort_map)
+    print(panel.report())
     
-    # Normalize (March 2020 Baseline)
+    # Normalize (March 2020 Baseline) - one broadcast over all regions
     baseline_date = pd.Timestamp('2020-03-31')
-    normalized_dfs = []
-    
-    for city in df_long['RegionName'].unique():
-        city_data = df_long[df_long['RegionName'] == city].copy().sort_values('Date')
-        try:
-            baseline_val = city_data.loc[city_data['Date'] == baseline_date, 'ZHVI'].values[0]
-            city_data['PctChange'] = ((city_data['ZHVI'] - baseline_val) / baseline_val) * 100
-            
-            # Assign Cohort
-            for cohort_name, actual_cities in cohort_map.items():
-                if city in actual_cities:
-                    city_data['Cohort'] = cohort_name
-                    break
-            
-            normalized_dfs.append(city_data)
-        except IndexError:
+    pct = pct_change_from_baseline(panel.values, panel.dates, baseline_date)
+    if pct is None:
+        for city in panel.region_names:
             print(f"Warning: Baseline not found for {city}")
-            
-    df_norm = pd.concat(normalized_dfs)
+        raise ValueError(f"Baseline {baseline_date.date()} not in data")
     
     # Aggregate: Group by Date and Cohort
-    df_agg = df_norm.groupby(['Date', 'Cohort'])['PctChange'].agg(['mean', 'min', 'max']).reset_index()
+    df_agg = aggregate_cohorts(pct, panel.cohorts, panel.dates, stats=['mean', 'min', 'max'])
+    df_norm = to_long(panel.region_names, panel.dates, panel.values, pct, panel.cohorts)
     return df_agg, df_norm
 
 # 3. Visualization
-def plot_hierarchy(df_agg):
-    plt.figure(figsize=(12, 8))
-    
-    # Filter for plot range
-    df_plot = df_agg[df_agg['Date'] >= '2018-01-01']
-    
-    # Define styles
-    styles = {
-        "Cohort A: Wealth Exporters (The Core)": {"color": "tab:blue", "style": "--"},
-        "Cohort B: Major Sunbelt Hubs (Urban Importers)": {"color": "tab:orange", "style": "-"},
-        "Cohort C: Nature Enclaves (Scenic Importers)": {"color": "tab:green", "style": "-"}
-    }
-    
-    for cohort in COHORTS.keys():
+def draw_hierarchy(fig, df_plot, style):
+    ax = fig.subplots()
+    for cohort, spec in style['cohorts'].items():
         subset = df_plot[df_plot['Cohort'] == cohort]
-        style = styles.get(cohort, {"color": "gray", "style": "-"})
         
         # Plot Mean Line
-        plt.plot(subset['Date'], subset['mean'], label=cohort, color=style['color'], linestyle=style['style'], linewidth=2.5)
+        ax.plot(subset['Date'], subset['mean'], label=cohort, color=spec['color'], linestyle=spec['style'], linewidth=2.5)
         
         # Plot Shaded Range
-        plt.fill_between(subset['Date'], subset['min'], subset['max'], color=style['color'], alpha=0.15)
+        ax.fill_between(subset['Date'], subset['min'], subset['max'], color=spec['color'], alpha=0.15)
         
-    plt.title('The "Zoom Town" Hierarchy: Housing Inflation Shock (2018-2025)')
-    plt.ylabel('Cumulative % Change (Baseline: March 2020)')
-    plt.xlabel('Year')
-    plt.axhline(0, color='black', linewidth=0.8)
-    plt.axvline(pd.Timestamp('2020-03-31'), color='red', linestyle=':', alpha=0.5)
+    ax.set_title('The "Zoom Town" Hierarchy: Housing Inflation Shock (2018-2025)')
+    ax.set_ylabel('Cumulative % Change (Baseline: March 2020)')
+    ax.set_xlabel('Year')
+    ax.axhline(0, color='black', linewidth=0.8)
+    ax.axvline(pd.Timestamp('2020-03-31'), color='red', linestyle=':', alpha=0.5)
+    
+    ax.legend()
+    ax.grid(True, alpha=0.3)
+    fig.tight_layout()
+
+def hierarchy_chart(df_agg, path='output/zoom_town_hierarchy.png'):
+    # Filter for plot range
+    df_plot = df_agg[df_agg['Date'] >= '2018-01-01'].reset_index(drop=True)
     
-    plt.legend()
-    plt.grid(True, alpha=0.3)
-    plt.tight_layout()
-    plt.savefig('output/zoom_town_hierarchy.png')
-    print("Chart saved to output/zoom_town_hierarchy.png")
+    # Define styles (Exporters dashed; other cohorts solid)
+    styles = {cohort: {"color": color, "style": "--" if cohort == "Cohort A: Wealth Exporters (The Core)" else "-"}
+              for cohort, color in cohort_colors(COHORTS.keys()).items()}
+    return Chart(path, draw_hierarchy, df_plot, {'cohorts': styles})
+
+@traced()
+def plot_hierarchy(df_agg):
+    render(hierarchy_chart(df_agg))
 
 # 4. Summary
-def generate_summary(df_agg):
+def format_summary(df_agg, cohorts=None):
+    """Summary text for the latest date in `df_agg`, one block per cohort (default: COHORTS order)."""
     latest_date = df_agg['Date'].max()
     latest_stats = df_agg[df_agg['Date'] == latest_date]
     
@@ -145,24 +101,60 @@ def generate_summary(df_agg):
     Analysis Date: {latest_date.strftime('%Y-%m-%d')}
     """
     
-    for cohort in COHORTS.keys():
+    for cohort in (COHORTS.keys() if cohorts is None else cohorts):
         stats = latest_stats[latest_stats['Cohort'] == cohort]
         if not stats.empty:
             mean_val = stats['mean'].values[0]
             min_val = stats['min'].values[0]
             max_val = stats['max'].values[0]
             summary += f"\n    {cohort}:\n      - Mean Growth: {mean_val:.2f}%\n      - Range: {min_val:.2f}% to {max_val:.2f}%\n"
-            
+    return summary
+
+@traced()
+def generate_summary(df_agg):
+    summary = format_summary(df_agg)
     with open('output/cohort_summary.txt', 'w') as f:
         f.write(summary)
     print("Summary saved to output/cohort_summary.txt")
     print(summary)
 
-def main():
-    df = fetch_data(DATA_URL)
-    df_agg, df_norm = process_and_aggregate(df)
-    plot_hierarchy(df_agg)
+def main(incremental=False, plots=True, store=False):
+    # Only cohort metros from 2018 on are used (plot window; includes the March 2020 baseline)
+    cohort_cities = [city for cities in COHORTS.values() for city in cities]
+    if store:
+        # Every metro is mapped from the shared panel store instead
+        from panel_store import fetch_panel
+        df, path = fetch_panel(DATA_URL, start='2018-01-01')
+        print(f"Panel store: {path}")
+    else:
+        df = fetch_data(DATA_URL, regions=cohort_cities, start='2018-01-01')
+    if incremental:
+        # Reuse the persisted panel; only new months and revised regions are recomputed.
+        # The summary and chart are still rewritten from the full aggregate.
+        from zoom_incremental import run_incremental
+        df_agg, changes = run_incremental(df, COHORTS)
+        if changes['mode'] == 'unchanged':
+            return
+    else:
+        df_agg, df_norm = process_and_aggregate(df)
+    if plots:
+        plot_hierarchy(df_agg)
     generate_summary(df_agg)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Zoom Town hierarchy analysis.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Reuse the last run's normalized panel: only new months and revised regions are "
+                             "normalized and aggregated (the file is still fetched and parsed in full)")
+    parser.add_argument('--no-plots', action='store_true',
+                        help="Compute and write the summary only; never imports matplotlib")
+    parser.add_argument('--store', action='store_true',
+                        help="Run off the memory-mapped panel store (all metros) instead of a per-run frame")
+    parser.add_argument('--trace', action='store_true',
+                        help="Record per-stage wall/CPU time and memory to output/trace_zoom_town.json")
+    args = parser.parse_args()
+    if args.store and args.incremental:
+        parser.error("--incremental keeps its own state; it cannot be combined with --store")
+    tracing.enable(args.trace or tracing.ENABLED)
+    main(incremental=args.incremental, plots=not args.no_plots, store=args.store)
+    tracing.finish('output/trace_zoom_town.json')
@@ -0,0 +1,150 @@
+import numpy as np
+import pandas as pd
+
+from tracing import traced
+
+# Batched least squares: many regressions (one per group) solved at once by
+# stacking per-group X'X / X'y with reduceat and a single batched inverse,
+# plus within-transformation for absorbed fixed effects.
+GRAM_CELLS = 1 << 24  # largest n x k x k outer-product stack built in one go
+
+
+@traced()
+def within_transform(values, fe_codes, tol=1e-10, max_iter=500):
+    """
+    Sweeps out one or more sets of fixed effects from `values` (n,) or (n, m)
+    by alternating group demeaning until convergence. `fe_codes` is a list of
+    integer-coded (0..G-1) arrays, one per fixed-effect dimension.
+    """
+    # Columns x rows layout keeps every per-column pass contiguous
+    out = np.array(np.atleast_2d(np.asarray(values, dtype=np.float64).T), order='C', copy=True)
+    squeeze = np.ndim(values) == 1
+    sweeps = []
+    for codes in fe_codes:
+        codes = np.asarray(codes)
+        counts = np.bincount(codes)
+        # Sorted codes (e.g. regions of a region-major panel) reduce with one reduceat
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if np.all(codes[1:] >= codes[:-1]) else None
+        sweeps.append((codes, counts, starts))
+    for _ in range(max_iter):
+        biggest = 0.0
+        for codes, counts, starts in sweeps:
+            if starts is not None:
+                means = np.add.reduceat(out, starts, axis=1) / counts[codes[starts]]
+                out -= np.repeat(means, np.diff(np.r_[starts, len(codes)]), axis=1)
+            else:
+                sums = np.stack([np.bincount(codes, weights=col, minlength=len(counts)) for col in out])
+                means = sums / np.maximum(counts, 1)
+                out -= means[:, codes]
+            biggest = max(biggest, np.abs(means).max())
+        # A single sweep is exact for one FE or a balanced panel
+        if len(fe_codes) == 1 or biggest < tol:
+            break
+    return out[0] if squeeze else out.T
+
+
+def _group_gram(X, starts, weights=None):
+    """Per-group X'WX, (groups x k x k)."""
+    n, k = X.shape
+    Xw = X if weights is None else X * weights[:, None]
+    if n * k * k <= GRAM_CELLS:
+        return np.add.reduceat(np.einsum('ni,nj->nij', Xw, X), starts, axis=0)
+    # Many rows x many regressors (e.g. event-study dummies): the n x k x k
+    # outer products would not fit, so use one matmul per group instead
+    ends = np.r_[starts[1:], n]
+    return np.stack([Xw[s:e].T @ X[s:e] for s, e in zip(starts, ends)])
+
+
+@traced()
+def batched_ols(y, X, names, groups=None, cov='HC1', clusters=None, absorbed=0, return_vcov=False):
+    """
+    Fits y ~ X separately for every value of `groups` (one pooled fit if None).
+
+    cov: 'nonrobust', 'HC1' or 'cluster' (requires `clusters`).
+    absorbed: fixed effects already swept out of y/X, counted against the
+    residual degrees of freedom.
+    p-values use t(dof), or t(clusters - 1) when clustered.
+    Returns a tidy frame: group, term, coef, se, t, p_value, r2, nobs, plus
+    the (groups x k x k) coefficient covariance when return_vcov is set.
+    """
+    # scipy.stats is slow to import; only needed once we have t-statistics
+    from scipy import stats
+    y = np.asarray(y, dtype=np.float64)
+    X = np.asarray(X, dtype=np.float64)
+    groups = np.zeros(len(y), dtype=np.int64) if groups is None else np.asarray(groups)
+    keep = ~np.isnan(y) & ~np.isnan(X).any(axis=1)
+    y, X, groups = y[keep], X[keep], groups[keep]
+    if clusters is not None:
+        clusters = np.asarray(clusters)[keep]
+
+    gcodes, labels = pd.factorize(groups, sort=True)
+    order = np.argsort(gcodes, kind='stable')
+    y, X, gcodes = y[order], X[order], gcodes[order]
+    if clusters is not None:
+        clusters = clusters[order]
+    starts = np.flatnonzero(np.r_[True, gcodes[1:] != gcodes[:-1]])
+    nobs = np.diff(np.r_[starts, len(y)])
+    k = X.shape[1]
+
+    # Per-group normal equations for every group at once
+    XtX = _group_gram(X, starts)
+    Xty = np.add.reduceat(X * y[:, None], starts, axis=0)
+    full_rank = np.linalg.matrix_rank(XtX) == k
+    bread = np.linalg.pinv(XtX)
+    beta = np.einsum('gij,gj->gi', bread, Xty)
+
+    resid = y - np.einsum('nk,nk->n', X, beta[gcodes])
+    ssr = np.add.reduceat(resid ** 2, starts)
+    ybar = np.add.reduceat(y, starts) / nobs
+    sst = np.add.reduceat((y - ybar[gcodes]) ** 2, starts)
+    dof = nobs - k - absorbed
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if cov == 'nonrobust':
+            vcov = bread * (ssr / dof)[:, None, None]
+            t_dof = dof
+        elif cov == 'HC1':
+            meat = _group_gram(X, starts, resid ** 2)
+            vcov = bread @ meat @ bread * (nobs / dof)[:, None, None]
+            t_dof = dof
+        elif cov == 'cluster':
+            if clusters is None:
+                raise ValueError("cov='cluster' requires clusters")
+            # Score sums per (group, cluster) cell, then outer products per group
+            ccodes = pd.factorize(pd.MultiIndex.from_arrays([gcodes, clusters]))[0]
+            cell_order = np.argsort(ccodes, kind='stable')
+            cell_starts = np.flatnonzero(np.r_[True, np.diff(ccodes[cell_order]) != 0])
+            scores = np.add.reduceat((X * resid[:, None])[cell_order], cell_starts, axis=0)
+            cell_group = gcodes[cell_order][cell_starts]
+            n_clusters = np.bincount(cell_group, minlength=len(starts))
+            meat = np.zeros_like(XtX)
+            np.add.at(meat, cell_group, np.einsum('ci,cj->cij', scores, scores))
+            scale = n_clusters / (n_clusters - 1) * (nobs - 1) / dof
+            vcov = bread @ meat @ bread * scale[:, None, None]
+            t_dof = n_clusters - 1
+        else:
+            raise ValueError(f"Unknown cov type '{cov}'")
+
+        se = np.sqrt(np.einsum('gii->gi', vcov))
+        t = beta / se
+        p = 2 * stats.t.sf(np.abs(t), t_dof[:, None])
+        r2 = 1 - ssr / sst
+
+    # Rank-deficient groups (e.g. a city with one year) get no estimates
+    beta[~full_rank] = np.nan
+    se[~full_rank] = np.nan
+    t[~full_rank] = np.nan
+    p[~full_rank] = np.nan
+    vcov[~full_rank] = np.nan
+    n_groups = len(starts)
+    table = pd.DataFrame({
+        'group': np.repeat(labels[gcodes[starts]], k),
+        'term': np.tile(list(names), n_groups),
+        'coef': beta.ravel(),
+        'se': se.ravel(),
+        't': t.ravel(),
+        'p_value': p.ravel(),
+        'r2': np.repeat(r2, k),
+        'nobs': np.repeat(nobs, k),
+    })
+    return (table, vcov) if return_vcov else table
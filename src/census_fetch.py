@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+import numpy as np
+import pandas as pd
+
+from region_index import CENSUS_GEO_COL
+from tracing import traced
+
+# Concurrent fetcher for Census Population Estimates (PEP) metro data.
+# Every (vintage, dataset) request runs on a bounded thread pool sharing one
+# pooled requests.Session. Transient failures (connection errors, 429, 5xx)
+# are retried with exponential backoff and jitter. Successful responses are
+# cached per request URL. Each vintage's period codes or per-year columns are
+# mapped to calendar years, and all vintages are combined into one
+# (CBSA, Year) table where the newest vintage wins.
+CENSUS_API = os.environ.get("CENSUS_API_URL", "https://api.census.gov/data")
+CENSUS_API_KEY = os.environ.get("CENSUS_API_KEY")
+CACHE_DIR = os.path.join(os.environ.get("ZHVI_CACHE_DIR", "data/cache"), "census")
+GEO = f"{CENSUS_GEO_COL}:*"
+
+MAX_WORKERS = 4
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+TIMEOUT = 60
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+COMPONENTS = ["NETMIG", "RNETMIG", "DOMESTICMIG", "INTERNATIONALMIG"]
+VARIABLES = COMPONENTS + ["POP"]
+
+# Long vintages return one row per period code; wide vintages return one
+# column per year (e.g. RNETMIG2022), named by `columns`.
+VINTAGES = [
+    {'vintage': 2019, 'dataset': 'pep/components', 'period_col': 'PERIOD_CODE',
+     'variables': COMPONENTS, 'periods': {code: 2008 + code for code in range(3, 12)}},
+    {'vintage': 2019, 'dataset': 'pep/population', 'period_col': 'DATE_CODE',
+     'variables': ['POP'], 'periods': {code: 2007 + code for code in range(3, 13)}},
+    {'vintage': 2024, 'dataset': 'pep/population', 'years': list(range(2020, 2025)),
+     'columns': {'POP': 'POP_{year}', 'NETMIG': 'NETMIG{year}', 'RNETMIG': 'RNETMIG{year}',
+                 'DOMESTICMIG': 'DOMESTICMIG{year}', 'INTERNATIONALMIG': 'INTERNATIONALMIG{year}'}},
+]
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class CensusFetchError(RuntimeError):
+    pass
+
+
+def redact(text):
+    """Masks the API key in a URL or in an error message quoting one."""
+    return re.sub(r"([?&]key=)[^&\s'\"):]*", r"\1REDACTED", str(text))
+
+
+def get_session():
+    """Process-wide requests.Session with a connection pool sized for MAX_WORKERS."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def request_url(spec, base=None):
+    if 'periods' in spec:
+        fields = ["NAME"] + spec['variables'] + [spec['period_col']]
+    else:
+        fields = ["NAME"] + [tpl.format(year=y) for tpl in spec['columns'].values() for y in spec['years']]
+    params = {"get": ",".join(fields), "for": GEO}
+    if CENSUS_API_KEY:
+        params["key"] = CENSUS_API_KEY
+    return f"{base or CENSUS_API}/{spec['vintage']}/{spec['dataset']}?{urlencode(params)}"
+
+
+def _cache_path(url, cache_dir):
+    return os.path.join(cache_dir, hashlib.sha256(url.encode()).hexdigest() + ".json")
+
+
+def fetch_json(url, cache_dir=None, refresh=False, retries=MAX_RETRIES):
+    """
+    GET `url` and return the decoded JSON. Transient errors are retried with
+    exponential backoff. Responses are cached on disk with no expiry, since
+    published vintages rarely change; `refresh` refetches and overwrites the
+    cached copy (e.g. after the Census Bureau republishes a vintage).
+    """
+    import requests
+    cache_dir = cache_dir or CACHE_DIR
+    path = _cache_path(url, cache_dir)
+    if not refresh and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+
+    session = get_session()
+    for attempt in range(retries + 1):
+        try:
+            r = session.get(url, timeout=TIMEOUT)
+            if r.status_code not in RETRY_STATUS:
+                if r.status_code >= 400:
+                    raise CensusFetchError(f"{redact(url)}: HTTP {r.status_code}")
+                data = r.json()
+                break
+            error = f"HTTP {r.status_code}"
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = redact(e)
+        if attempt == retries:
+            raise CensusFetchError(f"{redact(url)}: giving up after {retries + 1} attempts ({error})")
+        delay = BACKOFF_BASE * 2 ** attempt * (1 + random.random())
+        print(f"Retrying Census request in {delay:.1f}s ({error})")
+        time.sleep(delay)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+    return data
+
+
+def period_table(specs=VINTAGES):
+    """Vintage/dataset/period code -> calendar year, for every long-format vintage."""
+    rows = [
+        (s['vintage'], s['dataset'], s['period_col'], code, year)
+        for s in specs if 'periods' in s
+        for code, year in s['periods'].items()
+    ]
+    return pd.DataFrame(rows, columns=['Vintage', 'Dataset', 'PeriodCol', 'Code', 'Year'])
+
+
+def normalize_response(data, spec):
+    """Turns one API response into long (CBSA, NAME, Year, Vintage, <variables>) rows."""
+    df = pd.DataFrame(data[1:], columns=data[0])
+    df['CBSA'] = pd.to_numeric(df[CENSUS_GEO_COL], errors='coerce')
+    if 'periods' in spec:
+        code = pd.to_numeric(df[spec['period_col']], errors='coerce')
+        years = period_table([spec])
+        df = df.assign(Code=code).merge(years[['Code', 'Year']], on='Code', how='inner')
+        out = df[['CBSA', 'NAME', 'Year']].copy()
+        for var in spec['variables']:
+            out[var] = pd.to_numeric(df[var], errors='coerce')
+    else:
+        # Wide vintage: stack the per-year columns into rows
+        n = len(df)
+        years = spec['years']
+        out = pd.DataFrame({
+            'CBSA': np.tile(df['CBSA'].to_numpy(), len(years)),
+            'NAME': np.tile(df['NAME'].to_numpy(), len(years)),
+            'Year': np.repeat(years, n),
+        })
+        for var, tpl in spec['columns'].items():
+            cols = [tpl.format(year=y) for y in years]
+            out[var] = pd.to_numeric(pd.Series(df[cols].to_numpy().T.ravel()), errors='coerce').to_numpy()
+    out['Vintage'] = spec['vintage']
+    return out
+
+
+def combine_vintages(frames):
+    """
+    One row per (CBSA, Year). Each variable is taken from the newest vintage
+    that reports it, because later vintages revise earlier estimates.
+    """
+    df = pd.concat(frames, ignore_index=True).sort_values('Vintage', ascending=False, kind='stable')
+    combined = df.groupby(['CBSA', 'Year'], sort=True).first().reset_index()
+    cols = ['CBSA', 'NAME', 'Year', 'Vintage'] + [v for v in VARIABLES if v in combined.columns]
+    return combined[cols]
+
+
+@traced()
+def fetch_census_history(specs=VINTAGES, workers=MAX_WORKERS, base=None, cache_dir=None, refresh=False):
+    """
+    Fetches every vintage concurrently and returns the combined
+    (CBSA, NAME, Year, Vintage, NETMIG, RNETMIG, DOMESTICMIG, INTERNATIONALMIG, POP)
+    table. Vintages that still fail after retries are reported and skipped.
+    """
+    urls = [request_url(s, base) for s in specs]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(fetch_json, url, cache_dir, refresh) for url in urls]
+        frames = []
+        for spec, future in zip(specs, futures):
+            try:
+                frames.append(normalize_response(future.result(), spec))
+            except (CensusFetchError, ValueError, KeyError) as e:
+                print(f"Warning: skipping vintage {spec['vintage']} {spec['dataset']}: {e}")
+    if not frames:
+        raise CensusFetchError("No Census vintage could be fetched")
+    return combine_vintages(frames)
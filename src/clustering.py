@@ -0,0 +1,166 @@
+import numpy as np
+
+from tracing import traced
+
+# Vectorized clustering for cohort discovery: k-means (k-means++ seeding,
+# Lloyd iterations as whole-matrix distance/argmin passes), mini-batch k-means
+# for ZIP-scale inputs, and Ward agglomerative clustering. Ward keeps an
+# n x n cost matrix, so above WARD_MAX_POINTS it is run on k-means
+# micro-clusters (weighted by their sizes) instead of the raw points.
+WARD_MAX_POINTS = 4000
+ASSIGN_ROWS = 1 << 16  # rows per distance block when labelling large inputs
+
+
+def sq_distances(X, centers):
+    """Squared Euclidean distances (n x k), clipped at zero."""
+    d = (X ** 2).sum(axis=1)[:, None] - 2 * X @ centers.T + (centers ** 2).sum(axis=1)[None, :]
+    return np.maximum(d, 0)
+
+
+def assign(X, centers):
+    """Nearest center and its squared distance for every row, in bounded blocks."""
+    labels = np.empty(len(X), dtype=np.int64)
+    dist = np.empty(len(X))
+    for i in range(0, len(X), ASSIGN_ROWS):
+        d = sq_distances(X[i:i + ASSIGN_ROWS], centers)
+        labels[i:i + ASSIGN_ROWS] = d.argmin(axis=1)
+        dist[i:i + ASSIGN_ROWS] = d[np.arange(len(d)), labels[i:i + ASSIGN_ROWS]]
+    return labels, dist
+
+
+def centroids(X, labels, k, weights=None):
+    """Per-cluster (weighted) means and total weights; empty clusters get NaN."""
+    w = np.ones(len(X)) if weights is None else weights
+    totals = np.bincount(labels, weights=w, minlength=k)
+    sums = np.stack([np.bincount(labels, weights=w * X[:, j], minlength=k) for j in range(X.shape[1])], axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / totals[:, None], totals
+
+
+def kmeans_plusplus(X, k, rng, weights=None):
+    """k-means++ seeding (D^2 sampling)."""
+    w = np.ones(len(X)) if weights is None else weights
+    centers = [X[rng.choice(len(X), p=w / w.sum())]]
+    closest = sq_distances(X, centers[0][None, :])[:, 0]
+    for _ in range(1, k):
+        p = w * closest
+        idx = rng.choice(len(X), p=p / p.sum()) if p.sum() > 0 else rng.integers(len(X))
+        centers.append(X[idx])
+        closest = np.minimum(closest, sq_distances(X, X[idx][None, :])[:, 0])
+    return np.array(centers)
+
+
+@traced()
+def kmeans(X, k, n_init=8, max_iter=300, tol=1e-8, seed=0, weights=None):
+    """
+    Lloyd's k-means, best of `n_init` k-means++ starts.
+    Returns (labels, centers, inertia).
+    """
+    X = np.asarray(X, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    w = np.ones(len(X)) if weights is None else np.asarray(weights, dtype=np.float64)
+    best = None
+    for _ in range(n_init):
+        centers = kmeans_plusplus(X, k, rng, w)
+        for _ in range(max_iter):
+            labels, dist = assign(X, centers)
+            new, totals = centroids(X, labels, k, w)
+            empty = totals == 0
+            if empty.any():
+                # Re-seed empty clusters at the worst-fit points
+                new[empty] = X[np.argsort(dist * w)[::-1][:empty.sum()]]
+            shift = np.abs(new - centers).max()
+            centers = new
+            if shift < tol:
+                break
+        labels, dist = assign(X, centers)
+        inertia = float((dist * w).sum())
+        if best is None or inertia < best[2]:
+            best = (labels, centers, inertia)
+    return best
+
+
+@traced()
+def minibatch_kmeans(X, k, batch_size=4096, n_iter=200, seed=0):
+    """
+    Mini-batch k-means (Sculley 2010) with per-center learning rates 1/count;
+    each batch is assigned and folded into the centers in one vectorized step.
+    Returns (labels, centers, inertia).
+    """
+    X = np.asarray(X, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    init = rng.choice(len(X), size=min(len(X), max(10 * k, batch_size)), replace=False)
+    centers = kmeans_plusplus(X[init], k, rng)
+    counts = np.zeros(k)
+    for _ in range(n_iter):
+        batch = X[rng.integers(0, len(X), size=min(batch_size, len(X)))]
+        labels, _ = assign(batch, centers)
+        means, n = centroids(batch, labels, k)
+        hit = n > 0
+        counts[hit] += n[hit]
+        # Running mean: every center moves toward its batch mean by n / total count
+        centers[hit] += (n[hit] / counts[hit])[:, None] * (means[hit] - centers[hit])
+    labels, dist = assign(X, centers)
+    return labels, centers, float(dist.sum())
+
+
+@traced()
+def ward(X, k, weights=None):
+    """
+    Ward agglomerative clustering cut at `k` clusters. `weights` are point
+    multiplicities (e.g. micro-cluster sizes). Returns (labels, centers, inertia).
+    """
+    X = np.asarray(X, dtype=np.float64)
+    n = len(X)
+    if n > WARD_MAX_POINTS:
+        raise ValueError(f"ward() on {n} points needs an {n} x {n} matrix; use ward_large()")
+    sizes = np.ones(n) if weights is None else np.asarray(weights, dtype=np.float64).copy()
+    cents = X.copy()
+    members = np.arange(n)
+    active = np.ones(n, dtype=bool)
+    # Ward merge cost: n_i n_j / (n_i + n_j) * ||c_i - c_j||^2
+    cost = sizes[:, None] * sizes[None, :] / (sizes[:, None] + sizes[None, :]) * sq_distances(X, X)
+    np.fill_diagonal(cost, np.inf)
+    for _ in range(n - k):
+        i, j = divmod(int(cost.argmin()), n)
+        # Merge j into i
+        total = sizes[i] + sizes[j]
+        cents[i] = (sizes[i] * cents[i] + sizes[j] * cents[j]) / total
+        sizes[i] = total
+        active[j] = False
+        members[members == j] = i
+        row = sizes[i] * sizes / (sizes[i] + sizes) * sq_distances(cents, cents[i][None, :])[:, 0]
+        row[~active] = np.inf
+        row[i] = np.inf
+        cost[i], cost[:, i] = row, row
+        cost[j], cost[:, j] = np.inf, np.inf
+    _, labels = np.unique(members, return_inverse=True)
+    centers, _ = centroids(X, labels, k, weights)
+    _, dist = assign(X, centers)
+    w = np.ones(n) if weights is None else weights
+    return labels, centers, float((dist * w).sum())
+
+
+def ward_large(X, k, n_micro=1000, seed=0):
+    """Ward on k-means micro-clusters, for inputs too large for ward()."""
+    micro, _, _ = minibatch_kmeans(X, n_micro, seed=seed)
+    centers, sizes = centroids(X, micro, n_micro)
+    used = sizes > 0
+    macro, _, _ = ward(centers[used], k, weights=sizes[used])
+    lookup = np.full(n_micro, -1)
+    lookup[np.flatnonzero(used)] = macro
+    labels = lookup[micro]
+    centers, _ = centroids(X, labels, k)
+    _, dist = assign(X, centers)
+    return labels, centers, float(dist.sum())
+
+
+def cluster(X, k, method='kmeans', seed=0):
+    """Dispatches to kmeans / minibatch / ward (falling back to micro-cluster Ward for large inputs)."""
+    if method == 'kmeans':
+        return kmeans(X, k, seed=seed)
+    if method == 'minibatch':
+        return minibatch_kmeans(X, k, seed=seed)
+    if method == 'ward':
+        return ward(X, k) if len(X) <= WARD_MAX_POINTS else ward_large(X, k, seed=seed)
+    raise ValueError(f"Unknown clustering method '{method}'")
@@ -0,0 +1,222 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from zhvi_loader import fetch_data
+from cohorts import DATA_URL, COHORTS
+from region_index import get_index, resolve_cohorts
+from panel import Panel
+from normalize import pct_change_from_baseline, aggregate_cohorts
+from fetch_migration_history import ALL_METROS_CSV
+from clustering import cluster
+from render import Chart, render
+import tracing
+from tracing import traced
+
+# Data-driven cohorts.
+# Every metro (or ZIP) is described by its pre-2020 log growth path, sampled
+# quarterly and indexed to the first month, plus Census net-migration features
+# (mean 2011-2019 rate and its late-minus-early change) when the all-metro
+# migration table exists. Metros are clustered with k-means, mini-batch k-means
+# or Ward, and the clusters are written as a {cohort: [RegionName, ...]} file
+# with the same shape as COHORTS. Point ZHVI_COHORTS at it to run any analysis
+# on the discovered groups.
+PRE_START = '2010-01'
+PRE_END = '2019-12'
+STEP_MONTHS = 3
+OUTPUT_JSON = "data/discovered_cohorts.json"
+
+
+def growth_features(panel, start=PRE_START, end=PRE_END, step=STEP_MONTHS):
+    """
+    Cumulative log growth since `start`, every `step` months through `end`,
+    for regions with a complete pre-period (interior gaps interpolated).
+    Returns (features, kept row mask).
+    """
+    panel = panel.window(start=start, end=end)
+    values = pd.DataFrame(panel.values).interpolate(axis=1, limit_area='inside').to_numpy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        logs = np.log(values)
+    path = logs[:, step - 1::step] - logs[:, :1]
+    complete = np.isfinite(path).all(axis=1) & np.isfinite(logs[:, 0])
+    return path[complete], complete
+
+
+def migration_features(names, path=ALL_METROS_CSV):
+    """
+    Mean net migration rate and its 2017-19 minus 2011-13 change per region,
+    joined on CBSA code. Returns an (n x 2) array (NaN where unmatched), or
+    None when the migration table has not been fetched.
+    """
+    if not os.path.exists(path):
+        return None
+    mig = pd.read_csv(path)
+    census = mig.drop_duplicates('CBSA')
+    index = get_index().extended(census['NAME'], census['CBSA'])
+    by_cbsa = mig.assign(
+        early=mig['RNETMIG'].where(mig['Year'] <= 2013),
+        late=mig['RNETMIG'].where(mig['Year'] >= 2017),
+    ).groupby('CBSA').agg(mean_rate=('RNETMIG', 'mean'), early=('early', 'mean'), late=('late', 'mean'))
+    by_cbsa['shift'] = by_cbsa['late'] - by_cbsa['early']
+    codes = pd.Series(index.codes(names))
+    return by_cbsa[['mean_rate', 'shift']].reindex(codes).to_numpy()
+
+
+def standardize(block):
+    """
+    Centers columns and scales the whole block to unit total variance, so the
+    relative shape of a growth path is kept and every block weighs the same.
+    """
+    block = block - np.nanmean(block, axis=0)
+    scale = np.sqrt(np.nanmean(np.nansum(block ** 2, axis=1)))
+    return block / scale if scale > 0 else block
+
+
+@traced()
+def build_features(panel, migration_weight=1.0, start=PRE_START, end=PRE_END, migration_path=ALL_METROS_CSV):
+    """Feature matrix, region names and growth paths for every clusterable region."""
+    path, keep = growth_features(panel, start, end)
+    names = panel.region_names[keep]
+    if 'Metro' in panel.meta.columns:
+        # ZIP-level files: migration is a metro attribute
+        lookup_names = np.asarray(panel.meta['Metro'], dtype=object)[keep]
+    else:
+        lookup_names = names
+    blocks = [standardize(path)]
+    mig = migration_features(lookup_names, migration_path)
+    if mig is not None:
+        matched = ~np.isnan(mig).any(axis=1)
+        print(f"Migration features matched for {matched.sum()} of {len(names)} regions")
+        # A constant column (e.g. no late-minus-early shift anywhere) centers to zero instead of NaN
+        std = np.nanstd(mig, axis=0)
+        mig = (mig - np.nanmean(mig, axis=0)) / np.where(std > 0, std, 1)
+        # Unmatched regions sit at the mean, so they are grouped on growth alone
+        mig[~matched] = 0
+        blocks.append(migration_weight * standardize(mig))
+    else:
+        print(f"No migration table at {migration_path}; clustering on growth paths only "
+              f"(run fetch_migration_history.py --all-metros)")
+    return np.column_stack(blocks), names, path, mig
+
+
+@traced()
+def discover_cohorts(panel, k=3, method='kmeans', migration_weight=1.0, seed=0, migration_path=ALL_METROS_CSV):
+    """
+    Clusters every region and names the clusters by pre-period growth (highest
+    first). Returns ({cohort: [RegionName, ...]}, per-region frame).
+    """
+    X, names, path, mig = build_features(panel, migration_weight, migration_path=migration_path)
+    if len(X) < k:
+        raise ValueError(f"Only {len(X)} regions with a complete pre-period; cannot form {k} clusters")
+    labels, _, inertia = cluster(X, k, method=method, seed=seed)
+    growth = np.expm1(path[:, -1]) * 100
+    mean_growth = np.array([growth[labels == c].mean() for c in range(k)])
+    order = np.argsort(-mean_growth)
+    names_by_rank = {c: f"Cluster {rank + 1}: {mean_growth[c]:+.0f}% pre-2020 growth"
+                     for rank, c in enumerate(order)}
+    print(f"{method} k={k}: {len(X)} regions, inertia {inertia:.1f}")
+
+    df = pd.DataFrame({'RegionName': names, 'Cohort': [names_by_rank[c] for c in labels],
+                       'PreGrowth': growth})
+    if mig is not None:
+        df['MigrationZ'], df['MigrationShiftZ'] = mig[:, 0], mig[:, 1]
+    cohorts = {names_by_rank[c]: list(names[labels == c]) for c in order}
+    return cohorts, df
+
+
+def compare_with_hand_cohorts(df, available_regions):
+    """Counts of each hand-written cohort's metros across the discovered clusters."""
+    hand = resolve_cohorts(COHORTS, available_regions)
+    region_cohort = {city: cohort for cohort, cities in hand.items() for city in cities}
+    labelled = df.assign(HandCohort=df['RegionName'].map(region_cohort)).dropna(subset=['HandCohort'])
+    return pd.crosstab(labelled['HandCohort'], labelled['Cohort'])
+
+
+def format_report(cohorts, df, crosstab, method, k):
+    text = f"""
+    DATA-DRIVEN COHORTS ({method}, k={k})
+    =================================
+    Features: quarterly log growth path {PRE_START} to {PRE_END}{' + net migration' if 'MigrationZ' in df else ''}
+    """
+    for name, regions in cohorts.items():
+        sub = df[df['Cohort'] == name]
+        text += f"\n    {name}:\n      - {len(regions)} regions, growth range {sub['PreGrowth'].min():.0f}% to {sub['PreGrowth'].max():.0f}%"
+        if 'MigrationZ' in sub:
+            text += f"\n      - Mean net migration (z): {sub['MigrationZ'].mean():+.2f}"
+        text += f"\n      - e.g. {'; '.join(sub.nlargest(5, 'PreGrowth')['RegionName'])}\n"
+    text += "\n    Hand-written cohorts by discovered cluster:\n"
+    text += "\n".join("    " + line for line in crosstab.to_string().splitlines()) + "\n"
+    return text
+
+
+def draw_discovered(fig, df_agg, style):
+    ax = fig.subplots()
+    for cohort, n in style['sizes'].items():
+        s = df_agg[df_agg['Cohort'] == cohort]
+        line, = ax.plot(s['Date'], s['mean'], label=f"{cohort} (n={n})", linewidth=2.5)
+        ax.fill_between(s['Date'], s['min'], s['max'], color=line.get_color(), alpha=0.1)
+    ax.set_title(f'Discovered Cohorts: Pre-Period Housing Growth ({PRE_START[:4]}-{PRE_END[:4]})')
+    ax.set_ylabel(f'Cumulative % Change (Baseline: {style["baseline"]})')
+    ax.set_xlabel('Year')
+    ax.legend()
+    ax.grid(True, alpha=0.3)
+    fig.tight_layout()
+
+
+@traced()
+def plot_discovered(panel, cohorts, path='output/discovered_cohorts.png'):
+    sub = panel.window(start=PRE_START, end=PRE_END)
+    lookup = {r: c for c, regions in cohorts.items() for r in regions}
+    labels = pd.Categorical([lookup.get(r) for r in sub.region_names], categories=list(cohorts))
+    pct = pct_change_from_baseline(sub.values, sub.dates, sub.dates[0])
+    df_agg = aggregate_cohorts(pct, labels, sub.dates)
+    style = {'sizes': {c: len(regions) for c, regions in cohorts.items()},
+             'baseline': sub.dates[0].strftime("%b %Y")}
+    render(Chart(path, draw_discovered, df_agg, style))
+
+
+def load_panel(url=DATA_URL):
+    df = fetch_data(url, start=f"{PRE_START}-01")
+    if 'RegionType' in df.columns:
+        df = df[df['RegionType'] != 'country']
+    return Panel.from_wide(df)
+
+
+def main(k=3, method='kmeans', migration_weight=1.0, seed=0, url=DATA_URL, output=OUTPUT_JSON, plots=True):
+    panel = load_panel(url)
+    print(panel.report())
+    cohorts, df = discover_cohorts(panel, k, method, migration_weight, seed)
+    with open(output, 'w') as f:
+        json.dump(cohorts, f, indent=1)
+    df.to_csv('output/discovered_cohorts.csv', index=False)
+    print(f"Cohorts saved to {output} (run any analysis with ZHVI_COHORTS={output})")
+
+    crosstab = compare_with_hand_cohorts(df, panel.region_names)
+    text = format_report(cohorts, df, crosstab, method, k)
+    with open('output/cohort_discovery.txt', 'w') as f:
+        f.write(text)
+    print("Report saved to output/cohort_discovery.txt")
+    print(text)
+    if plots:
+        plot_discovered(panel, cohorts)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cluster every metro into data-driven cohorts.")
+    parser.add_argument('--k', type=int, default=3, help="Number of cohorts")
+    parser.add_argument('--method', choices=['kmeans', 'minibatch', 'ward'], default='kmeans')
+    parser.add_argument('--migration-weight', type=float, default=1.0,
+                        help="Weight of the migration features relative to the growth path")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--url', default=DATA_URL, help="ZHVI file to cluster (e.g. a Zip_zhvi_* URL)")
+    parser.add_argument('--output', default=OUTPUT_JSON)
+    parser.add_argument('--no-plots', action='store_true',
+                        help="Write the cohorts and report only; never imports matplotlib")
+    parser.add_argument('--trace', action='store_true',
+                        help="Record per-stage wall/CPU time and memory to output/trace_cohort_discovery.json")
+    args = parser.parse_args()
+    tracing.enable(args.trace or tracing.ENABLED)
+    main(args.k, args.method, args.migration_weight, args.seed, args.url, args.output, plots=not args.no_plots)
+    tracing.finish('output/trace_cohort_discovery.json')
@@ -0,0 +1,34 @@
+import json
+import os
+
+# Shared definitions for the ZHVI analyses.
+# Kept free of plotting/modelling imports so any script (or worker process)
+# can pull in the cohort lists without paying for matplotlib or statsmodels.
+DATA_URL = "https://files.zillowstatic.com/research/public_csvs/zhvi/Metro_zhvi_uc_sfrcondo_tier_0.33_0.67_sm_sa_month.csv"
+
+COHORTS = {
+    "Cohort A: Wealth Exporters (The Core)": [
+        "San Francisco, CA", "New York, NY", "San Jose, CA", "Boston, MA",
+        "Los Angeles, CA", "Washington, DC", 
+        "Seattle, WA", "Chicago, IL"
+    ],
+    "Cohort B: Major Sunbelt Hubs (Urban Importers)": [
+        "Austin, TX", "Phoenix, AZ", "Miami, FL", "Tampa, FL",
+        "Dallas, TX", "Atlanta, GA", "Nashville, TN", 
+        "Las Vegas, NV", "Charlotte, NC"
+    ],
+    "Cohort C: Nature Enclaves (Scenic Importers)": [
+        "Bozeman, MT", "Bend, OR", "Coeur d'Alene, ID", "Asheville, NC",
+        "Reno, NV", "Spokane, WA", "Portland, ME", "Knoxville, TN"
+    ]
+}
+
+
+def load_cohorts(path):
+    """{cohort: [RegionName, ...]} from a JSON file (e.g. written by cohort_discovery.py)."""
+    with open(path) as f:
+        return json.load(f)
+
+# ZHVI_COHORTS swaps the hand-written groups for another cohort file in every analysis
+if os.environ.get("ZHVI_COHORTS"):
+    COHORTS = load_cohorts(os.environ["ZHVI_COHORTS"])
@@ -0,0 +1,190 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from zhvi_loader import fetch_data
+from cohorts import DATA_URL, COHORTS
+from region_index import resolve_cohorts
+from panel import Panel
+from batch_ols import batched_ols, within_transform
+from render import Chart, render
+import tracing
+from tracing import traced
+
+# Two-way fixed-effects event study over the full ZHVI panel.
+# y = 100 * log(ZHVI) for every metro-month, with region and month fixed
+# effects and cohort x event-year interactions:
+#   y_rt = a_r + d_t + sum_{g, k != -1} b_gk * [cohort(r) = g] * [year_t = k] + e_rt
+# Event years are 12-month bins relative to EVENT_MONTH (k = -1 is Mar 2019 -
+# Feb 2020, the reference). Metros outside COHORTS are the comparison group.
+# Both fixed effects are swept out by alternating demeaning
+# (batch_ols.within_transform), so no dummy matrices are built. SEs are
+# clustered by metro. The leads (k <= -2) are tested jointly for pre-trends.
+EVENT_MONTH = pd.Period('2020-03', freq='M')
+REFERENCE_YEAR = -1
+DEFAULT_START = '2014-03'
+
+
+def event_years(periods, event=EVENT_MONTH):
+    """12-month bins relative to the event month (0 = event month + 11)."""
+    rel = (periods.asi8 - event.ordinal)
+    return np.floor_divide(rel, 12)
+
+
+@traced()
+def build_design(panel, event=EVENT_MONTH, reference=REFERENCE_YEAR):
+    """
+    Long estimation sample from the wide panel: y, region/month codes and the
+    cohort x event-year indicator matrix. Returns (y, X, names, region, month).
+    """
+    n_regions, n_months = panel.values.shape
+    region, month = np.nonzero(panel.mask)
+    y = 100 * np.log(panel.values[region, month].astype(np.float64))
+
+    years = event_years(panel.periods, event)
+    bins = [k for k in np.unique(years) if k != reference]
+    cohort_codes = panel.cohorts.codes
+    labels = list(panel.cohorts.categories)
+
+    X = np.zeros((len(y), len(labels) * len(bins)))
+    names = []
+    obs_cohort, obs_year = cohort_codes[region], years[month]
+    for g, label in enumerate(labels):
+        in_cohort = obs_cohort == g
+        for j, k in enumerate(bins):
+            X[:, g * len(bins) + j] = in_cohort & (obs_year == k)
+            names.append((label, int(k)))
+    # Interactions with no observations (e.g. a cohort missing from the data) are dropped
+    keep = X.any(axis=0)
+    return y, X[:, keep], [n for n, k in zip(names, keep) if k], region, month
+
+
+@traced()
+def fit_event_study(panel, event=EVENT_MONTH, reference=REFERENCE_YEAR, tol=1e-8):
+    """
+    Estimates the event study. Returns (coefficients frame, vcov, names) where
+    the frame has Cohort, EventYear, coef, se, t, p_value, ci_low, ci_high.
+    """
+    y, X, names, region, month = build_design(panel, event, reference)
+    Z = within_transform(np.column_stack([y, X]), [region, month], tol=tol)
+    absorbed = (region.max() + 1) + (month.max() + 1) - 1
+    terms = [f"{c}|{k}" for c, k in names]
+    table, vcov = batched_ols(Z[:, 0], Z[:, 1:], terms, cov='cluster', clusters=region,
+                              absorbed=absorbed, return_vcov=True)
+    table['Cohort'] = [c for c, _ in names]
+    table['EventYear'] = [k for _, k in names]
+    table['ci_low'] = table['coef'] - 1.96 * table['se']
+    table['ci_high'] = table['coef'] + 1.96 * table['se']
+    cols = ['Cohort', 'EventYear', 'coef', 'se', 't', 'p_value', 'ci_low', 'ci_high', 'nobs']
+    return table[cols], vcov[0], names
+
+
+def wald_test(coef, vcov, n_clusters):
+    """Joint H0: all coef = 0. Returns (chi2 stat, chi2 p, F stat, F p with (q, G-1) dof)."""
+    from scipy import stats
+    q = len(coef)
+    chi2 = float(coef @ np.linalg.pinv(vcov) @ coef)
+    f = chi2 / q
+    return chi2, stats.chi2.sf(chi2, q), f, stats.f.sf(f, q, n_clusters - 1)
+
+
+def pretrend_tests(table, vcov, names, n_clusters, reference=REFERENCE_YEAR):
+    """Joint lead (pre-event) tests per cohort and across all cohorts."""
+    lead = np.array([k < reference for _, k in names])
+    coef = table['coef'].to_numpy()
+    rows = []
+    groups = [(c, lead & (table['Cohort'] == c).to_numpy()) for c in table['Cohort'].unique()]
+    groups.append(('All cohorts', lead))
+    for label, sel in groups:
+        if not sel.any():
+            continue
+        chi2, p_chi2, f, p_f = wald_test(coef[sel], vcov[np.ix_(sel, sel)], n_clusters)
+        rows.append({'Cohort': label, 'leads': int(sel.sum()), 'chi2': chi2, 'p_chi2': p_chi2, 'F': f, 'p_F': p_f})
+    return pd.DataFrame(rows)
+
+
+def format_tests(df_tests, table, n_regions, n_months):
+    text = f"""
+    EVENT STUDY PRE-TREND TEST
+    ==========================
+    Two-way FE (metro, month), cohort x event-year leads/lags, SEs clustered by metro
+    Event: {EVENT_MONTH.strftime('%b %Y')}, reference year {REFERENCE_YEAR}; {n_regions} metros x {n_months} months, {int(table['nobs'].iloc[0])} obs
+    H0: all pre-event lead coefficients are zero
+    """
+    for r in df_tests.itertuples():
+        text += (f"\n    {r.Cohort}:\n      - {r.leads} leads, Wald chi2 = {r.chi2:.2f} (p = {r.p_chi2:.4f}),"
+                 f" F = {r.F:.2f} (p = {r.p_F:.4f})\n")
+    return text
+
+
+def draw_event_study(fig, table, style):
+    ax = fig.subplots()
+    colors = style['colors']
+    cohorts = list(table['Cohort'].unique())
+    width = 0.8 / max(1, len(cohorts))
+    for i, cohort in enumerate(cohorts):
+        sub = table[table['Cohort'] == cohort]
+        # Add the reference year at zero so the break is visible
+        x = np.r_[sub['EventYear'], REFERENCE_YEAR]
+        order = np.argsort(x)
+        y = np.r_[sub['coef'], 0.0][order]
+        err = np.r_[sub['coef'] - sub['ci_low'], 0.0][order]
+        offset = (i - (len(cohorts) - 1) / 2) * width
+        ax.errorbar(x[order] + offset, y, yerr=err, fmt='o-', capsize=3, label=cohort,
+                    color=colors[i % len(colors)])
+    ax.axhline(0, color='black', linewidth=0.8)
+    ax.axvline(REFERENCE_YEAR + 0.5, color='red', linestyle=':', alpha=0.5)
+    ax.set_title(f'Event Study: Cohort x Event-Year Effects on log ZHVI (reference: year {REFERENCE_YEAR})')
+    ax.set_xlabel(f'Years Relative to {EVENT_MONTH.strftime("%b %Y")}')
+    ax.set_ylabel('Effect vs. Other Metros (log points x 100, 95% CI)')
+    ax.legend()
+    ax.grid(True, alpha=0.3)
+    fig.tight_layout()
+
+
+@traced()
+def plot_event_study(table, path='output/event_study.png'):
+    colors = ["tab:blue", "tab:orange", "tab:green", "tab:red", "tab:purple"]
+    data = table[['Cohort', 'EventYear', 'coef', 'ci_low']]
+    render(Chart(path, draw_event_study, data, {'colors': colors, 'figsize': (12, 7)}))
+
+
+def load_panel(start=DEFAULT_START):
+    """Every metro from `start`, with cohort labels (other metros unlabelled)."""
+    df = fetch_data(DATA_URL, start=f"{start}-01")
+    if 'RegionType' in df.columns:
+        # The national aggregate row is not a metro
+        df = df[df['RegionType'] != 'country']
+    cohort_map = resolve_cohorts(COHORTS, df['RegionName'].unique())
+    return Panel.from_wide(df, cohort_map)
+
+
+def main(start=DEFAULT_START, plots=True):
+    panel = load_panel(start)
+    print(panel.report())
+    table, vcov, names = fit_event_study(panel)
+    table.to_csv('output/event_study_coefficients.csv', index=False)
+    print("Coefficients saved to output/event_study_coefficients.csv")
+
+    n_regions = int(panel.mask.any(axis=1).sum())
+    df_tests = pretrend_tests(table, vcov, names, n_regions)
+    text = format_tests(df_tests, table, n_regions, len(panel.periods))
+    with open('output/event_study_pretrend_test.txt', 'w') as f:
+        f.write(text)
+    print("Pre-trend test saved to output/event_study_pretrend_test.txt")
+    print(text)
+    if plots:
+        plot_event_study(table)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Two-way fixed-effects event study with a joint pre-trend test.")
+    parser.add_argument('--start', default=DEFAULT_START, help="First month of the panel (YYYY-MM)")
+    parser.add_argument('--no-plots', action='store_true',
+                        help="Write the coefficients and test only; never imports matplotlib")
+    parser.add_argument('--trace', action='store_true',
+                        help="Record per-stage wall/CPU time and memory to output/trace_event_study.json")
+    args = parser.parse_args()
+    tracing.enable(args.trace or tracing.ENABLED)
+    main(args.start, plots=not args.no_plots)
+    tracing.finish('output/trace_event_study.json')
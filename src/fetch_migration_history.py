@@ -1,55 +1,76 @@
+import argparse
+from urllib.parse import urlencode
+import os
 import pandas as pd
-import matplotlib.pyplot as plt
-import requests
-import io
+from cohorts import COHORTS
+from region_index import get_index, CENSUS_GEO_COL
+from census_fetch import fetch_json, fetch_census_history, CensusFetchError
+from render import Chart, render, cohort_colors
+import tracing
+from tracing import traced
 
 # Census API Endpoint (Vintage 2019 Population Estimates - Components of Change)
 CENSUS_URL = "https://api.census.gov/data/2019/pep/components"
 
-# Cohorts (Same as Zoom Town Analysis)
-COHORTS = {
-    "Cohort A: Wealth Exporters (The Core)": [
-        "San Francisco", "New York", "San Jose", "Boston",
-        "Los Angeles", "Washington", "Seattle", "Chicago"
-    ],
-    "Cohort B: Major Sunbelt Hubs (Urban Importers)": [
-        "Austin", "Phoenix", "Miami", "Tampa",
-        "Dallas", "Atlanta", "Nashville", "Las Vegas", "Charlotte"
-    ],
-    "Cohort C: Nature Enclaves (Scenic Importers)": [
-        "Bozeman", "Bend", "Coeur d'Alene", "Asheville",
-        "Reno", "Spokane", "Portland", "Knoxville"
-    ]
-}
-
-def fetch_census_data():
+# All-metro output (every CBSA and migration component, 2011-2019)
+ALL_METROS_CSV = "data/migration_all_metros_2011_2019.csv"
+MIGRATION_VARIABLES = ["RNETMIG", "NETMIG", "DOMESTICMIG", "INTERNATIONALMIG"]
+
+# Multi-vintage history (all metros, 2011-2024, with population levels)
+HISTORY_CSV = "data/census_history_2011_2024.csv"
+
+# Cohort file (COHORTS metros only): Cohort, City, Year, NetMigrationRate
+MIGRATION_CSV = "data/migration_history_2011_2019.csv"
+
+@traced()
+def fetch_census_data(variables=("RNETMIG",), refresh=False):
     print("Fetching Census Data (Vintage 2019 Components)...")
     
     # Variables: NAME, RNETMIG (Net Migration Rate), PERIOD_CODE
     # PERIOD_CODE: 3=2011, ..., 11=2019
     params = {
-        "get": "NAME,RNETMIG,PERIOD_CODE",
+        "get": ",".join(["NAME", *variables, "PERIOD_CODE"]),
         "for": "metropolitan statistical area/micropolitan statistical area:*"
     }
     
+    # Pooled session, retries with backoff and an on-disk cache per request
     try:
-        r = requests.get(CENSUS_URL, params=params)
-        r.raise_for_status()
-        data = r.json()
-        
+        data = fetch_json(f"{CENSUS_URL}?{urlencode(params)}", refresh=refresh)
         headers = data[0]
         rows = data[1:]
         df = pd.DataFrame(rows, columns=headers)
         return df
-    except Exception as e:
+    except (CensusFetchError, ValueError) as e:
         print(f"Error fetching Census data: {e}")
         return pd.DataFrame()
 
-def process_data(df):
-    # Convert columns to numeric
-    df['RNETMIG'] = pd.to_numeric(df['RNETMIG'], errors='coerce')
-    df['PERIOD_CODE'] = pd.to_numeric(df['PERIOD_CODE'], errors='coerce')
-    print(f"Unique PERIOD_CODEs found: {sorted(df['PERIOD_CODE'].unique())}")
+def _to_float(col):
+    # Plain cast is ~2x faster than to_numeric; fall back for non-numeric markers
+    try:
+        return col.astype('float64')
+    except (ValueError, TypeError):
+        return pd.to_numeric(col, errors='coerce')
+
+def cohort_frame(index):
+    """(Cohort, City, CBSA) for every cohort city, in COHORTS order."""
+    rows = []
+    for cohort_name, cities in COHORTS.items():
+        for city in cities:
+            # Index lookup (e.g. "Bend, OR" -> Bend-Redmond, OR Metro Area)
+            rows.append((cohort_name, city, index.lookup(city)))
+    df = pd.DataFrame(rows, columns=['Cohort', 'City', 'CBSA'])
+    df['CBSA'] = df['CBSA'].astype('Int64')
+    return df
+
+@traced()
+def metro_table(df):
+    """
+    All metros and periods in one frame: CBSA, NAME, Year and every migration
+    variable returned by the API, labelled with Cohort/City for cohort metros.
+    """
+    variables = [v for v in MIGRATION_VARIABLES if v in df.columns]
+    period_code = pd.to_numeric(df['PERIOD_CODE'], errors='coerce')
+    print(f"Unique PERIOD_CODEs found: {sorted(period_code.dropna().astype(int).unique().tolist())}")
     
     # Filter for Years 2011-2019 (PERIOD_CODE 3-11)
     # Map: 3->2011, 4->2012, ..., 11->2019
@@ -58,94 +79,140 @@ def process_data(df):
         8: 2016, 9: 2017, 10: 2018, 11: 2019
     }
     
-    df = df[df['PERIOD_CODE'].isin(period_map.keys())].copy()
-    df['Year'] = df['PERIOD_CODE'].map(period_map)
+    keep = period_code.isin(period_map.keys())
+    df = df.loc[keep, ['NAME'] + variables + [c for c in [CENSUS_GEO_COL] if c in df.columns]].copy()
+    df['Year'] = period_code[keep].map(period_map).astype('int64')
+    # Convert the kept rows only (the API returns every value as a string)
+    for var in variables:
+        df[var] = _to_float(df[var])
     
-    # Filter and Assign Cohorts
-    cohort_data = []
+    # Resolve every Census row to its CBSA code once. The API returns the code
+    # in the geography column; fall back to the name index otherwise.
+    index = get_index()
+    if CENSUS_GEO_COL in df.columns:
+        df['CBSA'] = pd.to_numeric(df[CENSUS_GEO_COL], errors='coerce')
+        names = df.drop_duplicates('CBSA')
+        index = index.extended(names['NAME'], names['CBSA'])
+    else:
+        df['CBSA'] = index.codes(df['NAME'])
     
-    for cohort_name, cities in COHORTS.items():
-        for city in cities:
-            # Fuzzy match city name in 'NAME' column
-            match = df[df['NAME'].str.contains(city, case=False, na=False)]
-            
-            if not match.empty:
-                # Handle specific cases
-                if city == "Portland":
-                    # User meant Portland, ME (Cohort C)
-                    # Portland-South Portland, ME
-                    match = match[match['NAME'].str.contains("ME")]
-                elif city == "Washington":
-                    # Washington-Arlington-Alexandria, DC-VA-MD-WV
-                    match = match[match['NAME'].str.contains("DC")]
-                
-                if not match.empty:
-                    # Take the first match (usually the correct Metro Area)
-                    # Iterate over the years for this city
-                    city_rows = match.copy()
-                    for _, row in city_rows.iterrows():
-                        cohort_data.append({
-                            "Cohort": cohort_name,
-                            "City": city,
-                            "Year": row['Year'],
-                            "NetMigrationRate": row['RNETMIG']
-                        })
-            else:
-                print(f"Warning: Could not find Census data for {city}")
-                
-    return pd.DataFrame(cohort_data)
+    # Assign Cohorts with one join on the CBSA code
+    cohorts = cohort_frame(index)
+    for city in cohorts.loc[~cohorts['CBSA'].isin(df['CBSA']), 'City']:
+        print(f"Warning: Could not find Census data for {city}")
+    table = df[['CBSA', 'NAME', 'Year'] + variables].merge(
+        cohorts.dropna(subset=['CBSA']), on='CBSA', how='left')
+    return table[['CBSA', 'NAME', 'Cohort', 'City', 'Year'] + variables]
 
-def plot_trends(df_long):
-    plt.figure(figsize=(12, 8))
-    
-    # Aggregate by Cohort and Year
-    df_agg = df_long.groupby(['Cohort', 'Year'])['NetMigrationRate'].mean().reset_index()
-    
-    colors = {
-        "Cohort A: Wealth Exporters (The Core)": "tab:blue",
-        "Cohort B: Major Sunbelt Hubs (Urban Importers)": "tab:orange",
-        "Cohort C: Nature Enclaves (Scenic Importers)": "tab:green"
-    }
-    
-    for cohort in COHORTS.keys():
+def cohort_rows(table):
+    """The migration_history_2011_2019.csv schema: Cohort, City, Year, NetMigrationRate."""
+    # Census names in the table resolve cohort cities the crosswalk does not cover
+    index = get_index()
+    if 'NAME' in table.columns:
+        names = table.drop_duplicates('CBSA')
+        index = index.extended(names['NAME'], names['CBSA'])
+    # Inner join from the cohort list keeps COHORTS order, then each city's periods
+    cohorts = cohort_frame(index)
+    df = cohorts.merge(table.drop(columns=['Cohort', 'City'], errors='ignore'), on='CBSA', how='inner')
+    return df[['Cohort', 'City', 'Year', 'RNETMIG']].rename(columns={'RNETMIG': 'NetMigrationRate'})
+
+@traced()
+def load_cohort_migration():
+    """
+    Migration rows for the cohorts in use (COHORTS, or ZHVI_COHORTS): from the
+    all-metro table when it has been fetched, otherwise by relabelling the
+    cohort file's cities through their CBSA codes.
+    """
+    if os.path.exists(ALL_METROS_CSV):
+        return cohort_rows(pd.read_csv(ALL_METROS_CSV))
+    df = pd.read_csv(MIGRATION_CSV)
+    table = pd.DataFrame({'CBSA': get_index().codes(df['City']), 'Year': df['Year'],
+                          'RNETMIG': df['NetMigrationRate']})
+    df = cohort_rows(table[table['CBSA'] >= 0])
+    missing = [c for cities in COHORTS.values() for c in cities if c not in set(df['City'])]
+    if missing:
+        print(f"Warning: no migration data in {MIGRATION_CSV} for {len(missing)} cohort cities "
+              f"(fetch_migration_history.py --all-metros covers every metro)")
+    return df
+
+@traced()
+def process_data(df):
+    return cohort_rows(metro_table(df))
+
+def draw_trends(fig, df_agg, style):
+    ax = fig.subplots()
+    for cohort, color in style['colors'].items():
         subset = df_agg[df_agg['Cohort'] == cohort]
-        plt.plot(subset['Year'], subset['NetMigrationRate'], label=cohort, color=colors[cohort], linewidth=2.5, marker='o')
+        ax.plot(subset['Year'], subset['NetMigrationRate'], label=cohort, color=color, linewidth=2.5, marker='o')
         
-    plt.axhline(0, color='black', linewidth=1, linestyle='-')
-    plt.title('The "Golden Handcuffs" Breached: Pre-Pandemic Net Migration Rates (2011-2019)')
-    plt.ylabel('Net Migration Rate (per 1,000 residents)')
-    plt.xlabel('Year')
-    plt.legend()
-    plt.grid(True, alpha=0.3)
+    ax.axhline(0, color='black', linewidth=1, linestyle='-')
+    ax.set_title('The "Golden Handcuffs" Breached: Pre-Pandemic Net Migration Rates (2011-2019)')
+    ax.set_ylabel('Net Migration Rate (per 1,000 residents)')
+    ax.set_xlabel('Year')
+    ax.legend()
+    ax.grid(True, alpha=0.3)
     
     # Annotation for Exporters
     # Use the latest available year
     max_year = df_agg['Year'].max()
-    exporters_latest = df_agg[(df_agg['Cohort'] == "Cohort A: Wealth Exporters (The Core)") & (df_agg['Year'] == max_year)]['NetMigrationRate'].values[0]
+    exporters = df_agg[(df_agg['Cohort'] == "Cohort A: Wealth Exporters (The Core)") & (df_agg['Year'] == max_year)]
     
-    if exporters_latest < 0:
-        plt.annotate('Negative Migration\nBefore COVID', xy=(max_year, exporters_latest), 
-                     xytext=(max_year - 2, exporters_latest - 2),
-                     arrowprops=dict(facecolor='black', shrink=0.05))
+    if not exporters.empty and exporters['NetMigrationRate'].iloc[0] < 0:
+        exporters_latest = exporters['NetMigrationRate'].iloc[0]
+        ax.annotate('Negative Migration\nBefore COVID', xy=(max_year, exporters_latest), 
+                    xytext=(max_year - 2, exporters_latest - 2),
+                    arrowprops=dict(facecolor='black', shrink=0.05))
     
-    plt.tight_layout()
-    plt.savefig('output/migration_pre_trend.png')
-    print("Chart saved to output/migration_pre_trend.png")
+    fig.tight_layout()
+
+def trends_chart(df_long, path='output/migration_pre_trend.png'):
+    # Aggregate by Cohort and Year
+    df_agg = df_long.groupby(['Cohort', 'Year'])['NetMigrationRate'].mean().reset_index()
+    return Chart(path, draw_trends, df_agg, {'colors': cohort_colors(COHORTS.keys())})
+
+@traced()
+def plot_trends(df_long):
+    render(trends_chart(df_long))
 
-def main():
-    df_census = fetch_census_data()
+def main(plots=True, history=False, all_metros=False, refresh=False):
+    if history:
+        # All vintages (2011-2024) and population levels, fetched concurrently
+        df_history = fetch_census_history(refresh=refresh)
+        df_history.to_csv(HISTORY_CSV, index=False)
+        print(f"{len(df_history)} metro-years saved to {HISTORY_CSV}")
+    df_census = fetch_census_data(MIGRATION_VARIABLES if all_metros else ("RNETMIG",), refresh=refresh)
     if not df_census.empty:
-        df_processed = process_data(df_census)
+        # One pass produces the all-metro table; the cohort file is a join on it
+        table = metro_table(df_census)
+        if all_metros:
+            table.to_csv(ALL_METROS_CSV, index=False)
+            print(f"{table['CBSA'].nunique()} metros saved to {ALL_METROS_CSV}")
+        df_processed = cohort_rows(table)
         if not df_processed.empty:
             # Save CSV
-            df_processed.to_csv('data/migration_history_2011_2019.csv', index=False)
-            print("Data saved to data/migration_history_2011_2019.csv")
+            df_processed.to_csv(MIGRATION_CSV, index=False)
+            print(f"Data saved to {MIGRATION_CSV}")
             
-            plot_trends(df_processed)
+            if plots:
+                plot_trends(df_processed)
         else:
             print("No data processed.")
     else:
         print("Failed to fetch Census data.")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Fetch 2011-2019 metro net migration rates from the Census API.")
+    parser.add_argument('--no-plots', action='store_true',
+                        help="Fetch and save the CSV only; never imports matplotlib")
+    parser.add_argument('--all-metros', action='store_true',
+                        help=f"Also save every metro and migration component to {ALL_METROS_CSV}")
+    parser.add_argument('--history', action='store_true',
+                        help=f"Also save every metro's 2011-2024 components and population to {HISTORY_CSV}")
+    parser.add_argument('--refresh', action='store_true',
+                        help="Refetch every Census response instead of using the cached copies (which never expire)")
+    parser.add_argument('--trace', action='store_true',
+                        help="Record per-stage wall/CPU time and memory to output/trace_migration.json")
+    args = parser.parse_args()
+    tracing.enable(args.trace or tracing.ENABLED)
+    main(plots=not args.no_plots, history=args.history, all_metros=args.all_metros, refresh=args.refresh)
+    tracing.finish('output/trace_migration.json')
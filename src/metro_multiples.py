@@ -0,0 +1,123 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from zhvi_loader import fetch_data
+from cohorts import DATA_URL, COHORTS
+from region_index import resolve_cohorts
+from panel import Panel
+from normalize import pct_change_from_baseline
+from render import Chart, render_all, cohort_colors
+import tracing
+from tracing import traced
+
+# Per-metro small multiples.
+# One panel per metro (every metro in the file, ~900), cumulative % change
+# since the March 2020 baseline, colored by cohort (gray: no cohort). Metros
+# are laid out largest first (Zillow SizeRank) on pages of PER_PAGE panels.
+# Each page is its own chart: pages render in parallel, and a page whose
+# metros' data did not change is not redrawn.
+BASELINE = pd.Timestamp('2020-03-31')
+START = '2018-01-01'
+PER_PAGE = 100
+COLS = 10
+OUTPUT_DIR = 'output/metro_multiples'
+
+
+def decimal_years(periods):
+    return periods.year.to_numpy() + (periods.month.to_numpy() - 1) / 12
+
+
+def draw_page(fig, page, style):
+    from matplotlib.ticker import MaxNLocator
+    n, cols = len(page['names']), style['cols']
+    rows = -(-n // cols)
+    # Axes are not linked (sharex/sharey costs grow quadratically with the
+    # number of axes); every panel gets the same fixed limits and ticks instead
+    axes = fig.subplots(rows, cols, squeeze=False).ravel()
+    x, pct, colors = page['x'], page['pct'], style['colors']
+    finite = pct[np.isfinite(pct)]
+    lo, hi = (finite.min(), finite.max()) if finite.size else (-1.0, 1.0)
+    pad = 0.05 * max(hi - lo, 1.0)
+    years = np.arange(np.ceil(x[0]), np.floor(x[-1]) + 1, 2)
+    levels = [v for v in MaxNLocator(4).tick_values(lo, hi) if lo - pad <= v <= hi + pad]
+    for i, (ax, name, cohort, series) in enumerate(zip(axes, page['names'], page['cohorts'], pct)):
+        ax.set_autoscale_on(False)
+        ax.set_xlim(x[0], x[-1])
+        ax.set_ylim(lo - pad, hi + pad)
+        ax.set_xticks(years)
+        ax.set_yticks(levels)
+        ax.plot(x, series, color=colors.get(cohort, 'gray'), linewidth=1)
+        ax.axhline(0, color='black', linewidth=0.5)
+        ax.axvline(style['baseline'], color='red', linestyle=':', linewidth=0.5)
+        ax.set_title(name, fontsize=6)
+        ax.tick_params(labelsize=5, labelbottom=i + cols >= n, labelleft=i % cols == 0)
+    for ax in axes[n:]:
+        ax.set_axis_off()
+    fig.suptitle(f"{style['title']} (page {page['number']} of {page['pages']})")
+    # tight_layout is too slow at ~100 axes per page; fixed margins instead
+    fig.subplots_adjust(left=0.04, right=0.99, bottom=0.03, top=0.94, wspace=0.15, hspace=0.45)
+
+
+def page_charts(panel, pct, per_page=PER_PAGE, cols=COLS, output_dir=OUTPUT_DIR):
+    """One Chart per page of `per_page` metros, largest metros first."""
+    order = np.arange(len(pct))
+    if 'SizeRank' in panel.meta.columns:
+        order = np.argsort(panel.meta['SizeRank'].to_numpy(), kind='stable')
+    names = panel.region_names
+    cohorts = np.asarray(panel.cohorts, dtype=object)
+    pages = -(-len(order) // per_page)
+    rows = -(-min(per_page, len(order)) // cols)
+    style = {
+        'cols': cols,
+        'colors': cohort_colors(COHORTS.keys()),
+        'baseline': float(decimal_years(pd.PeriodIndex([BASELINE], freq='M'))[0]),
+        'title': f"Cumulative % Change Since {BASELINE.strftime('%b %Y')}, Every Metro",
+        'figsize': (1.6 * cols, 1.3 * rows + 0.6),
+    }
+    charts = []
+    for number, first in enumerate(range(0, len(order), per_page), start=1):
+        rows_on_page = order[first:first + per_page]
+        page = {
+            'number': number, 'pages': pages, 'x': decimal_years(panel.periods),
+            'names': list(names[rows_on_page]),
+            'cohorts': [c if isinstance(c, str) else None for c in cohorts[rows_on_page]],
+            'pct': pct[rows_on_page],
+        }
+        charts.append(Chart(os.path.join(output_dir, f"page_{number:02d}.png"), draw_page, page, style))
+    return charts
+
+
+@traced()
+def load_panel(url=DATA_URL, start=START):
+    df = fetch_data(url, start=start)
+    if 'RegionType' in df.columns:
+        df = df[df['RegionType'] != 'country']
+    return Panel.from_wide(df, resolve_cohorts(COHORTS, df['RegionName'].unique()))
+
+
+def main(per_page=PER_PAGE, cols=COLS, workers=None, force=False, url=DATA_URL):
+    panel = load_panel(url)
+    print(panel.report())
+    pct = pct_change_from_baseline(panel.values, panel.dates, BASELINE)
+    if pct is None:
+        raise ValueError(f"Baseline {BASELINE.date()} not in data")
+    charts = page_charts(panel, pct.astype(np.float32), per_page, cols)
+    render_all(charts, workers=workers, force=force)
+    print(f"{len(panel.regions)} metros on {len(charts)} pages in {OUTPUT_DIR}/")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="One small panel per metro, paged.")
+    parser.add_argument('--per-page', type=int, default=PER_PAGE)
+    parser.add_argument('--cols', type=int, default=COLS)
+    parser.add_argument('--workers', type=int, default=None, help="Render processes (default: all cores)")
+    parser.add_argument('--force', action='store_true', help="Redraw every page, even if unchanged")
+    parser.add_argument('--url', default=DATA_URL)
+    parser.add_argument('--trace', action='store_true',
+                        help="Record per-stage wall/CPU time and memory to output/trace_metro_multiples.json")
+    args = parser.parse_args()
+    tracing.enable(args.trace or tracing.ENABLED)
+    main(args.per_page, args.cols, args.workers, args.force, args.url)
+    tracing.finish('output/trace_metro_multiples.json')
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+
+from tracing import traced
+
+# Normalization engine: keeps the panel as a regions x dates float matrix so
+# baseline re-indexing and cohort aggregation are whole-array operations
+# instead of a per-city loop over the melted frame.
+
+
+@traced()
+def pct_change_from_baseline(values, dates, baseline_date):
+    """
+    Cumulative % change relative to `baseline_date` for every region at once.
+    Returns None when the baseline month is not in the panel.
+    """
+    pos = dates.get_indexer([pd.Timestamp(baseline_date)])[0]
+    if pos < 0:
+        return None
+    # float64 baseline promotes float32 panels so the % change keeps full precision
+    base = values[:, pos:pos + 1].astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return ((values - base) / base) * 100
+
+
+def cohort_reduce(values, codes, weights=None):
+    """
+    NaN-aware per-group mean/min/max over the region axis.
+    `codes` assigns each row to a group; returns (group codes, {stat: groups x dates}).
+    With `weights` (one per row) the mean is weighted; min/max are not.
+    """
+    codes = np.asarray(codes)
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    x = values[order]
+    missing = np.isnan(x)
+    if weights is None:
+        sums = np.add.reduceat(np.where(missing, 0.0, x), starts, axis=0)
+        counts = np.add.reduceat(~missing, starts, axis=0)
+    else:
+        w = np.asarray(weights, dtype=np.float64)[order][:, None]
+        sums = np.add.reduceat(np.where(missing, 0.0, x * w), starts, axis=0)
+        counts = np.add.reduceat(np.where(missing, 0.0, w), starts, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats = {
+            'mean': sums / counts,
+            'min': np.fmin.reduceat(x, starts, axis=0),
+            'max': np.fmax.reduceat(x, starts, axis=0),
+        }
+    return sorted_codes[starts], stats
+
+
+@traced()
+def aggregate_cohorts(pct, cohorts, dates, stats=('mean', 'min', 'max'), weights=None):
+    """
+    Builds the long (Date, Cohort, stats...) aggregate frame from a pct-change
+    matrix and a per-region cohort label, in the same order as
+    groupby(['Date', 'Cohort']). `weights` (per region) weights the mean.
+    """
+    if isinstance(cohorts, pd.Categorical):
+        codes, labels = cohorts.codes, np.asarray(cohorts.categories, dtype=object)
+    else:
+        codes, labels = pd.factorize(np.asarray(cohorts))
+    # Regions without a cohort (code -1) are left out rather than wrapping to the last label
+    labelled = codes >= 0
+    groups, reduced = cohort_reduce(pct[labelled], codes[labelled],
+                                    None if weights is None else np.asarray(weights)[labelled])
+    n_groups, n_dates = len(groups), len(dates)
+    df_agg = pd.DataFrame({
+        'Date': np.tile(dates.to_numpy(), n_groups),
+        'Cohort': np.repeat(labels[groups], n_dates),
+    })
+    for stat in stats:
+        df_agg[stat] = reduced[stat].ravel()
+    return df_agg.sort_values(['Date', 'Cohort'], kind='stable').reset_index(drop=True)
+
+
+@traced()
+def to_long(regions, dates, values, pct, cohorts):
+    """Long-format (RegionName, Date, ZHVI, PctChange, Cohort) view of the normalized panel."""
+    n_regions, n_dates = values.shape
+    return pd.DataFrame({
+        'RegionName': np.repeat(regions, n_dates),
+        'Date': np.tile(dates.to_numpy(), n_regions),
+        'ZHVI': np.asarray(values).ravel(),
+        'PctChange': pct.ravel(),
+        'Cohort': np.repeat(np.asarray(cohorts, dtype=object), n_dates),
+    })
@@ -0,0 +1,132 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from tracing import traced
+
+# Compact in-memory ZHVI panel shared by the analyses.
+# Instead of a melted frame with one Python string RegionName, a parsed Date
+# and a Cohort string per row, values stay in a regions x months float32
+# matrix with a NaN mask, regions and cohorts are integer-coded categoricals,
+# and the month axis is a PeriodIndex parsed once from the CSV header.
+DATE_COL = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def cohort_labels(names, cohort_map):
+    """Cohort Categorical for `names` from {cohort: [RegionName, ...]}; the first cohort listing a region wins."""
+    region_cohort = {}
+    for cohort_name, actual_cities in cohort_map.items():
+        for city in actual_cities:
+            region_cohort.setdefault(city, cohort_name)
+    return pd.Categorical([region_cohort.get(n) for n in names], categories=list(cohort_map))
+
+
+class Panel:
+    def __init__(self, values, periods, regions, cohorts=None, meta=None, mask=None):
+        # A float32 C-ordered memmap (see panel_store) is kept as is, without a copy
+        self.values = np.ascontiguousarray(values, dtype=np.float32)
+        self.mask = ~np.isnan(self.values) if mask is None else mask
+        self.periods = periods
+        self.regions = regions
+        if cohorts is None:
+            cohorts = pd.Categorical([None] * len(regions), categories=[])
+        self.cohorts = cohorts
+        self.meta = meta if meta is not None else pd.DataFrame(index=range(len(regions)))
+
+    @classmethod
+    @traced("Panel.from_wide")
+    def from_wide(cls, df, cohort_map=None, start=None, end=None):
+        """
+        Builds a panel from a wide Zillow frame. `cohort_map` is
+        {cohort: [RegionName, ...]}; the first cohort listing a region wins.
+        """
+        date_cols = [c for c in df.columns if DATE_COL.match(str(c))]
+        periods = pd.PeriodIndex(date_cols, freq='M')
+        keep = np.ones(len(periods), dtype=bool)
+        if start is not None:
+            keep &= periods >= pd.Period(start, freq='M')
+        if end is not None:
+            keep &= periods <= pd.Period(end, freq='M')
+        cols = [c for c, k in zip(date_cols, keep) if k]
+
+        names = df['RegionName'].to_numpy()
+        regions = pd.Categorical(names, categories=pd.unique(names))
+        cohorts = cohort_labels(names, cohort_map) if cohort_map is not None else None
+
+        meta = df[[c for c in df.columns if c not in date_cols and c != 'RegionName']].reset_index(drop=True)
+        for col in meta.columns:
+            if meta[col].dtype == object or pd.api.types.is_string_dtype(meta[col]):
+                meta[col] = meta[col].astype('category')
+            elif pd.api.types.is_integer_dtype(meta[col]):
+                meta[col] = pd.to_numeric(meta[col], downcast='integer')
+        return cls(df[cols].to_numpy(dtype=np.float32), periods[keep], regions, cohorts, meta)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def dates(self):
+        """Month-end timestamps matching Zillow's column labels."""
+        return self.periods.to_timestamp(how='end').normalize()
+
+    @property
+    def region_names(self):
+        return np.asarray(self.regions, dtype=object)
+
+    def window(self, start=None, end=None):
+        keep = np.ones(len(self.periods), dtype=bool)
+        if start is not None:
+            keep &= self.periods >= pd.Period(start, freq='M')
+        if end is not None:
+            keep &= self.periods <= pd.Period(end, freq='M')
+        return Panel(self.values[:, keep], self.periods[keep], self.regions, self.cohorts, self.meta, self.mask[:, keep])
+
+    def select(self, rows):
+        """Subset of regions by boolean mask or integer positions."""
+        return Panel(self.values[rows], self.periods, self.regions[rows], self.cohorts[rows],
+                     self.meta.iloc[np.arange(len(self.regions))[rows]].reset_index(drop=True), self.mask[rows])
+
+    def with_cohorts(self, cohort_map):
+        """Same panel (no copy of the values) labelled with {cohort: [RegionName, ...]}."""
+        return Panel(self.values, self.periods, self.regions, cohort_labels(self.region_names, cohort_map),
+                     self.meta, self.mask)
+
+    def for_cohorts(self, cohort_map):
+        """Only the regions listed in {cohort: [RegionName, ...]}, labelled with their cohort."""
+        labelled = self.with_cohorts(cohort_map)
+        return labelled.select(labelled.cohorts.codes >= 0)
+
+    def annual_mean(self):
+        """(RegionName, Year, ZHVI) yearly means computed on the wide matrix, NaNs skipped."""
+        years = self.periods.year.to_numpy()
+        starts = np.flatnonzero(np.r_[True, years[1:] != years[:-1]])
+        sums = np.add.reduceat(np.where(self.mask, self.values, 0).astype(np.float64), starts, axis=1)
+        counts = np.add.reduceat(self.mask, starts, axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums / counts
+        n_regions, n_years = means.shape
+        return pd.DataFrame({
+            'RegionName': np.repeat(self.region_names, n_years),
+            'Year': np.tile(years[starts], n_regions),
+            'ZHVI': means.ravel(),
+        })
+
+    def memory_usage(self):
+        """Bytes held by each component of the panel."""
+        return {
+            'values': self.values.nbytes,
+            'mask': self.mask.nbytes,
+            'regions': self.regions.codes.nbytes + self.regions.categories.memory_usage(deep=True),
+            'cohorts': self.cohorts.codes.nbytes + self.cohorts.categories.memory_usage(deep=True),
+            'periods': self.periods.asi8.nbytes,
+            'meta': int(self.meta.memory_usage(deep=True).sum()),
+        }
+
+    def report(self):
+        usage = self.memory_usage()
+        total = sum(usage.values())
+        parts = ", ".join(f"{k} {v / 1024:.1f} KB" for k, v in usage.items())
+        return (f"Panel: {len(self.regions)} regions x {len(self.periods)} months, "
+                f"{total / 1024:.1f} KB ({parts})")
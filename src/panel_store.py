@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+
+from zhvi_loader import fetch_data
+from panel import Panel
+from tracing import traced
+
+# Memory-mapped panel store.
+# A panel is written once as a directory of .npy files (values, NaN mask,
+# month ordinals) plus a small pickled region table. Any process can then
+# attach read-only with np.load(mmap_mode='r'). The arrays are views of the
+# OS page cache, so N workers share one physical copy instead of each
+# unpickling its own. Stores are keyed by a hash of their contents, so an
+# unchanged download maps to the same directory and is never rewritten.
+STORE_DIR = os.path.join(os.environ.get("ZHVI_CACHE_DIR", "data/cache"), "panels")
+
+_attached = {}
+
+
+def panel_key(panel):
+    h = hashlib.sha256()
+    h.update(np.ascontiguousarray(panel.values).tobytes())
+    h.update(panel.periods.asi8.tobytes())
+    h.update("\0".join(map(str, panel.region_names)).encode())
+    h.update("\0".join(map(str, np.asarray(panel.cohorts, dtype=object))).encode())
+    return h.hexdigest()[:32]
+
+
+@traced()
+def write_store(panel, path):
+    """Writes `panel` to the directory `path` (atomically: built aside, then renamed)."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(tmp, exist_ok=True)
+    values = open_memmap(os.path.join(tmp, "values.npy"), mode="w+", dtype=np.float32, shape=panel.values.shape)
+    values[:] = panel.values
+    values.flush()
+    del values
+    np.save(os.path.join(tmp, "mask.npy"), panel.mask)
+    np.save(os.path.join(tmp, "periods.npy"), panel.periods.asi8)
+    regions = panel.meta.assign(RegionName=panel.region_names, Cohort=np.asarray(panel.cohorts, dtype=object))
+    regions.to_pickle(os.path.join(tmp, "regions.pkl"))
+    with open(os.path.join(tmp, "store.json"), "w") as f:
+        json.dump({"shape": list(panel.values.shape), "freq": "M",
+                   "cohorts": [str(c) for c in panel.cohorts.categories]}, f)
+    try:
+        os.replace(tmp, path)
+    except OSError:
+        # Another process published the same store first
+        shutil.rmtree(tmp, ignore_errors=True)
+    return path
+
+
+def store_panel(panel, store_dir=None):
+    """Path of the store holding `panel`, writing it only if it does not exist yet."""
+    path = os.path.join(store_dir or STORE_DIR, panel_key(panel))
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_store(panel, path)
+    return path
+
+
+def open_store(path):
+    """
+    Read-only Panel backed by the store at `path`. Values and mask are
+    memory-mapped (no copy). Attachments are reused within a process.
+    """
+    panel = _attached.get(path)
+    if panel is None:
+        with open(os.path.join(path, "store.json")) as f:
+            info = json.load(f)
+        values = np.load(os.path.join(path, "values.npy"), mmap_mode="r")
+        mask = np.load(os.path.join(path, "mask.npy"), mmap_mode="r")
+        periods = pd.PeriodIndex.from_ordinals(np.load(os.path.join(path, "periods.npy")), freq=info["freq"])
+        regions = pd.read_pickle(os.path.join(path, "regions.pkl"))
+        names = regions.pop("RegionName").to_numpy()
+        cohorts = pd.Categorical(regions.pop("Cohort"), categories=info["cohorts"])
+        panel = Panel(values, periods, pd.Categorical(names, categories=pd.unique(names)), cohorts,
+                      regions.reset_index(drop=True), mask)
+        _attached[path] = panel
+    return panel
+
+
+@traced()
+def fetch_panel(url, start=None, end=None, store_dir=None):
+    """
+    Every region of `url` (optionally limited to a date window) as a
+    store-backed Panel. Returns (panel, store path); pass the path to workers
+    and have them call open_store().
+    """
+    df = fetch_data(url, start=start, end=end)
+    path = store_panel(Panel.from_wide(df), store_dir)
+    return open_store(path), path
+
+
+def share_array(arr, store_dir=None):
+    """Writes a derived array (e.g. a worker input matrix) once and returns its path for attach_array()."""
+    arr = np.ascontiguousarray(arr)
+    h = hashlib.sha256(arr.tobytes())
+    h.update(f"{arr.dtype}{arr.shape}".encode())
+    path = os.path.join(store_dir or STORE_DIR, f"array-{h.hexdigest()[:32]}.npy")
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp.npy"
+        np.save(tmp, arr)
+        os.replace(tmp, path)
+    return path
+
+
+def attach_array(path):
+    return np.load(path, mmap_mode="r")
@@ -0,0 +1,294 @@
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import time
+
+import pandas as pd
+
+import analysis_zoom_hierarchy as zoom
+import analysis_pre_trend_housing as pre_trend
+import analysis_mechanism_regression as mechanism
+import fetch_migration_history as migration
+import resampling
+import tracing
+from zhvi_cache import cached_fetch
+from region_index import resolve_cohorts
+from panel import Panel
+from normalize import pct_change_from_baseline, aggregate_cohorts
+from render import render_all
+
+# Single-pass runner for every analysis in this repo.
+# fetch -> resolve -> reshape -> normalize -> aggregate -> model -> render is
+# modelled as a DAG. Each stage result is pickled under PIPELINE_DIR, keyed by
+# the hash of the stage's source and its inputs, so a rerun only recomputes
+# stages whose inputs (or code) changed.
+PIPELINE_DIR = os.path.join(os.environ.get("ZHVI_CACHE_DIR", "data/cache"), "pipeline")
+MANIFEST_FILE = "manifest.json"
+
+ZOOM_BASELINE = pd.Timestamp('2020-03-31')
+PRE_TREND_BASELINE = pd.Timestamp('2010-01-31')
+
+
+class Stage:
+    def __init__(self, name, func, deps=(), outputs=(), source=False, plot=False):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        # Files the stage writes; a cached stage reruns if any of them is missing
+        self.outputs = list(outputs)
+        # Source stages always run (they are cheap when the fetch cache is warm)
+        # and are identified by the hash of what they return
+        self.source = source
+        # Plot stages are skipped in --no-plots mode (matplotlib is never imported)
+        self.plot = plot
+
+
+def _digest(obj):
+    return hashlib.sha256(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+
+
+def _code_fingerprint(func):
+    """
+    Source of the stage function plus the functions it calls one level down
+    (e.g. mechanism.merge_housing_migration), so editing an analysis module
+    invalidates the stages that wrap it.
+    """
+    names = func.__code__.co_names
+    sources = [inspect.getsource(func)]
+    for name in names:
+        target = func.__globals__.get(name)
+        if inspect.ismodule(target):
+            for attr in names:
+                member = getattr(target, attr, None)
+                if inspect.isfunction(member) or inspect.isclass(member):
+                    sources.append(inspect.getsource(member))
+                elif isinstance(member, (dict, list, tuple, str)):
+                    # Module-level settings such as zoom.COHORTS (which ZHVI_COHORTS can replace)
+                    sources.append(repr(member))
+        elif inspect.isfunction(target) or inspect.isclass(target):
+            sources.append(inspect.getsource(target))
+    return "\0".join(sources)
+
+
+# 1. Stage functions
+
+def fetch_zhvi():
+    return cached_fetch(zoom.DATA_URL)
+
+def load_migration():
+    return migration.load_cohort_migration()
+
+def load_migration_keyed():
+    return mechanism.load_migration()
+
+def resolve(df):
+    return resolve_cohorts(zoom.COHORTS, df['RegionName'].unique())
+
+def reshape(df, cohort_map):
+    all_found_cities = [city for cities in cohort_map.values() for city in cities]
+    panel = Panel.from_wide(df[df['RegionName'].isin(all_found_cities)], cohort_map)
+    print(panel.report())
+    return panel
+
+def normalize_zoom(panel):
+    pct = pct_change_from_baseline(panel.values, panel.dates, ZOOM_BASELINE)
+    if pct is None:
+        raise ValueError(f"Baseline {ZOOM_BASELINE.date()} not in data")
+    return pct
+
+def normalize_pre_trend(panel):
+    window = panel.window('2010-01', '2019-12')
+    pct = pct_change_from_baseline(window.values, window.dates, PRE_TREND_BASELINE)
+    if pct is None:
+        raise ValueError(f"Baseline {PRE_TREND_BASELINE.date()} not in data")
+    return {'dates': window.dates, 'pct': pct}
+
+def aggregate_zoom(panel, pct):
+    return aggregate_cohorts(pct, panel.cohorts, panel.dates, stats=['mean', 'min', 'max'])
+
+def aggregate_pre_trend(panel, norm):
+    df_agg = aggregate_cohorts(norm['pct'], panel.cohorts, norm['dates'], stats=['mean'])
+    return df_agg.rename(columns={'mean': 'PctChange'})
+
+def inference(panel):
+    return resampling.generate_inference(panel)
+
+def merge_mechanism(df, df_mig):
+    return mechanism.merge_housing_migration(df, df_mig)
+
+def model(df_merged):
+    return mechanism.run_regression(df_merged).summary().as_text()
+
+def batched_model(df_merged):
+    return mechanism.run_batched_specs(df_merged)
+
+def summarize_zoom(df_agg):
+    zoom.generate_summary(df_agg)
+
+def summarize_pre_trend(df_agg):
+    pre_trend.generate_stats(df_agg)
+
+def export_migration(df_mig):
+    df_mig.to_csv('output/migration_history_2011_2019.csv', index=False)
+
+def chart_zoom(df_agg):
+    return zoom.hierarchy_chart(df_agg)
+
+def chart_pre_trend(df_agg):
+    return pre_trend.trends_chart(df_agg)
+
+def chart_mechanism(df_merged):
+    return mechanism.mechanism_chart(df_merged)
+
+def chart_migration(df_mig):
+    return migration.trends_chart(df_mig)
+
+def render_charts(*charts):
+    # Independent figures render concurrently; unchanged ones are skipped
+    return render_all(charts)
+
+
+STAGES = [
+    Stage('fetch_zhvi', fetch_zhvi, source=True),
+    Stage('load_migration', load_migration, source=True),
+    Stage('load_migration_keyed', load_migration_keyed, source=True),
+    Stage('resolve', resolve, ['fetch_zhvi']),
+    Stage('reshape', reshape, ['fetch_zhvi', 'resolve']),
+    Stage('normalize_zoom', normalize_zoom, ['reshape']),
+    Stage('normalize_pre_trend', normalize_pre_trend, ['reshape']),
+    Stage('aggregate_zoom', aggregate_zoom, ['reshape', 'normalize_zoom']),
+    Stage('aggregate_pre_trend', aggregate_pre_trend, ['reshape', 'normalize_pre_trend']),
+    Stage('inference', inference, ['reshape'], outputs=['output/inference_results.txt']),
+    Stage('merge_mechanism', merge_mechanism, ['fetch_zhvi', 'load_migration_keyed']),
+    Stage('model', model, ['merge_mechanism'], outputs=['output/regression_results.txt']),
+    Stage('batched_model', batched_model, ['merge_mechanism'], outputs=['output/batched_regressions.csv']),
+    Stage('summarize_zoom', summarize_zoom, ['aggregate_zoom'], outputs=['output/cohort_summary.txt']),
+    Stage('summarize_pre_trend', summarize_pre_trend, ['aggregate_pre_trend'], outputs=['output/pre_trend_stats.txt']),
+    Stage('export_migration', export_migration, ['load_migration'],
+          outputs=['output/migration_history_2011_2019.csv']),
+    Stage('chart_zoom', chart_zoom, ['aggregate_zoom'], plot=True),
+    Stage('chart_pre_trend', chart_pre_trend, ['aggregate_pre_trend'], plot=True),
+    Stage('chart_mechanism', chart_mechanism, ['merge_mechanism'], plot=True),
+    Stage('chart_migration', chart_migration, ['load_migration'], plot=True),
+    # Always runs (like a source stage): render_all keeps its own per-chart
+    # cache, keyed on the draw functions' source as well as the data and style
+    Stage('render', render_charts, ['chart_zoom', 'chart_pre_trend', 'chart_mechanism', 'chart_migration'],
+          outputs=['output/zoom_town_hierarchy.png', 'output/parallel_trends_check.png',
+                   'output/mechanism_chart.png', 'output/migration_pre_trend.png'], source=True, plot=True),
+]
+
+
+# 2. Runner
+
+def _topo_order(stages):
+    by_name = {s.name: s for s in stages}
+    order, seen = [], set()
+
+    def visit(name, path=()):
+        if name in seen:
+            return
+        if name in path:
+            raise ValueError(f"Cycle in pipeline at stage '{name}'")
+        for dep in by_name[name].deps:
+            visit(dep, path + (name,))
+        seen.add(name)
+        order.append(by_name[name])
+
+    for s in stages:
+        visit(s.name)
+    return order
+
+
+def _load_manifest(cache_dir):
+    path = os.path.join(cache_dir, MANIFEST_FILE)
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+
+def _save_manifest(cache_dir, manifest):
+    path = os.path.join(cache_dir, MANIFEST_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def run_pipeline(stages=STAGES, force=False, cache_dir=PIPELINE_DIR, plots=True):
+    """
+    Runs every stage in dependency order, reusing memoized results whose
+    input hashes are unchanged. Returns ({stage: result}, timing rows).
+    With plots=False the render stages are left out (compute-only mode).
+    """
+    if not plots:
+        stages = [s for s in stages if not s.plot]
+    os.makedirs(cache_dir, exist_ok=True)
+    os.makedirs('output', exist_ok=True)
+    manifest = _load_manifest(cache_dir)
+    results, hashes, timings = {}, {}, []
+
+    for stage in _topo_order(stages):
+        start = time.perf_counter()
+        inputs = [results[d] for d in stage.deps]
+        key = hashlib.sha256("\0".join(
+            [stage.name, _code_fingerprint(stage.func)] + [hashes[d] for d in stage.deps]
+        ).encode()).hexdigest()
+        entry = manifest.get(stage.name)
+        blob = os.path.join(cache_dir, f"{stage.name}-{key[:16]}.pkl")
+        cached = (
+            not force and not stage.source
+            and entry is not None and entry['key'] == key
+            and os.path.exists(blob)
+            and all(os.path.exists(p) for p in stage.outputs)
+        )
+
+        with tracing.span(f"stage:{stage.name}") as span:
+            if cached:
+                with open(blob, 'rb') as f:
+                    results[stage.name] = pickle.load(f)
+                hashes[stage.name] = entry['output_hash']
+                status = 'cached'
+            else:
+                results[stage.name] = stage.func(*inputs)
+                # Content hash of the result: identical output lets downstream stages stay cached
+                hashes[stage.name] = _digest(results[stage.name])
+                if not stage.source:
+                    with open(blob, 'wb') as f:
+                        pickle.dump(results[stage.name], f, protocol=pickle.HIGHEST_PROTOCOL)
+                    if entry and entry.get('blob') != blob and os.path.exists(entry['blob']):
+                        os.remove(entry['blob'])
+                    manifest[stage.name] = {'key': key, 'output_hash': hashes[stage.name], 'blob': blob}
+                status = 'ran'
+            span.record(results[stage.name])
+        timings.append((stage.name, status, time.perf_counter() - start))
+
+    _save_manifest(cache_dir, manifest)
+    return results, timings
+
+
+def report(timings):
+    print("\nPIPELINE STAGE TIMINGS")
+    print("======================")
+    for name, status, seconds in timings:
+        print(f"  {name:<22} {status:<7} {seconds:8.3f}s")
+    print(f"  {'total':<22} {'':<7} {sum(t[2] for t in timings):8.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run every analysis in one pass.")
+    parser.add_argument('--force', action='store_true', help="Ignore memoized stage results")
+    parser.add_argument('--no-plots', action='store_true',
+                        help="Skip the render stages; never imports matplotlib")
+    parser.add_argument('--trace', action='store_true',
+                        help="Record per-stage wall/CPU time and memory to output/trace_pipeline.json")
+    args = parser.parse_args()
+    tracing.enable(args.trace or tracing.ENABLED)
+    _, timings = run_pipeline(force=args.force, plots=not args.no_plots)
+    report(timings)
+    tracing.finish('output/trace_pipeline.json')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+import argparse
+import json
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+
+from zhvi_loader import fetch_data
+from cohorts import DATA_URL, COHORTS
+from region_index import get_index
+from panel import Panel
+from rebase import LogCube
+from analysis_zoom_hierarchy import format_summary
+import tracing
+from tracing import traced
+
+# Local query service for ad-hoc cohort questions.
+# Every metro's log-ZHVI series (rebase.LogCube) stays in memory, so growth
+# from any baseline is one subtraction. Per-baseline growth matrices and
+# per-cohort partial aggregates (sum, count, min, max per month) sit in LRU
+# caches keyed by (baseline, window) and by (member rows, baseline, window).
+# An edited cohort only reduces its own rows; unchanged cohorts come straight
+# from the cache. Queries go through a threaded HTTP server or the CLI, and
+# per-request latencies are kept for percentile reports.
+DEFAULT_BASELINE = '2020-03'
+DEFAULT_PORT = 8765
+GROWTH_CACHE = 64
+PARTIAL_CACHE = 4096
+LATENCY_WINDOW = 100000
+PERCENTILES = (50, 90, 99)
+
+
+class QueryEngine:
+    def __init__(self, panel):
+        self.cube = LogCube.from_panel(panel)
+        self.names = panel.region_names
+        self.dates = panel.dates
+        self.rows = {name: i for i, name in enumerate(self.names)}
+        # CBSA code -> first region row, so aliases ('Bend, OR') resolve without a scan
+        self.by_code = {}
+        for i, code in enumerate(get_index().codes(self.names)):
+            if code >= 0:
+                self.by_code.setdefault(int(code), i)
+        self.growth = lru_cache(maxsize=GROWTH_CACHE)(self._growth)
+        self.partial = lru_cache(maxsize=PARTIAL_CACHE)(self._partial)
+
+    def _growth(self, b, s, e):
+        """Cumulative % change since month b for every region, months s..e (read-only)."""
+        L = self.cube.log_values
+        pct = np.expm1(L[:, s:e + 1] - L[:, b:b + 1]) * 100
+        pct.setflags(write=False)
+        return pct
+
+    def _partial(self, rows, b, s, e):
+        """(sum, count, min, max) per month over `rows`: mergeable partial aggregates of one cohort."""
+        pct = self.growth(b, s, e)[list(rows)]
+        missing = np.isnan(pct)
+        with np.errstate(invalid='ignore'):
+            return (np.where(missing, 0.0, pct).sum(axis=0), (~missing).sum(axis=0),
+                    np.fmin.reduce(pct, axis=0), np.fmax.reduce(pct, axis=0))
+
+    def resolve(self, cohorts):
+        """({cohort: sorted row tuple}, unresolved names); exact names first, then CBSA aliases."""
+        index = get_index()
+        members, unresolved = {}, []
+        for cohort, cities in cohorts.items():
+            rows = set()
+            for city in cities:
+                row = self.rows.get(city)
+                if row is None:
+                    code = index.lookup(city)
+                    row = self.by_code.get(code) if code is not None else None
+                if row is None:
+                    unresolved.append(city)
+                else:
+                    rows.add(row)
+            members[cohort] = tuple(sorted(rows))
+        return members, unresolved
+
+    def position(self, month, default):
+        if month is None:
+            return default
+        pos = self.cube.positions([month])[0]
+        if pos < 0:
+            raise ValueError(f"Month {month} not in data ({self.cube.periods[0]} to {self.cube.periods[-1]})")
+        return pos
+
+    def query(self, cohorts=None, move=None, baseline=DEFAULT_BASELINE, start=None, end=None, series=True):
+        """
+        Cohort mean/min/max cumulative growth since `baseline` over the months
+        start..end (default: baseline to the latest month).
+        `cohorts` replaces COHORTS; `move` ({city: cohort}) reassigns single
+        cities on top of it (a new cohort name adds a cohort).
+        """
+        if cohorts is not None and not cohorts:
+            raise ValueError("'cohorts' must define at least one cohort")
+        cohorts = {c: list(cities) for c, cities in (COHORTS if cohorts is None else cohorts).items()}
+        for city, target in (move or {}).items():
+            for cities in cohorts.values():
+                if city in cities:
+                    cities.remove(city)
+            cohorts.setdefault(target, []).append(city)
+
+        b = self.position(baseline, None)
+        s = self.position(start, b)
+        e = self.position(end, len(self.cube.periods) - 1)
+        if s > e:
+            raise ValueError("Window start is after its end")
+        members, unresolved = self.resolve(cohorts)
+        if not any(members.values()):
+            raise ValueError(f"No requested regions found in the data (unresolved: {', '.join(unresolved) or 'none'})")
+
+        dates = self.dates[s:e + 1]
+        result = {'baseline': str(self.cube.periods[b]), 'start': str(self.cube.periods[s]),
+                  'end': str(self.cube.periods[e]), 'unresolved': unresolved, 'cohorts': {}}
+        latest = []
+        for cohort, rows in members.items():
+            if not rows:
+                continue
+            sums, counts, mins, maxs = self.partial(rows, b, s, e)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                means = sums / counts
+            entry = {'regions': [self.names[r] for r in rows],
+                     'latest': {'mean': _num(means[-1]), 'min': _num(mins[-1]), 'max': _num(maxs[-1])}}
+            if series:
+                entry['series'] = {'date': [d.strftime('%Y-%m-%d') for d in dates], 'mean': _nums(means),
+                                   'min': _nums(mins), 'max': _nums(maxs)}
+            result['cohorts'][cohort] = entry
+            latest.append((cohort, means[-1], mins[-1], maxs[-1]))
+
+        # Same structure and text as analysis_zoom_hierarchy.generate_summary
+        df_latest = pd.DataFrame(latest, columns=['Cohort', 'mean', 'min', 'max']).assign(Date=dates[-1])
+        result['summary'] = format_summary(df_latest, list(members))
+        return result
+
+    def cache_info(self):
+        return {'growth': self.growth.cache_info()._asdict(), 'partial': self.partial.cache_info()._asdict()}
+
+
+def _num(x):
+    return None if np.isnan(x) else round(float(x), 4)
+
+
+def _nums(values):
+    return [_num(x) for x in values]
+
+
+QUERY_PARAMS = ('cohorts', 'move', 'baseline', 'start', 'end', 'series')
+
+
+def check_params(params):
+    """Error message for a malformed query, or None if QueryEngine.query can take it."""
+    if not isinstance(params, dict):
+        return "Query must be a JSON object"
+    unknown = set(params) - set(QUERY_PARAMS)
+    if unknown:
+        return f"Unknown parameters: {', '.join(sorted(unknown))}"
+    for key in ('baseline', 'start', 'end'):
+        if params.get(key) is not None and not isinstance(params[key], str):
+            return f"'{key}' must be a month string, e.g. \"2020-03\""
+    move = params.get('move')
+    if move is not None and not (isinstance(move, dict) and all(isinstance(v, str) for v in move.values())):
+        return "'move' must be an object of {city: cohort} strings"
+    cohorts = params.get('cohorts')
+    if cohorts == {}:
+        return "'cohorts' must define at least one cohort"
+    if cohorts is not None and not (isinstance(cohorts, dict) and all(
+            isinstance(cities, list) and all(isinstance(c, str) for c in cities) for cities in cohorts.values())):
+        return "'cohorts' must be an object of {cohort: [city, ...]} lists"
+    if not isinstance(params.get('series', True), bool):
+        return "'series' must be true or false"
+    return None
+
+
+class LatencyLog:
+    """Thread-safe ring of request latencies (ms) with percentile summaries."""
+
+    def __init__(self, size=LATENCY_WINDOW):
+        self.samples = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def add(self, ms):
+        with self.lock:
+            self.samples.append(ms)
+
+    def summary(self):
+        with self.lock:
+            samples = np.array(self.samples)
+        if not len(samples):
+            return {'count': 0}
+        out = {'count': len(samples), 'mean_ms': round(float(samples.mean()), 3)}
+        for q, v in zip(PERCENTILES, np.percentile(samples, PERCENTILES)):
+            out[f'p{q}_ms'] = round(float(v), 3)
+        out['max_ms'] = round(float(samples.max()), 3)
+        return out
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/health':
+            return self._send(200, {'status': 'ok', 'regions': len(self.server.engine.names)})
+        if url.path == '/regions':
+            return self._send(200, {'regions': list(self.server.engine.names), 'cohorts': COHORTS})
+        if url.path == '/stats':
+            return self._send(200, {'latency': self.server.latency.summary(),
+                                    'cache': self.server.engine.cache_info()})
+        if url.path == '/query':
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            return self._query({k: params[k] for k in ('baseline', 'start', 'end') if k in params}
+                               | {'series': params.get('series', '1') != '0'})
+        self._send(404, {'error': f"Unknown path {url.path}"})
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/query':
+            return self._send(404, {'error': f"Unknown path {self.path}"})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        except ValueError as e:
+            # Malformed JSON, non-UTF-8 bytes or a bad Content-Length
+            return self._send(400, {'error': f"Invalid request body: {e}"})
+        self._query(body)
+
+    def _query(self, params):
+        start = time.perf_counter()
+        error = check_params(params)
+        if error:
+            return self._send(400, {'error': error})
+        try:
+            result = self.server.engine.query(**params)
+        except ValueError as e:
+            return self._send(400, {'error': str(e)})
+        except Exception as e:
+            # Keep the server up and answer in JSON; the traceback goes to the server's stderr
+            traceback.print_exc()
+            return self._send(500, {'error': f"Internal error: {type(e).__name__}: {e}"})
+        ms = (time.perf_counter() - start) * 1000
+        self.server.latency.add(ms)
+        result['elapsed_ms'] = round(ms, 3)
+        self._send(200, result)
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(engine, host='127.0.0.1', port=DEFAULT_PORT):
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.engine = engine
+    server.latency = LatencyLog()
+    server.url = f"http://{host}:{server.server_address[1]}"
+    return server
+
+
+@traced()
+def load_engine(url=DATA_URL, store=False):
+    if store:
+        from panel_store import fetch_panel
+        panel, path = fetch_panel(url)
+        print(f"Panel store: {path}")
+    else:
+        panel = Panel.from_wide(fetch_data(url))
+    if 'RegionType' in panel.meta.columns:
+        panel = panel.select((panel.meta['RegionType'] != 'country').to_numpy())
+    engine = QueryEngine(panel)
+    print(f"Resident panel: {len(engine.names)} regions x {len(engine.dates)} months")
+    return engine
+
+
+def post(url, payload):
+    from urllib.request import Request, urlopen
+    request = Request(url, data=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'})
+    with urlopen(request) as r:
+        return json.load(r)
+
+
+def random_queries(engine, n, seed=0):
+    """Ad-hoc queries like an analyst's: a random baseline/window and a city moved between cohorts."""
+    rng = np.random.default_rng(seed)
+    months = [str(p) for p in engine.cube.periods[engine.cube.periods >= pd.Period('2018-01', freq='M')]]
+    names = list(engine.names)
+    cohort_names = list(COHORTS)
+    queries = []
+    for _ in range(n):
+        b = int(rng.integers(0, len(months) - 1))
+        q = {'baseline': months[b], 'series': bool(rng.random() < 0.5)}
+        if rng.random() < 0.5:
+            q['end'] = months[int(rng.integers(b, len(months)))]
+        if rng.random() < 0.5:
+            q['move'] = {names[int(rng.integers(len(names)))]: cohort_names[int(rng.integers(len(cohort_names)))]}
+        queries.append(q)
+    return queries
+
+
+@traced()
+def load_test(engine, n_requests=2000, concurrency=16, seed=0):
+    """Fires `n_requests` random queries from `concurrency` client threads at an in-process server."""
+    server = make_server(engine, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    queries = random_queries(engine, n_requests, seed)
+    client = LatencyLog()
+
+    def send(q):
+        start = time.perf_counter()
+        post(f"{server.url}/query", q)
+        client.add((time.perf_counter() - start) * 1000)
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(send, queries))
+        wall = time.perf_counter() - start
+    finally:
+        server.shutdown()
+        server.server_close()
+    return {'requests': n_requests, 'concurrency': concurrency, 'throughput_rps': round(n_requests / wall, 1),
+            'client': client.summary(), 'server': server.latency.summary(), 'cache': engine.cache_info()}
+
+
+def format_load_test(report):
+    text = f"""
+    QUERY SERVICE LOAD TEST
+    =======================
+    {report['requests']} requests, {report['concurrency']} concurrent clients, {report['throughput_rps']} req/s
+    """
+    for side in ('client', 'server'):
+        s = report[side]
+        text += (f"\n    {side.capitalize()} latency (ms): mean {s['mean_ms']}, "
+                 + ", ".join(f"p{q} {s[f'p{q}_ms']}" for q in PERCENTILES) + f", max {s['max_ms']}\n")
+    p = report['cache']['partial']
+    text += f"\n    Partial-aggregate cache: {p['hits']} hits, {p['misses']} misses\n"
+    return text
+
+
+def parse_moves(moves):
+    """['Boise, ID=Cohort C: ...', ...] -> {city: cohort} (split on the last '=')."""
+    out = {}
+    for m in moves or []:
+        city, sep, cohort = m.rpartition('=')
+        if not sep:
+            raise argparse.ArgumentTypeError(f"--move expects CITY=COHORT, got '{m}'")
+        out[city] = cohort
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-memory cohort query service (HTTP + CLI).")
+    sub = parser.add_subparsers(dest='command', required=True)
+    serve = sub.add_parser('serve', help="Load the panel once and answer HTTP queries")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=DEFAULT_PORT)
+    query = sub.add_parser('query', help="Ask a running service")
+    query.add_argument('--url', default=f"http://127.0.0.1:{DEFAULT_PORT}")
+    query.add_argument('--baseline', default=DEFAULT_BASELINE)
+    query.add_argument('--start')
+    query.add_argument('--end')
+    query.add_argument('--move', action='append', help="CITY=COHORT, e.g. 'Boise City, ID=Cohort C: ...' (repeatable)")
+    query.add_argument('--cohorts', help="JSON file of {cohort: [city, ...]} to use instead of COHORTS")
+    query.add_argument('--json', action='store_true', help="Print the full JSON response")
+    bench = sub.add_parser('bench', help="Latency percentiles under concurrent load (in-process server)")
+    bench.add_argument('--requests', type=int, default=2000)
+    bench.add_argument('--concurrency', type=int, default=16)
+    for p in (serve, bench):
+        p.add_argument('--url', dest='data_url', default=DATA_URL, help="ZHVI file to hold in memory")
+        p.add_argument('--store', action='store_true', help="Map the panel from the shared panel store")
+        p.add_argument('--trace', action='store_true',
+                       help="Record per-stage wall/CPU time and memory to output/trace_query_service.json")
+    args = parser.parse_args()
+
+    if args.command == 'query':
+        payload = {'baseline': args.baseline, 'series': args.json}
+        payload.update({k: v for k, v in (('start', args.start), ('end', args.end)) if v})
+        if args.move:
+            payload['move'] = parse_moves(args.move)
+        if args.cohorts:
+            with open(args.cohorts) as f:
+                payload['cohorts'] = json.load(f)
+        result = post(f"{args.url}/query", payload)
+        print(json.dumps(result, indent=1) if args.json else result['summary'])
+        if result['unresolved']:
+            print(f"Unresolved: {', '.join(result['unresolved'])}")
+        print(f"Baseline {result['baseline']}, window {result['start']} to {result['end']}, {result['elapsed_ms']} ms")
+        return
+
+    tracing.enable(args.trace or tracing.ENABLED)
+    engine = load_engine(args.data_url, args.store)
+    if args.command == 'serve':
+        server = make_server(engine, args.host, args.port)
+        print(f"Serving on {server.url} (GET /query, POST /query, GET /regions, GET /stats)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    else:
+        text = format_load_test(load_test(engine, args.requests, args.concurrency))
+        with open('output/query_service_latency.txt', 'w') as f:
+            f.write(text)
+        print("Latency report saved to output/query_service_latency.txt")
+        print(text)
+    tracing.finish('output/trace_query_service.json')
+
+if __name__ == "__main__":
+    main()
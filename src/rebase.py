@@ -0,0 +1,182 @@
+import argparse
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+from zhvi_loader import fetch_data
+from cohorts import DATA_URL, COHORTS
+from region_index import resolve_cohorts
+from panel import Panel
+from normalize import cohort_reduce
+from render import Chart, render
+import tracing
+from tracing import traced
+
+# Baseline sensitivity via a precomputed log-price cube.
+# log(ZHVI) is taken once for every region and month; cumulative growth from
+# any baseline b to any date e is then expm1(L[:, e] - L[:, b]), so a whole
+# grid of baselines x end dates is one broadcast subtraction followed by the
+# grouped cohort reduction used by the main analysis.
+GRID_CELLS = 1 << 24  # regions x baselines x ends evaluated per block
+
+DEFAULT_BASELINES = ('2019-01', '2020-12')
+DEFAULT_ENDS = ('2021-01', None)
+
+
+class LogCube:
+    def __init__(self, log_values, periods, regions, cohorts):
+        self.log_values = log_values
+        self.periods = periods
+        self.regions = regions
+        self.cohorts = cohorts
+
+    @classmethod
+    @traced("LogCube.from_panel")
+    def from_panel(cls, panel):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            log_values = np.log(panel.values.astype(np.float64))
+        # Non-positive prices would give -inf/NaN; treat them as missing
+        log_values[~np.isfinite(log_values)] = np.nan
+        return cls(log_values, panel.periods, panel.regions, panel.cohorts)
+
+    def save(self, path):
+        np.savez(path, log_values=self.log_values, periods=self.periods.asi8,
+                 regions=np.asarray(self.regions, dtype=object).astype(str),
+                 cohort_codes=self.cohorts.codes, cohort_order=np.asarray(self.cohorts.categories, dtype=str))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            periods = pd.PeriodIndex.from_ordinals(f['periods'], freq='M')
+            regions = pd.Categorical(f['regions'])
+            # Codes, not labels, so regions outside every cohort stay missing (-1)
+            cohorts = pd.Categorical.from_codes(f['cohort_codes'], categories=list(f['cohort_order']))
+            return cls(f['log_values'], periods, regions, cohorts)
+
+    def positions(self, months):
+        """Column index of each month (anything pd.Period accepts); -1 if absent."""
+        return self.periods.get_indexer(pd.PeriodIndex([pd.Period(m, freq='M') for m in months]))
+
+    def require_positions(self, months):
+        """positions(), raising ValueError if any month is not in the data."""
+        pos = self.positions(months)
+        missing = [str(pd.Period(m, freq='M')) for m, i in zip(months, pos) if i < 0]
+        if missing:
+            raise ValueError(f"Months not in data: {', '.join(missing)}")
+        return pos
+
+    def growth(self, baseline, end):
+        """Cumulative % change per region from `baseline` to `end`."""
+        b, e = self.require_positions([baseline, end])
+        return np.expm1(self.log_values[:, e] - self.log_values[:, b]) * 100
+
+
+@traced()
+def cohort_grid(cube, baselines, ends, stats=('mean', 'min', 'max')):
+    """
+    Cohort mean/min/max cumulative growth for every (baseline, end) pair in one
+    vectorized evaluation. End dates before their baseline are left NaN.
+    Returns a long frame: Baseline, End, Cohort, stats...
+    """
+    baselines = pd.PeriodIndex([pd.Period(m, freq='M') for m in baselines], freq='M')
+    ends = pd.PeriodIndex([pd.Period(m, freq='M') for m in ends], freq='M')
+    if not len(baselines) or not len(ends):
+        raise ValueError(f"Empty grid: {len(baselines)} baselines x {len(ends)} end dates (is a range's FIRST after its LAST?)")
+    pos = cube.require_positions(list(baselines) + list(ends))
+    b_pos, e_pos = pos[:len(baselines)], pos[len(baselines):]
+
+    codes = cube.cohorts.codes
+    in_cohort = codes >= 0
+    L, codes = cube.log_values[in_cohort], codes[in_cohort]
+    labels = np.asarray(cube.cohorts.categories, dtype=object)
+    n_b, n_e = len(b_pos), len(e_pos)
+
+    # Blocks of baselines keep the regions x baselines x ends temporary bounded
+    block = max(1, GRID_CELLS // max(1, len(L) * n_e))
+    reduced = {stat: [] for stat in stats}
+    for i in range(0, n_b, block):
+        bb = b_pos[i:i + block]
+        pct = np.expm1(L[:, None, e_pos] - L[:, bb, None]) * 100
+        pct[:, e_pos[None, :] < bb[:, None]] = np.nan
+        groups, out = cohort_reduce(pct.reshape(len(L), -1), codes)
+        for stat in stats:
+            reduced[stat].append(out[stat].reshape(len(groups), len(bb), n_e))
+
+    n_g = len(groups)
+    df = pd.DataFrame({
+        'Baseline': np.tile(np.repeat(baselines.to_timestamp(how='end').normalize(), n_e), n_g),
+        'End': np.tile(ends.to_timestamp(how='end').normalize(), n_g * n_b),
+        'Cohort': np.repeat(labels[groups], n_b * n_e),
+    })
+    for stat in stats:
+        df[stat] = np.concatenate(reduced[stat], axis=1).ravel()
+    return df
+
+
+def gap_matrix(df_grid, cohort_a, cohort_b, stat='mean'):
+    """Baseline x End pivot of cohort_a - cohort_b (percentage points)."""
+    pivot = df_grid.pivot_table(index=['Baseline', 'End'], columns='Cohort', values=stat, dropna=False)
+    return (pivot[cohort_a] - pivot[cohort_b]).unstack('End')
+
+
+def draw_sensitivity(fig, gaps, style):
+    axes = fig.subplots(1, len(gaps), squeeze=False)
+    for ax, ((a, b), gap) in zip(axes[0], gaps):
+        limit = np.nanmax(np.abs(gap.to_numpy()))
+        im = ax.imshow(gap.to_numpy(), aspect='auto', cmap='RdBu_r', vmin=-limit, vmax=limit, origin='lower')
+        ax.set_yticks(range(len(gap.index)))
+        ax.set_yticklabels([d.strftime('%Y-%m') for d in gap.index], fontsize=7)
+        ax.set_xticks(range(0, len(gap.columns), max(1, len(gap.columns) // 8)))
+        ax.set_xticklabels([d.strftime('%Y-%m') for d in gap.columns[::max(1, len(gap.columns) // 8)]],
+                           rotation=45, fontsize=7)
+        ax.set_title(f"{a.split(':')[0]} - {b.split(':')[0]} (pp)")
+        ax.set_xlabel('End Date')
+        ax.set_ylabel('Baseline')
+        fig.colorbar(im, ax=ax, shrink=0.8)
+    fig.suptitle('Baseline Sensitivity: Cohort Mean Growth Gap')
+    fig.tight_layout()
+
+
+@traced()
+def plot_sensitivity(df_grid, pairs, path='output/baseline_sensitivity.png'):
+    gaps = [((a, b), gap_matrix(df_grid, a, b)) for a, b in pairs]
+    render(Chart(path, draw_sensitivity, gaps, {'figsize': (6 * len(pairs), 6)}))
+
+
+def month_range(start, end, periods):
+    end = periods.max() if end is None else pd.Period(end, freq='M')
+    return pd.period_range(pd.Period(start, freq='M'), end, freq='M')
+
+
+def main(baselines=DEFAULT_BASELINES, ends=DEFAULT_ENDS, plots=True):
+    cohort_cities = [city for cities in COHORTS.values() for city in cities]
+    df = fetch_data(DATA_URL, regions=cohort_cities, start=f"{baselines[0]}-01")
+    cohort_map = resolve_cohorts(COHORTS, df['RegionName'].unique())
+    all_found_cities = [city for cities in cohort_map.values() for city in cities]
+    panel = Panel.from_wide(df[df['RegionName'].isin(all_found_cities)], cohort_map)
+
+    cube = LogCube.from_panel(panel)
+    b = month_range(*baselines, cube.periods)
+    e = month_range(*ends, cube.periods)
+    df_grid = cohort_grid(cube, b, e)
+    df_grid.to_csv('output/baseline_sensitivity.csv', index=False)
+    print(f"{len(b)} baselines x {len(e)} end dates saved to output/baseline_sensitivity.csv")
+    if plots:
+        plot_sensitivity(df_grid, list(combinations(COHORTS, 2)))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cohort growth gaps over a grid of baselines and end dates.")
+    parser.add_argument('--baselines', nargs=2, default=DEFAULT_BASELINES, metavar=('FIRST', 'LAST'),
+                        help="Baseline months, e.g. 2019-01 2020-12")
+    parser.add_argument('--ends', nargs=2, default=DEFAULT_ENDS, metavar=('FIRST', 'LAST'),
+                        help="End months (LAST may be 'latest')")
+    parser.add_argument('--no-plots', action='store_true',
+                        help="Write the grid CSV only; never imports matplotlib")
+    parser.add_argument('--trace', action='store_true',
+                        help="Record per-stage wall/CPU time and memory to output/trace_rebase.json")
+    args = parser.parse_args()
+    ends = [None if v in (None, 'latest') else v for v in args.ends]
+    tracing.enable(args.trace or tracing.ENABLED)
+    main(tuple(args.baselines), tuple(ends), plots=not args.no_plots)
+    tracing.finish('output/trace_rebase.json')
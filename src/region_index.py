@@ -0,0 +1,157 @@
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from tracing import traced
+
+# Region resolver shared by the Zillow and Census scripts.
+# Every spelling of a metro (Zillow RegionName, Census NAME) is normalized
+# into hash keys that point at its CBSA code, so resolution is a dict lookup
+# and joins happen on integer codes. The crosswalk holds the cohort metros'
+# historical spellings; every other CBSA comes from the NAME/CBSA pairs in the
+# Census tables fetch_migration_history.py writes (--all-metros, --history).
+# Names always carry a state, so a state or city called "New York" does not
+# resolve to the metro.
+CROSSWALK_CSV = "data/cbsa_crosswalk.csv"
+CENSUS_TABLES = ("data/migration_all_metros_2011_2019.csv", "data/census_history_2011_2024.csv")
+CENSUS_GEO_COL = "metropolitan statistical area/micropolitan statistical area"
+AREA_SUFFIXES = (" metro area", " micro area", " metropolitan statistical area", " micropolitan statistical area")
+
+
+def region_key(name):
+    """
+    Reduces a Zillow/Census area name to (principal city, primary state), e.g.
+    'Bend-Redmond, OR' and 'Bend, OR' both become ('bend', 'or').
+    """
+    city, _, state = str(name).partition(",")
+    city = city.split("-")[0].split("/")[0].strip().lower()
+    state = state.strip().split("-")[0].split(" ")[0].lower()
+    return city, state
+
+
+def _keys(name):
+    full = str(name).strip().lower()
+    for suffix in AREA_SUFFIXES:
+        if full.endswith(suffix):
+            full = full[:-len(suffix)]
+    city, state = region_key(name)
+    return (full, f"{city}|{state}")
+
+
+class RegionIndex:
+    """Normalized name/alias -> CBSA code index."""
+
+    def __init__(self, crosswalk=None):
+        self._codes = {}
+        self.names = {}
+        if crosswalk is not None:
+            for row in crosswalk.itertuples(index=False):
+                aliases = row.Aliases.split("|") if isinstance(row.Aliases, str) else []
+                self.names[int(row.CBSA)] = row.Name
+                for alias in [row.Name] + aliases:
+                    self.add(alias, row.CBSA)
+
+    def add(self, name, code):
+        # First writer wins, so curated crosswalk aliases beat later additions
+        for key in _keys(name):
+            self._codes.setdefault(key, int(code))
+        self.names.setdefault(int(code), str(name))
+
+    def add_many(self, names, codes):
+        for name, code in zip(names, codes):
+            if pd.notna(code):
+                self.add(name, code)
+
+    def extended(self, names, codes):
+        """Copy of the index with (name, code) pairs added, e.g. a Census response's NAMEs; self is unchanged."""
+        index = RegionIndex()
+        index._codes = dict(self._codes)
+        index.names = dict(self.names)
+        index.add_many(names, codes)
+        return index
+
+    def lookup(self, name):
+        """Returns the CBSA code for `name`, or None if it is not indexed."""
+        for key in _keys(name):
+            code = self._codes.get(key)
+            if code is not None:
+                return code
+        return None
+
+    def codes(self, names):
+        """Vectorized lookup: CBSA code per name (-1 where unresolved), one probe per distinct name."""
+        labels, uniques = pd.factorize(pd.Series(names), use_na_sentinel=True)
+        unique_codes = np.array([self.lookup(n) or -1 for n in uniques], dtype=np.int64)
+        out = np.full(len(labels), -1, dtype=np.int64)
+        valid = labels >= 0
+        out[valid] = unique_codes[labels[valid]]
+        return out
+
+    def match(self, targets, available):
+        """
+        Maps each target name to the first `available` name that resolves to
+        the same CBSA. Targets with no counterpart are left out.
+        """
+        available = list(available)
+        by_code = {}
+        for name, code in zip(available, self.codes(available)):
+            if code >= 0:
+                by_code.setdefault(code, name)
+        exact = set(available)
+        matched = {}
+        for target in targets:
+            if target in exact:
+                matched[target] = target
+                continue
+            code = self.lookup(target)
+            if code is not None and code in by_code:
+                matched[target] = by_code[code]
+        return matched
+
+
+def load_index(path=CROSSWALK_CSV, census_tables=CENSUS_TABLES):
+    crosswalk = pd.read_csv(path) if os.path.exists(path) else None
+    index = RegionIndex(crosswalk)
+    for table in census_tables:
+        if os.path.exists(table):
+            names = pd.read_csv(table, usecols=['CBSA', 'NAME']).drop_duplicates('CBSA')
+            index.add_many(names['NAME'], names['CBSA'])
+    return index
+
+
+@lru_cache(maxsize=None)
+def get_index():
+    """
+    Process-wide index built from the bundled crosswalk and any Census tables
+    on disk. Shared and never modified; use extended() to add names.
+    """
+    return load_index()
+
+
+def zillow_cbsa(df):
+    """Zillow RegionID -> CBSA code (-1 where the RegionName is not indexed)."""
+    return pd.Series(get_index().codes(df['RegionName']), index=df['RegionID'].to_numpy(), name='CBSA')
+
+
+@traced()
+def resolve_cohorts(cohorts, available_regions):
+    """
+    Maps {cohort: [city, ...]} onto the region names present in the data,
+    resolving every city in one pass over `available_regions`.
+    """
+    targets = [city for cities in cohorts.values() for city in cities]
+    matched = get_index().match(targets, available_regions)
+    cohort_map = {}
+    for cohort_name, cities in cohorts.items():
+        cohort_map[cohort_name] = []
+        for city in cities:
+            actual_name = matched.get(city)
+            if actual_name is None:
+                print(f"Warning: Could not find region for '{city}'")
+                continue
+            if actual_name != city:
+                print(f"Fuzzy match: '{city}' -> '{actual_name}'")
+            cohort_map[cohort_name].append(actual_name)
+    return cohort_map
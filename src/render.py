@@ -0,0 +1,116 @@
+import hashlib
+import inspect
+import json
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+from tracing import traced
+
+# Chart rendering.
+# A Chart is an output path, a draw(fig, data, style) function, the data it
+# plots and a style spec. Charts are drawn with the object-oriented Agg API
+# (Figure + FigureCanvasAgg): no pyplot state machine, so independent charts
+# render side by side in worker processes. Each chart's key is a hash of its
+# draw function's source, its data and its style; a manifest under
+# data/cache/render/ records the key of the last render of every output, and
+# charts whose key and file are unchanged are skipped.
+MANIFEST = os.path.join(os.environ.get("ZHVI_CACHE_DIR", "data/cache"), "render", "manifest.json")
+
+DEFAULT_STYLE = {'figsize': (12, 8), 'dpi': 100}
+
+COHORT_COLORS = {
+    "Cohort A: Wealth Exporters (The Core)": "tab:blue",
+    "Cohort B: Major Sunbelt Hubs (Urban Importers)": "tab:orange",
+    "Cohort C: Nature Enclaves (Scenic Importers)": "tab:green",
+}
+
+
+def cohort_colors(cohorts):
+    """Color per cohort; cohorts outside the hand-written three (e.g. discovered clusters) take the default cycle."""
+    return {c: COHORT_COLORS.get(c, f"C{i % 10}") for i, c in enumerate(cohorts)}
+
+
+class Chart:
+    def __init__(self, path, draw, data, style=None):
+        self.path = path
+        self.draw = draw
+        self.data = data
+        self.style = {**DEFAULT_STYLE, **(style or {})}
+
+    def key(self):
+        h = hashlib.sha256()
+        h.update(inspect.getsource(self.draw).encode())
+        h.update(pickle.dumps(self.data, protocol=pickle.HIGHEST_PROTOCOL))
+        h.update(json.dumps(self.style, sort_keys=True, default=str).encode())
+        return h.hexdigest()[:32]
+
+
+def draw_chart(chart):
+    """Draws one chart on a fresh Agg figure and writes it (atomically) to chart.path."""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure(figsize=chart.style['figsize'], dpi=chart.style['dpi'])
+    FigureCanvasAgg(fig)
+    chart.draw(fig, chart.data, chart.style)
+    os.makedirs(os.path.dirname(chart.path) or '.', exist_ok=True)
+    fmt = os.path.splitext(chart.path)[1].lstrip('.') or 'png'
+    tmp = f"{chart.path}.{os.getpid()}.tmp"
+    fig.savefig(tmp, format=fmt)
+    os.replace(tmp, chart.path)
+    return chart.path
+
+
+def _load_manifest(path):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
+
+
+def _save_manifest(path, manifest):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+@traced()
+def render_all(charts, workers=None, force=False, manifest_path=None):
+    """
+    Renders every chart whose key changed or whose file is missing and returns
+    the paths drawn. Several stale charts render on a process pool; a single
+    one is drawn inline.
+    """
+    manifest_path = manifest_path or MANIFEST
+    manifest = _load_manifest(manifest_path)
+    todo = []
+    for chart in charts:
+        key = chart.key()
+        target = os.path.abspath(chart.path)
+        if force or manifest.get(target) != key or not os.path.exists(target):
+            todo.append((chart, target, key))
+    if len(charts) > 1 or not todo:
+        print(f"Charts: {len(charts) - len(todo)} unchanged, {len(todo)} to render")
+
+    if len(todo) > 1 and workers != 1:
+        workers = min(workers or os.cpu_count(), len(todo))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            paths = list(executor.map(draw_chart, [chart for chart, _, _ in todo]))
+    else:
+        paths = [draw_chart(chart) for chart, _, _ in todo]
+
+    if todo:
+        # Re-read so concurrent scripts sharing the manifest keep each other's entries
+        manifest = _load_manifest(manifest_path)
+        manifest.update({target: key for _, target, key in todo})
+        _save_manifest(manifest_path, manifest)
+    for path in paths:
+        print(f"Chart saved to {path}")
+    return paths
+
+
+def render(chart, force=False):
+    """Renders a single chart (skipped when unchanged since its last render)."""
+    return render_all([chart], workers=1, force=force)
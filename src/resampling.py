@@ -0,0 +1,193 @@
+import argparse
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+from zhvi_loader import fetch_data
+from cohorts import DATA_URL, COHORTS
+from region_index import resolve_cohorts
+from panel import Panel
+from normalize import pct_change_from_baseline
+import tracing
+from tracing import traced
+
+# Resampling inference for cohort growth gaps.
+# City-level bootstrap (resampling cities within each cohort) gives confidence
+# intervals; permuting cohort labels across the pooled cities gives p-values.
+# Draws are split into chunks of about CHUNK_CELLS resampled cities, each with
+# its own child seed from one SeedSequence, so results are identical for any
+# number of workers (and with no pool at all). Runs smaller than SERIAL_CELLS
+# stay in-process: starting a pool costs more than the draws themselves.
+DEFAULT_DRAWS = 20000
+DEFAULT_SEED = 20200331
+CHUNK_CELLS = 1 << 18  # ~7 ms of draws, well above per-task IPC cost
+SERIAL_CELLS = 1 << 23  # ~0.2 s of draws on one core
+
+
+def city_growth(panel, baseline_date, end_date):
+    """Per-city cumulative % growth from baseline to end, with the cohort label of each city."""
+    pct = pct_change_from_baseline(panel.values, panel.dates, baseline_date)
+    if pct is None:
+        raise ValueError(f"Baseline {pd.Timestamp(baseline_date).date()} not in data")
+    pos = panel.dates.get_indexer([pd.Timestamp(end_date)])[0]
+    if pos < 0:
+        raise ValueError(f"End date {pd.Timestamp(end_date).date()} not in data")
+    values = pct[:, pos]
+    labels = np.asarray(panel.cohorts, dtype=object)
+    keep = ~np.isnan(values) & pd.notna(labels)
+    return values[keep], labels[keep]
+
+
+def _bootstrap_chunk(args):
+    a, b, n_draws, seed = args
+    rng = np.random.default_rng(seed)
+    # Resample cities with replacement within each cohort, all draws at once
+    draws_a = a[rng.integers(0, len(a), size=(n_draws, len(a)))].mean(axis=1)
+    draws_b = b[rng.integers(0, len(b), size=(n_draws, len(b)))].mean(axis=1)
+    return draws_a - draws_b
+
+
+def _permutation_chunk(args):
+    a, b, n_draws, seed = args
+    rng = np.random.default_rng(seed)
+    pooled = np.concatenate([a, b])
+    # Row-wise random permutations of the pooled cities; first len(a) play cohort A
+    perms = np.argsort(rng.random((n_draws, len(pooled))), axis=1)
+    shuffled = pooled[perms]
+    return shuffled[:, :len(a)].mean(axis=1) - shuffled[:, len(a):].mean(axis=1)
+
+
+def chunk_sizes(n_draws, n_cities):
+    """Draws per chunk so each chunk resamples about CHUNK_CELLS cities (draws x cities)."""
+    per_chunk = max(1, CHUNK_CELLS // max(1, n_cities))
+    return [min(per_chunk, n_draws - start) for start in range(0, n_draws, per_chunk)]
+
+
+def _run_chunks(func, a, b, n_draws, seed_seq, executor):
+    sizes = chunk_sizes(n_draws, len(a) + len(b))
+    seeds = seed_seq.spawn(len(sizes))
+    jobs = [(a, b, size, s) for size, s in zip(sizes, seeds)]
+    results = executor.map(func, jobs) if executor else map(func, jobs)
+    return np.concatenate(list(results))
+
+
+def gap_inference(values, labels, cohort_a, cohort_b, n_draws=DEFAULT_DRAWS, seed=DEFAULT_SEED, executor=None):
+    """
+    Mean growth gap (cohort_a - cohort_b) with a bootstrap 95% CI and a
+    two-sided permutation p-value.
+    """
+    a = values[labels == cohort_a]
+    b = values[labels == cohort_b]
+    observed = a.mean() - b.mean()
+    # Independent streams for the two procedures, both derived from `seed`
+    boot_seed, perm_seed = np.random.SeedSequence(seed).spawn(2)
+    boot = _run_chunks(_bootstrap_chunk, a, b, n_draws, boot_seed, executor)
+    perm = _run_chunks(_permutation_chunk, a, b, n_draws, perm_seed, executor)
+    return {
+        'cohort_a': cohort_a,
+        'cohort_b': cohort_b,
+        'gap': observed,
+        'ci_low': np.percentile(boot, 2.5),
+        'ci_high': np.percentile(boot, 97.5),
+        'boot_se': boot.std(ddof=1),
+        'p_value': (1 + np.sum(np.abs(perm) >= abs(observed) - 1e-12)) / (1 + n_draws),
+    }
+
+
+def work_cells(labels, n_draws):
+    """Cities resampled by run_inference: both procedures, every cohort pair."""
+    counts = Counter(labels)
+    return 2 * n_draws * sum(counts[a] + counts[b] for a, b in combinations(sorted(counts), 2))
+
+
+def inference_pool(cells, workers=None):
+    """Process pool for `cells` of resampling work, or a null context (run inline) below SERIAL_CELLS."""
+    if workers == 1 or cells < SERIAL_CELLS:
+        return nullcontext()
+    return ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+
+
+@traced()
+def run_inference(values, labels, n_draws=DEFAULT_DRAWS, seed=DEFAULT_SEED, workers=None, executor=None):
+    """
+    All pairwise cohort gaps. Returns (results frame, draws per second).
+    Chunks go to `executor` when given (the caller owns it); otherwise a pool
+    is started only if the work is above SERIAL_CELLS.
+    """
+    cohorts = sorted(set(labels))
+    start = time.perf_counter()
+    rows = []
+    with nullcontext(executor) if executor else inference_pool(work_cells(labels, n_draws), workers) as pool:
+        for i, (a, b) in enumerate(combinations(cohorts, 2)):
+            rows.append(gap_inference(values, labels, b, a, n_draws, seed + i, pool))
+    elapsed = time.perf_counter() - start
+    # Each pair runs a bootstrap and a permutation test
+    rate = 2 * n_draws * len(rows) / elapsed
+    return pd.DataFrame(rows), rate
+
+
+def format_results(title, df_results, n_draws, seed):
+    text = f"""
+    {title}
+    {'=' * len(title)}
+    {n_draws} bootstrap / permutation draws per pair, seed {seed}
+    """
+    for r in df_results.itertuples():
+        text += (f"\n    {r.cohort_a}\n      vs {r.cohort_b}:"
+                 f"\n      - Gap: {r.gap:+.2f} pp (95% CI {r.ci_low:+.2f} to {r.ci_high:+.2f}, bootstrap SE {r.boot_se:.2f})"
+                 f"\n      - Permutation p-value: {r.p_value:.4f}\n")
+    return text
+
+
+def generate_inference(panel, n_draws=DEFAULT_DRAWS, seed=DEFAULT_SEED, workers=None, path='output/inference_results.txt',
+                       executor=None):
+    """
+    Headline (Mar 2020 -> latest) and pre-trend (Jan 2010 -> Dec 2019) gap
+    inference. Both share `executor`, or one pool sized to their total work.
+    """
+    latest = panel.dates.max()
+    specs = [
+        (f"HEADLINE GAPS (2020-03-31 to {latest.strftime('%Y-%m-%d')})", '2020-03-31', latest),
+        ("PRE-TREND GAPS (2010-01-31 to 2019-12-31)", '2010-01-31', '2019-12-31'),
+    ]
+    growth = [(title, *city_growth(panel, baseline, end)) for title, baseline, end in specs]
+    cells = sum(work_cells(labels, n_draws) for _, _, labels in growth)
+    text = ""
+    with nullcontext(executor) if executor else inference_pool(cells, workers) as pool:
+        for title, values, labels in growth:
+            df_results, rate = run_inference(values, labels, n_draws, seed, workers, pool)
+            print(f"{title}: {rate:,.0f} draws/sec")
+            text += format_results(title, df_results, n_draws, seed)
+    with open(path, 'w') as f:
+        f.write(text)
+    print(f"Inference results saved to {path}")
+    print(text)
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bootstrap and permutation inference for cohort gaps.")
+    parser.add_argument('--draws', type=int, default=DEFAULT_DRAWS)
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--trace', action='store_true',
+                        help="Record per-stage wall/CPU time and memory to output/trace_inference.json")
+    args = parser.parse_args()
+    tracing.enable(args.trace or tracing.ENABLED)
+
+    cohort_cities = [city for cities in COHORTS.values() for city in cities]
+    df = fetch_data(DATA_URL, regions=cohort_cities, start='2010-01-01')
+    cohort_map = resolve_cohorts(COHORTS, df['RegionName'].unique())
+    all_found_cities = [city for cities in cohort_map.values() for city in cities]
+    panel = Panel.from_wide(df[df['RegionName'].isin(all_found_cities)], cohort_map)
+    generate_inference(panel, args.draws, args.seed, args.workers)
+    tracing.finish('output/trace_inference.json')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+import argparse
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from zhvi_loader import fetch_data
+from cohorts import DATA_URL, COHORTS
+from region_index import resolve_cohorts
+from panel import Panel
+from normalize import pct_change_from_baseline
+from panel_store import share_array, attach_array
+from render import Chart, render
+import tracing
+from tracing import traced
+
+# Synthetic control for the Nature Enclaves.
+# Each treated metro's cumulative growth path (indexed to the last pre-2020
+# month) is matched on the pre-period by a convex combination of non-cohort
+# donor metros: min ||y - Y0 w||^2 s.t. w >= 0, sum(w) = 1, solved by
+# accelerated projected gradient on the simplex. Solves run on a process pool
+# whose workers map the outcome matrix from one shared file, and each solution is
+# cached under data/cache/synth/ keyed by a hash of its inputs, so re-runs and
+# overlapping placebo sets only solve what changed.
+TREATED_COHORT = "Cohort C: Nature Enclaves (Scenic Importers)"
+PRE_START = '2010-01'
+PRE_END = '2019-12'
+CACHE_DIR = os.path.join(os.environ.get("ZHVI_CACHE_DIR", "data/cache"), "synth")
+MAX_ITER = 20000
+TOL = 1e-7
+
+_outcomes = None
+
+
+def project_simplex(v):
+    """Euclidean projection of v onto {w >= 0, sum(w) = 1}."""
+    u = np.sort(v)[::-1]
+    css = np.cumsum(u) - 1
+    rho = np.flatnonzero(u > css / np.arange(1, len(v) + 1))[-1]
+    return np.maximum(v - css[rho] / (rho + 1), 0)
+
+
+def solve_weights(y, Y0, max_iter=MAX_ITER, tol=TOL):
+    """
+    Donor weights minimizing the pre-period squared error (FISTA on the simplex
+    with adaptive restart). Gradients use the k x k Gram matrix or the months x k
+    outcomes, whichever is cheaper. Stops once the Frank-Wolfe duality gap, an
+    upper bound on the excess error, is below tol * ||y||^2.
+    Returns (weights, iterations).
+    """
+    T, k = Y0.shape
+    if k <= 2 * T:
+        G, c = Y0.T @ Y0, Y0.T @ y
+        gradient = lambda v: G @ v - c
+    else:
+        gradient = lambda v: Y0.T @ (Y0 @ v - y)
+    step = 1 / max(np.linalg.norm(Y0, 2) ** 2, 1e-12)
+    bound = tol * max(y @ y, 1e-12)
+    w = np.full(k, 1 / k)
+    z, t = w, 1.0
+    for i in range(1, max_iter + 1):
+        w_next = project_simplex(z - step * gradient(z))
+        if (z - w_next) @ (w_next - w) > 0:
+            # Momentum is pointing uphill: restart from the last iterate
+            z, t = w, 1.0
+            continue
+        t_next = (1 + np.sqrt(1 + 4 * t * t)) / 2
+        z = w_next + ((t - 1) / t_next) * (w_next - w)
+        w, t = w_next, t_next
+        if i % 10 == 0:
+            g = 2 * gradient(w)
+            if g @ w - g.min() < bound:
+                return w, i
+    return w, max_iter
+
+
+def solve_key(y, Y0, max_iter=MAX_ITER, tol=TOL):
+    h = hashlib.sha256()
+    h.update(np.ascontiguousarray(y, dtype=np.float64).tobytes())
+    h.update(np.ascontiguousarray(Y0, dtype=np.float64).tobytes())
+    h.update(f"{Y0.shape}|{max_iter}|{tol}".encode())
+    return h.hexdigest()
+
+
+def _init_worker(path):
+    global _outcomes
+    # Mapped read-only from the panel store: every worker shares one copy
+    _outcomes = attach_array(path)
+
+
+def _solve_job(job):
+    target, donors = job
+    # Pre-period outcomes are mapped in the worker; only column indices are sent per job
+    y, Y0 = _outcomes[:, target], _outcomes[:, donors]
+    return solve_weights(y, Y0)[0]
+
+
+@traced()
+def solve_all(pre, jobs, workers=None, cache_dir=None):
+    """
+    Solves every (target column, donor columns) job against the pre-period
+    matrix `pre` (months x units). Cached solutions are reused; the rest run on
+    a process pool. Returns a list of weight vectors in job order.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+    results, todo = [None] * len(jobs), []
+    for i, (target, donors) in enumerate(jobs):
+        path = os.path.join(cache_dir, solve_key(pre[:, target], pre[:, donors]) + ".npy")
+        if os.path.exists(path):
+            results[i] = np.load(path)
+        else:
+            todo.append((i, path))
+    print(f"Synthetic control: {len(jobs) - len(todo)} cached, {len(todo)} to solve")
+
+    if todo:
+        pending = [jobs[i] for i, _ in todo]
+        workers = workers or os.cpu_count()
+        shared = share_array(pre)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(shared,)) as executor:
+            solved = executor.map(_solve_job, pending, chunksize=max(1, len(pending) // (4 * workers)))
+            for (i, path), w in zip(todo, solved):
+                results[i] = w
+                tmp = f"{path}.{os.getpid()}.tmp.npy"
+                np.save(tmp, w)
+                os.replace(tmp, path)
+    return results
+
+
+def build_outcomes(panel, pre_start=PRE_START, pre_end=PRE_END):
+    """
+    Cumulative % growth since `pre_end` for every metro with a complete series
+    from `pre_start`. Isolated missing months inside a series are filled by
+    linear interpolation. Returns (outcomes months x regions, periods, region
+    names, cohort labels).
+    """
+    panel = panel.window(start=pre_start)
+    baseline = pd.Period(pre_end, freq='M').to_timestamp(how='end').normalize()
+    values = pd.DataFrame(panel.values).interpolate(axis=1, limit_area='inside').to_numpy()
+    pct = pct_change_from_baseline(values, panel.dates, baseline)
+    if pct is None:
+        raise ValueError(f"Baseline {baseline.date()} not in data")
+    complete = ~np.isnan(pct).any(axis=1)
+    names = panel.region_names[complete]
+    labels = np.asarray(panel.cohorts, dtype=object)[complete]
+    return pct[complete].T, panel.periods, names, labels
+
+
+@traced()
+def run_synth(panel, treated_cohort=TREATED_COHORT, placebos=True, workers=None, cache_dir=None,
+              pre_start=PRE_START, pre_end=PRE_END):
+    """
+    Fits a synthetic control for every treated metro (and, with `placebos`,
+    for every donor against the remaining donors). Returns (weights frame,
+    gap frame, fit summary frame).
+    """
+    outcomes, periods, names, labels = build_outcomes(panel, pre_start, pre_end)
+    is_pre = periods <= pd.Period(pre_end, freq='M')
+    treated = np.flatnonzero(labels == treated_cohort)
+    # Donors never belong to any cohort, so no treated or comparison cohort leaks in
+    donors = np.flatnonzero(pd.isna(labels))
+    if len(treated) == 0 or len(donors) < 2:
+        raise ValueError(f"Need treated metros and at least two donors (got {len(treated)} / {len(donors)})")
+    print(f"{len(treated)} treated metros, {len(donors)} donors, {is_pre.sum()} pre-period months")
+
+    jobs = [(t, donors) for t in treated]
+    if placebos:
+        jobs += [(d, donors[donors != d]) for d in donors]
+    start = time.perf_counter()
+    weights = solve_all(np.ascontiguousarray(outcomes[is_pre]), jobs, workers, cache_dir)
+    print(f"Solved {len(jobs)} donor-weight problems in {time.perf_counter() - start:.1f}s")
+
+    weight_rows, gaps, fits = [], [], []
+    dates = periods.to_timestamp(how='end').normalize()
+    for (target, pool), w in zip(jobs, weights):
+        gap = outcomes[:, target] - outcomes[:, pool] @ w
+        pre_rmspe = np.sqrt(np.mean(gap[is_pre] ** 2))
+        post_rmspe = np.sqrt(np.mean(gap[~is_pre] ** 2))
+        is_treated = labels[target] == treated_cohort
+        fits.append({'RegionName': names[target], 'treated': is_treated, 'pre_rmspe': pre_rmspe,
+                     'post_rmspe': post_rmspe, 'ratio': post_rmspe / pre_rmspe,
+                     'post_gap': gap[~is_pre].mean(), 'final_gap': gap[-1]})
+        gaps.append(pd.DataFrame({'RegionName': names[target], 'treated': is_treated, 'Date': dates, 'gap': gap}))
+        if is_treated:
+            top = np.flatnonzero(w > 1e-4)
+            weight_rows += [{'RegionName': names[target], 'Donor': names[pool[j]], 'weight': w[j]} for j in top]
+
+    df_fit = pd.DataFrame(fits)
+    # Placebo-in-space p-value: share of donors whose post/pre RMSPE ratio is at least the treated one
+    placebo_ratio = df_fit.loc[~df_fit['treated'], 'ratio'].to_numpy()
+    if len(placebo_ratio):
+        df_fit['p_value'] = [(1 + np.sum(placebo_ratio >= r)) / (1 + len(placebo_ratio)) for r in df_fit['ratio']]
+    df_weights = pd.DataFrame(weight_rows).sort_values(['RegionName', 'weight'], ascending=[True, False])
+    return df_weights, pd.concat(gaps, ignore_index=True), df_fit
+
+
+def format_results(df_fit, pre_end=PRE_END):
+    treated = df_fit[df_fit['treated']]
+    n_placebo = int((~df_fit['treated']).sum())
+    text = f"""
+    SYNTHETIC CONTROL: {TREATED_COHORT}
+    {'=' * (19 + len(TREATED_COHORT))}
+    Outcome: cumulative % change since {pre_end}; weights fit on the pre-period
+    Placebo-in-space: {n_placebo} donor metros
+    """
+    for r in treated.itertuples():
+        text += (f"\n    {r.RegionName}:\n      - Pre RMSPE {r.pre_rmspe:.2f}, post RMSPE {r.post_rmspe:.2f} (ratio {r.ratio:.1f})"
+                 f"\n      - Mean post gap {r.post_gap:+.2f} pp, latest {r.final_gap:+.2f} pp")
+        if 'p_value' in treated.columns:
+            text += f"\n      - Placebo p-value: {r.p_value:.4f}"
+        text += "\n"
+    text += f"\n    Cohort average latest gap: {treated['final_gap'].mean():+.2f} pp\n"
+    return text
+
+
+def draw_synth(fig, df_gaps, style):
+    ax = fig.subplots()
+    placebo = df_gaps[~df_gaps['treated']]
+    for _, g in placebo.groupby('RegionName', sort=False):
+        ax.plot(g['Date'], g['gap'], color='gray', alpha=0.15, linewidth=0.8)
+    for name, g in df_gaps[df_gaps['treated']].groupby('RegionName', sort=False):
+        ax.plot(g['Date'], g['gap'], linewidth=2, label=name)
+    ax.axhline(0, color='black', linewidth=0.8)
+    ax.axvline(pd.Period(PRE_END, freq='M').to_timestamp(how='end'), color='red', linestyle=':', alpha=0.5)
+    ax.set_title('Synthetic Control: Nature Enclaves vs. Donor Metros (gray: placebos)')
+    ax.set_ylabel('Treated - Synthetic (pp, cumulative % change)')
+    ax.set_xlabel('Year')
+    ax.legend(fontsize=8)
+    ax.grid(True, alpha=0.3)
+    fig.tight_layout()
+
+
+@traced()
+def plot_synth(df_gaps, df_fit, path='output/synth_control.png', max_pre_ratio=5.0):
+    # Placebos with poor pre-period fit are hidden (Abadie et al. convention)
+    cutoff = max_pre_ratio * df_fit.loc[df_fit['treated'], 'pre_rmspe'].max()
+    good = set(df_fit.loc[df_fit['pre_rmspe'] <= cutoff, 'RegionName'])
+    shown = df_gaps[df_gaps['treated'] | df_gaps['RegionName'].isin(good)]
+    render(Chart(path, draw_synth, shown[['RegionName', 'Date', 'gap', 'treated']].reset_index(drop=True)))
+
+
+def load_panel(start=PRE_START):
+    df = fetch_data(DATA_URL, start=f"{start}-01")
+    if 'RegionType' in df.columns:
+        df = df[df['RegionType'] != 'country']
+    return Panel.from_wide(df, resolve_cohorts(COHORTS, df['RegionName'].unique()))
+
+
+def main(placebos=True, workers=None, plots=True):
+    panel = load_panel()
+    print(panel.report())
+    df_weights, df_gaps, df_fit = run_synth(panel, placebos=placebos, workers=workers)
+    df_weights.to_csv('output/synth_control_weights.csv', index=False)
+    df_gaps[df_gaps['treated']].drop(columns='treated').to_csv('output/synth_control_gaps.csv', index=False)
+    text = format_results(df_fit)
+    with open('output/synth_control_results.txt', 'w') as f:
+        f.write(text)
+    print("Synthetic control results saved to output/synth_control_results.txt")
+    print(text)
+    if plots:
+        plot_synth(df_gaps, df_fit)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic control for the Nature Enclave metros.")
+    parser.add_argument('--no-placebos', action='store_true', help="Skip the placebo-in-space runs")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--no-plots', action='store_true',
+                        help="Write the weights, gaps and results only; never imports matplotlib")
+    parser.add_argument('--trace', action='store_true',
+                        help="Record per-stage wall/CPU time and memory to output/trace_synth.json")
+    args = parser.parse_args()
+    tracing.enable(args.trace or tracing.ENABLED)
+    main(placebos=not args.no_placebos, workers=args.workers, plots=not args.no_plots)
+    tracing.finish('output/trace_synth.json')
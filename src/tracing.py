@@ -0,0 +1,154 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Lightweight per-stage instrumentation for the analysis scripts.
+# Functions decorated with @traced (or blocks wrapped in `with span(...)`)
+# record wall time, CPU time, peak RSS and the row/column count of their
+# result. Nothing is recorded unless tracing is enabled (--trace on the
+# scripts, or ZHVI_TRACE=1); when disabled a traced call costs one flag check.
+# finish() writes the events as a Chrome trace (chrome://tracing, Perfetto).
+ENABLED = os.environ.get("ZHVI_TRACE", "") not in ("", "0")
+
+_events = []
+_t0 = time.perf_counter()
+
+
+def enable(on=True):
+    global ENABLED
+    ENABLED = on
+
+
+def reset():
+    global _t0
+    _events.clear()
+    _t0 = time.perf_counter()
+
+
+def _peak_rss():
+    """Process peak resident set size in bytes (None where unavailable)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _shape(result):
+    if isinstance(result, tuple) and result:
+        result = result[0]
+    shape = getattr(result, "shape", None)
+    if shape is None:
+        return {}
+    out = {"rows": int(shape[0])} if len(shape) > 0 else {}
+    if len(shape) > 1:
+        out["cols"] = int(shape[1])
+    return out
+
+
+class _Span:
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.rss_before = _peak_rss()
+        self.cpu = time.process_time()
+        self.start = time.perf_counter()
+        return self
+
+    def record(self, result):
+        """Attaches the row/column count of `result` to the span."""
+        self.args.update(_shape(result))
+        return result
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        args = dict(self.args)
+        args["cpu_ms"] = round((time.process_time() - self.cpu) * 1000, 3)
+        rss = _peak_rss()
+        if rss is not None:
+            args["peak_rss_mb"] = round(rss / 2**20, 1)
+            args["rss_growth_mb"] = round((rss - self.rss_before) / 2**20, 1)
+        _events.append({
+            "name": self.name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+            "ts": (self.start - _t0) * 1e6, "dur": (end - self.start) * 1e6, "args": args,
+        })
+        return False
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def record(self, result):
+        return result
+
+
+_NULL = _NullSpan()
+
+
+def span(name, **args):
+    """Context manager timing a block; `.record(result)` adds its shape."""
+    return _Span(name, args) if ENABLED else _NULL
+
+
+def traced(name=None):
+    """Decorator recording a span per call, named after the function by default."""
+    def wrap(func):
+        # Scripts run as __main__ are labelled by file name, e.g. analysis_zoom_hierarchy
+        module = func.__module__
+        main_file = getattr(sys.modules.get(module), "__file__", None)
+        if module == "__main__" and main_file:
+            module = os.path.splitext(os.path.basename(main_file))[0]
+        label = name or f"{module}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            with _Span(label, {}) as s:
+                return s.record(func(*args, **kwargs))
+        return wrapper
+    return wrap
+
+
+def summary():
+    """Per-name totals: calls, wall s, CPU s, max peak RSS (MB)."""
+    totals = {}
+    for e in _events:
+        t = totals.setdefault(e["name"], {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_rss_mb": 0.0})
+        t["calls"] += 1
+        t["wall_s"] += e["dur"] / 1e6
+        t["cpu_s"] += e["args"]["cpu_ms"] / 1000
+        t["peak_rss_mb"] = max(t["peak_rss_mb"], e["args"].get("peak_rss_mb", 0.0))
+    return totals
+
+
+def export(path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"traceEvents": sorted(_events, key=lambda e: e["ts"]), "displayTimeUnit": "ms"}, f)
+
+
+def finish(path):
+    """Writes the trace to `path` and prints the per-stage table (no-op when disabled)."""
+    if not ENABLED:
+        return
+    export(path)
+    print("\nTRACE (wall / CPU / peak RSS)")
+    print("=============================")
+    for name, t in sorted(summary().items(), key=lambda kv: -kv[1]["wall_s"]):
+        print(f"  {name:<56} {t['calls']:>4}x {t['wall_s']:8.3f}s {t['cpu_s']:8.3f}s {t['peak_rss_mb']:8.1f} MB")
+    print(f"Trace saved to {path}")
@@ -0,0 +1,253 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import zhvi_cache
+from zhvi_loader import fetch_data
+from cohorts import COHORTS
+from region_index import get_index
+from panel import Panel
+from normalize import pct_change_from_baseline, cohort_reduce
+from render import Chart, render, cohort_colors
+import tracing
+from tracing import traced
+
+# Batch mode over ZHVI variants (price tiers, single-family / condo, state,
+# county and ZIP files) listed in a manifest. Each file is fetched and parsed
+# on its own worker process (through the shared download cache). The parsed
+# variants are stacked into one regions x months matrix on a common month axis.
+# Names are resolved to cohorts once for the union of all files; county and
+# ZIP rows resolve through their Metro column. State rows are never resolved:
+# a state named like a cohort city ("New York") is not that metro. The whole matrix is normalized
+# to the baseline in one broadcast, and a single grouped reduction gives the
+# variant x cohort x date cube. Every variant also gets an "All regions"
+# group, which is the only group for state files.
+MANIFEST = "data/zhvi_variants.json"
+ALL_REGIONS = "All regions"
+STATS = ('mean', 'min', 'max')
+
+
+def load_manifest(path=MANIFEST):
+    with open(path) as f:
+        manifest = json.load(f)
+    names = [v['name'] for v in manifest['variants']]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate variant names in {path}")
+    return manifest
+
+
+def _init_worker(lock):
+    # Workers share the download cache, so its index updates take one lock
+    zhvi_cache.set_lock(lock)
+
+
+def _load_variant(job):
+    url, start = job
+    df = fetch_data(url, start=start)
+    if 'RegionType' in df.columns:
+        df = df[df['RegionType'] != 'country']
+    return Panel.from_wide(df)
+
+
+@traced()
+def fetch_variants(variants, start=None, workers=None):
+    """Fetches and parses every variant concurrently; returns one Panel per variant, in manifest order."""
+    jobs = [(v['url'], start) for v in variants]
+    workers = min(workers or os.cpu_count(), len(jobs))
+    if workers <= 1:
+        return [_load_variant(job) for job in jobs]
+    ctx = mp.get_context()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=_init_worker, initargs=(ctx.Lock(),)) as executor:
+        return list(executor.map(_load_variant, jobs))
+
+
+@traced()
+def resolve_variants(panels, cohorts=COHORTS, geographies=None):
+    """
+    Cohort number per row of every panel (-1: none). Each distinct name is
+    resolved once across all variants: exact cohort names first, then CBSA.
+    Panels whose manifest geography is 'state' get -1 throughout.
+    """
+    index = get_index()
+    by_name, by_code = {}, {}
+    for i, cities in enumerate(cohorts.values()):
+        for city in cities:
+            by_name.setdefault(city, i)
+            code = index.lookup(city)
+            if code is not None:
+                by_code.setdefault(code, i)
+
+    # County and ZIP rows belong to the metro named in their Metro column
+    geographies = geographies or [None] * len(panels)
+    lookups = [np.asarray(p.meta['Metro'] if 'Metro' in p.meta.columns else p.region_names, dtype=object)
+               for p, geo in zip(panels, geographies) if geo != 'state']
+    names = pd.Index(pd.unique(np.concatenate(lookups))) if lookups else pd.Index([])
+    codes = index.codes(names)
+    labels = np.array([by_name.get(n, by_code.get(c, -1)) for n, c in zip(names, codes)], dtype=np.int64)
+    out, resolved = [], iter(lookups)
+    for p, geo in zip(panels, geographies):
+        if geo == 'state':
+            out.append(np.full(len(p.values), -1, dtype=np.int64))
+        else:
+            out.append(labels[names.get_indexer(next(resolved))])
+    return out
+
+
+@traced()
+def stack_variants(panels):
+    """(values, periods, variant number per row): every panel on the union of their months."""
+    periods = pd.PeriodIndex(sorted(set().union(*(p.periods for p in panels))), freq='M')
+    values = np.full((sum(len(p.values) for p in panels), len(periods)), np.nan, dtype=np.float32)
+    variant = np.repeat(np.arange(len(panels)), [len(p.values) for p in panels])
+    row = 0
+    for p in panels:
+        values[row:row + len(p.values), periods.get_indexer(p.periods)] = p.values
+        row += len(p.values)
+    return values, periods, variant
+
+
+@traced()
+def build_cube(values, dates, variant, cohort, n_variants, n_cohorts, baseline):
+    """
+    {stat: variants x (cohorts + all) x dates} of cumulative % change since
+    `baseline`, plus the region count of each group. The last cohort slot is
+    every region of the variant.
+    """
+    pct = pct_change_from_baseline(values, dates, baseline)
+    if pct is None:
+        raise ValueError(f"Baseline {pd.Timestamp(baseline).date()} not in data")
+    n_groups = n_cohorts + 1
+    labelled = cohort >= 0
+    # Cohort rows, then every row again for its variant's "All regions" group
+    codes = np.r_[variant[labelled] * n_groups + cohort[labelled], variant * n_groups + n_cohorts]
+    groups, reduced = cohort_reduce(np.vstack([pct[labelled], pct]), codes)
+    cube = {}
+    for stat in STATS:
+        flat = np.full((n_variants * n_groups, len(dates)), np.nan)
+        flat[groups] = reduced[stat]
+        cube[stat] = flat.reshape(n_variants, n_groups, len(dates))
+    counts = np.bincount(codes, minlength=n_variants * n_groups).reshape(n_variants, n_groups)
+    return cube, counts
+
+
+def cube_frame(cube, counts, variants, cohorts, dates):
+    """Long (Variant, Cohort, Date, mean, min, max, n) view of the cube, empty groups dropped."""
+    n_variants, n_groups, n_dates = cube['mean'].shape
+    df = pd.DataFrame({
+        'Variant': np.repeat(variants, n_groups * n_dates),
+        'Cohort': np.tile(np.repeat(cohorts, n_dates), n_variants),
+        'Date': np.tile(dates.to_numpy(), n_variants * n_groups),
+    })
+    for stat in STATS:
+        df[stat] = cube[stat].ravel()
+    df['n'] = np.repeat(counts.ravel(), n_dates)
+    return df[df['n'] > 0].reset_index(drop=True)
+
+
+def latest_means(df_cube):
+    """Variant x cohort table of each group's most recent mean."""
+    last = df_cube.dropna(subset=['mean']).sort_values('Date').groupby(['Variant', 'Cohort'], sort=False).last()
+    return last['mean'].unstack('Cohort')
+
+
+def format_report(manifest, df_cube, variants, cohorts):
+    table = latest_means(df_cube).reindex(index=variants, columns=cohorts)
+    text = f"""
+    ZHVI VARIANT BATCH
+    ==================
+    Variants: {len(variants)}; baseline {pd.Timestamp(manifest['baseline']).strftime('%b %Y')}
+    Latest cumulative % change (mean across regions):
+    """
+    text += "\n" + "\n".join("    " + line for line in table.round(2).to_string().splitlines()) + "\n"
+    for a, b in manifest.get('spreads', []):
+        if a not in table.index or b not in table.index:
+            continue
+        text += f"\n    Spread {a} - {b} (pp):\n"
+        for cohort, gap in (table.loc[a] - table.loc[b]).dropna().items():
+            text += f"      - {cohort}: {gap:+.2f}\n"
+    return text
+
+
+def draw_cube(fig, df_cube, style):
+    variants = style['variants']
+    cols = min(4, len(variants))
+    axes = fig.subplots(-(-len(variants) // cols), cols, squeeze=False).ravel()
+    for ax, variant in zip(axes, variants):
+        sub = df_cube[df_cube['Variant'] == variant]
+        for cohort, color in style['colors'].items():
+            s = sub[sub['Cohort'] == cohort]
+            if not s.empty:
+                ax.plot(s['Date'], s['mean'], color=color, linewidth=1.5, label=cohort)
+        ax.axhline(0, color='black', linewidth=0.6)
+        ax.set_title(variant, fontsize=9)
+        ax.tick_params(labelsize=7)
+        ax.grid(True, alpha=0.3)
+    for ax in axes[len(variants):]:
+        ax.set_axis_off()
+    handles, labels = axes[0].get_legend_handles_labels()
+    fig.legend(handles, labels, loc='lower center', ncol=len(labels), fontsize=8)
+    fig.suptitle(style['title'])
+    fig.tight_layout(rect=(0, 0.05, 1, 1))
+
+
+@traced()
+def plot_cube(df_cube, variants, cohorts, baseline, path='output/zhvi_variants.png'):
+    colors = {**cohort_colors(cohorts[:-1]), ALL_REGIONS: 'gray'}
+    rows = -(-len(variants) // min(4, len(variants)))
+    style = {'variants': list(variants), 'colors': colors, 'figsize': (16, 3.5 * rows + 0.8),
+             'title': f"Cohort Mean Cumulative % Change by ZHVI Variant (Baseline: {baseline.strftime('%b %Y')})"}
+    render(Chart(path, draw_cube, df_cube[['Variant', 'Cohort', 'Date', 'mean']], style))
+
+
+@traced()
+def run_batch(manifest, workers=None, cohorts=COHORTS):
+    """Returns (cube, counts, variant names, cohort names incl. all, dates)."""
+    variants = manifest['variants']
+    panels = fetch_variants(variants, manifest.get('start'), workers)
+    labels = resolve_variants(panels, cohorts, [v.get('geography') for v in variants])
+    for v, p, lab in zip(variants, panels, labels):
+        print(f"{v['name']}: {len(p.values)} regions, {int((lab >= 0).sum())} in a cohort")
+    values, periods, variant = stack_variants(panels)
+    del panels
+    dates = periods.to_timestamp(how='end').normalize()
+    cube, counts = build_cube(values, dates, variant, np.concatenate(labels),
+                              len(variants), len(cohorts), manifest['baseline'])
+    names = [v['name'] for v in variants]
+    return cube, counts, names, list(cohorts) + [ALL_REGIONS], dates
+
+
+def main(manifest_path=MANIFEST, workers=None, plots=True):
+    manifest = load_manifest(manifest_path)
+    cube, counts, variants, cohorts, dates = run_batch(manifest, workers)
+    np.savez_compressed('output/zhvi_variants_cube.npz', variants=np.array(variants), cohorts=np.array(cohorts),
+                        dates=dates.to_numpy(), counts=counts, **cube)
+    df_cube = cube_frame(cube, counts, variants, cohorts, dates)
+    df_cube.to_csv('output/zhvi_variants_cube.csv', index=False)
+    print("Cube saved to output/zhvi_variants_cube.npz and output/zhvi_variants_cube.csv")
+
+    text = format_report(manifest, df_cube, variants, cohorts)
+    with open('output/zhvi_variants_summary.txt', 'w') as f:
+        f.write(text)
+    print("Summary saved to output/zhvi_variants_summary.txt")
+    print(text)
+    if plots:
+        plot_cube(df_cube, variants, cohorts, pd.Timestamp(manifest['baseline']))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Variant x cohort x date cube over a manifest of ZHVI files.")
+    parser.add_argument('--manifest', default=MANIFEST)
+    parser.add_argument('--workers', type=int, default=None, help="Fetch/parse processes (default: all cores)")
+    parser.add_argument('--no-plots', action='store_true',
+                        help="Write the cube and summary only; never imports matplotlib")
+    parser.add_argument('--trace', action='store_true',
+                        help="Record per-stage wall/CPU time and memory to output/trace_zhvi_batch.json")
+    args = parser.parse_args()
+    tracing.enable(args.trace or tracing.ENABLED)
+    main(args.manifest, args.workers, plots=not args.no_plots)
+    tracing.finish('output/trace_zhvi_batch.json')
@@ -0,0 +1,256 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+import pandas as pd
+
+from tracing import traced
+
+# Local snapshot cache for parsed Zillow/Census frames.
+#
+# Parsed frames are pickled under blobs/ and named by the SHA-256 of the raw
+# payload (plus the parse variant), so identical downloads share one blob.
+# index.json maps each (url, variant) to its blob and the validators
+# (ETag / Last-Modified, or mtime/size for local files) used to revalidate it.
+CACHE_DIR = os.environ.get("ZHVI_CACHE_DIR", "data/cache")
+CACHE_MAX_BYTES = int(os.environ.get("ZHVI_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+
+# Directory of fixture files to serve instead of the network (matched on the
+# URL's file name), and a switch to trust cached copies without revalidating.
+FIXTURE_DIR = os.environ.get("ZHVI_FIXTURE_DIR")
+OFFLINE = os.environ.get("ZHVI_OFFLINE", "") not in ("", "0")
+
+INDEX_FILE = "index.json"
+STAT_KEYS = ("hits", "misses", "revalidated", "stale", "evictions")
+
+# Guards every read-modify-write of index.json. Threads share this lock;
+# process pools that fetch concurrently hand their workers a
+# multiprocessing.Lock through set_lock().
+_lock = threading.Lock()
+
+
+def set_lock(lock):
+    global _lock
+    _lock = lock
+
+
+class _HashingReader:
+    """File-like wrapper that hashes every byte read through it."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.sha = hashlib.sha256()
+        self.nbytes = 0
+
+    def read(self, size=-1):
+        chunk = self.raw.read(size)
+        self.sha.update(chunk)
+        self.nbytes += len(chunk)
+        return chunk
+
+    def drain(self):
+        while self.read(1 << 20):
+            pass
+        return self.sha.hexdigest()
+
+
+@traced()
+def _read_csv(stream):
+    return pd.read_csv(stream)
+
+
+def _load_index(cache_dir):
+    path = os.path.join(cache_dir, INDEX_FILE)
+    if os.path.exists(path):
+        with open(path) as f:
+            index = json.load(f)
+    else:
+        index = {"entries": {}, "stats": {}}
+    for k in STAT_KEYS:
+        index["stats"].setdefault(k, 0)
+    return index
+
+
+def _save_index(cache_dir, index):
+    # Write-then-rename so concurrent readers never see a partial index
+    path = os.path.join(cache_dir, INDEX_FILE)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp, path)
+
+
+def _update_index(cache_dir, change):
+    # Reloaded under the lock, so concurrent fetches never drop each other's entries
+    with _lock:
+        index = _load_index(cache_dir)
+        change(index)
+        _save_index(cache_dir, index)
+
+
+def _blob_path(cache_dir, blob):
+    return os.path.join(cache_dir, "blobs", f"{blob}.pkl")
+
+
+def _local_path(url):
+    """Returns a filesystem path if the url points at a local file or fixture."""
+    parsed = urlparse(url)
+    if parsed.scheme == "file":
+        return url2pathname(parsed.path)
+    if parsed.scheme == "" and os.path.exists(url):
+        return url
+    if FIXTURE_DIR:
+        candidate = os.path.join(FIXTURE_DIR, os.path.basename(parsed.path))
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def _evict(cache_dir, index, max_bytes, keep):
+    # Least-recently-used eviction; blobs are shared, so only count each once
+    def total_bytes():
+        blobs = {e["blob"]: e["size"] for e in index["entries"].values()}
+        return sum(blobs.values())
+
+    order = sorted(index["entries"], key=lambda k: index["entries"][k]["last_used"])
+    for key in order:
+        if total_bytes() <= max_bytes:
+            break
+        if key == keep:
+            continue
+        entry = index["entries"].pop(key)
+        index["stats"]["evictions"] += 1
+        if not any(e["blob"] == entry["blob"] for e in index["entries"].values()):
+            try:
+                os.remove(_blob_path(cache_dir, entry["blob"]))
+            except FileNotFoundError:
+                pass
+
+
+def _write_blob(cache_dir, variant, df, digest):
+    blob = hashlib.sha256(f"{digest}\0{variant}".encode()).hexdigest()
+    path = _blob_path(cache_dir, blob)
+    if not os.path.exists(path):
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        df.to_pickle(tmp)
+        os.replace(tmp, path)
+    return blob
+
+
+def _store(cache_dir, index, key, url, variant, blob, validators, max_bytes):
+    path = _blob_path(cache_dir, blob)
+    index["entries"][key] = {
+        "url": url,
+        "variant": variant,
+        "blob": blob,
+        "size": os.path.getsize(path),
+        "last_used": time.time(),
+        **validators,
+    }
+    _evict(cache_dir, index, max_bytes, keep=key)
+
+
+@traced()
+def cached_fetch(url, parse=_read_csv, variant="", cache_dir=None, max_bytes=None):
+    """
+    Returns the parsed frame for `url`, reusing the on-disk snapshot when the
+    source has not changed.
+    `parse` receives a binary file-like stream and returns a DataFrame; callers
+    that parse the same url differently must pass a distinct `variant` string.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    os.makedirs(os.path.join(cache_dir, "blobs"), exist_ok=True)
+
+    index = _load_index(cache_dir)
+    key = hashlib.sha256(f"{url}\0{variant}".encode()).hexdigest()
+    entry = index["entries"].get(key)
+    if entry and not os.path.exists(_blob_path(cache_dir, entry["blob"])):
+        entry = None
+
+    def hit(stat):
+        def touch(index):
+            index["stats"][stat] += 1
+            if key in index["entries"]:
+                index["entries"][key]["last_used"] = time.time()
+        _update_index(cache_dir, touch)
+        return pd.read_pickle(_blob_path(cache_dir, entry["blob"]))
+
+    local = _local_path(url)
+    if local:
+        st = os.stat(local)
+        validators = {"etag": f"{st.st_mtime_ns}-{st.st_size}", "last_modified": None}
+        if entry and entry.get("etag") == validators["etag"]:
+            print(f"Cache hit: {url}")
+            return hit("hits")
+        print(f"Cache miss: {url} (reading {local})")
+        with open(local, "rb") as f:
+            reader = _HashingReader(f)
+            df = parse(reader)
+            digest = reader.drain()
+    else:
+        if entry and OFFLINE:
+            print(f"Cache hit (offline): {url}")
+            return hit("hits")
+
+        # Only network fetches pay for importing requests
+        import requests
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            r = requests.get(url, headers=headers, stream=True, timeout=60)
+            r.raise_for_status()
+        except requests.RequestException as e:
+            if entry:
+                print(f"Warning: revalidation failed ({e}); using cached copy of {url}")
+                return hit("stale")
+            raise
+
+        if r.status_code == 304:
+            r.close()
+            print(f"Cache hit (not modified): {url}")
+            return hit("revalidated")
+
+        print(f"Cache miss: {url}")
+        validators = {
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+        }
+        r.raw.decode_content = True
+        with r:
+            reader = _HashingReader(r.raw)
+            df = parse(reader)
+            digest = reader.drain()
+
+    blob = _write_blob(cache_dir, variant, df, digest)
+
+    def store(index):
+        index["stats"]["misses"] += 1
+        _store(cache_dir, index, key, url, variant, blob, validators, max_bytes)
+    _update_index(cache_dir, store)
+    return df
+
+
+def cache_stats(cache_dir=None):
+    """Returns hit/miss counters plus the current entry count and size on disk."""
+    cache_dir = cache_dir or CACHE_DIR
+    index = _load_index(cache_dir)
+    blobs = {e["blob"]: e["size"] for e in index["entries"].values()}
+    stats = dict(index["stats"])
+    stats["entries"] = len(index["entries"])
+    stats["bytes"] = sum(blobs.values())
+    lookups = stats["hits"] + stats["revalidated"] + stats["stale"] + stats["misses"]
+    stats["hit_rate"] = (lookups - stats["misses"]) / lookups if lookups else 0.0
+    return stats
+
+
+if __name__ == "__main__":
+    for k, v in cache_stats().items():
+        print(f"{k}: {v}")
@@ -0,0 +1,108 @@
+import codecs
+import csv
+import hashlib
+import re
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from zhvi_cache import cached_fetch
+from region_index import region_key, get_index
+from tracing import traced
+
+# Zillow files are wide: a handful of id columns followed by one column per month
+DATE_COL = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+CHUNK_SIZE = 1 << 16
+
+
+def _iter_lines(stream, chunk_size=CHUNK_SIZE):
+    # Decode the byte stream incrementally and yield one text line at a time
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        pending += decoder.decode(chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def _wanted_matcher(regions):
+    if regions is None:
+        return lambda name: True
+    index = get_index()
+    names = set(regions)
+    keys = {region_key(r) for r in names}
+    codes = {index.lookup(r) for r in names} - {None}
+    # Superset filter: exact names, anything sharing a principal city/state, or
+    # the same CBSA, so aliases ('Bend, OR' -> 'Bend-Redmond, OR') survive the pushdown
+    return lambda name: name in names or region_key(name) in keys or index.lookup(name) in codes
+
+
+@traced()
+def parse_zhvi(stream, regions=None, start=None, end=None, region_col="RegionName"):
+    """
+    Parses a wide ZHVI CSV from a binary stream, keeping only rows whose
+    `region_col` matches `regions` and month columns between `start` and `end`.
+    Rows are filtered as they are read, so memory follows the selection size.
+    """
+    reader = csv.reader(_iter_lines(stream))
+    header = next(reader)
+
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    id_idx, date_idx = [], []
+    for i, col in enumerate(header):
+        if not DATE_COL.match(col):
+            id_idx.append(i)
+            continue
+        d = pd.Timestamp(col)
+        if (start is None or d >= start) and (end is None or d <= end):
+            date_idx.append(i)
+    region_pos = header.index(region_col)
+    wanted = _wanted_matcher(regions)
+
+    ids, values = [], []
+    for row in reader:
+        if not row or not wanted(row[region_pos]):
+            continue
+        ids.append([row[i] for i in id_idx])
+        values.append(np.array([row[i] or "nan" for i in date_idx], dtype=float))
+
+    df_ids = pd.DataFrame(ids, columns=[header[i] for i in id_idx])
+    for col in df_ids.columns:
+        df_ids[col] = df_ids[col].replace("", np.nan)
+        try:
+            df_ids[col] = pd.to_numeric(df_ids[col])
+        except (ValueError, TypeError):
+            pass
+    values = np.vstack(values) if values else np.empty((0, len(date_idx)))
+    df_vals = pd.DataFrame(values, columns=[header[i] for i in date_idx])
+    return pd.concat([df_ids, df_vals], axis=1)
+
+
+@traced()
+def load_zhvi(url, regions=None, start=None, end=None, region_col="RegionName"):
+    """Streams `url` through parse_zhvi, caching the selected frame on disk."""
+    regions = sorted(set(regions)) if regions is not None else None
+    spec = repr((regions, str(start), str(end), region_col))
+    variant = "select:" + hashlib.sha256(spec.encode()).hexdigest()[:16]
+    parse = partial(parse_zhvi, regions=regions, start=start, end=end, region_col=region_col)
+    return cached_fetch(url, parse=parse, variant=variant)
+
+
+@traced()
+def fetch_data(url, regions=None, start=None, end=None):
+    print(f"Fetching data from {url}...")
+    # Served from the local snapshot cache when the upstream file is unchanged
+    if regions is None and start is None and end is None:
+        return cached_fetch(url)
+    # Push the region/date selection into the parser instead of loading every metro
+    return load_zhvi(url, regions=regions, start=start, end=end)
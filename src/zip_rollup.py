@@ -0,0 +1,346 @@
+import argparse
+import hashlib
+import os
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from zhvi_cache import cached_fetch
+from zhvi_loader import DATE_COL
+from cohorts import COHORTS
+from region_index import get_index, resolve_cohorts
+from panel import Panel
+from normalize import pct_change_from_baseline, aggregate_cohorts
+from analysis_zoom_hierarchy import format_summary, hierarchy_chart
+from render import render
+import tracing
+from tracing import traced
+
+# Out-of-core ZIP -> metro rollup.
+# The ZIP-level ZHVI file is streamed in blocks of CHUNK_ROWS rows, and each
+# block is folded into running per-metro sums. Memory depends on the number of
+# metros and months, not on the number of ZIPs.
+# ZIPs map to CBSAs through a crosswalk with housing-stock weights (see
+# load_crosswalk). A ZIP split across metros counts in each metro in
+# proportion. Each metro series is the weighted mean of its ZIPs' growth since
+# the baseline, scaled to their weighted baseline price. Cohorts then weight
+# each metro by its housing stock, so New York outweighs Bozeman. Within-metro
+# dispersion comes from weighted histograms of ZIP log growth to the latest
+# month. Histograms add up, so metro quantiles fill in one block at a time
+# and cohort quantiles are sums of metro histograms.
+ZIP_URL = "https://files.zillowstatic.com/research/public_csvs/zhvi/Zip_zhvi_uc_sfrcondo_tier_0.33_0.67_sm_sa_month.csv"
+CROSSWALK = "data/zip_cbsa_crosswalk.csv"
+BASELINE = pd.Timestamp('2020-03-31')
+CHUNK_ROWS = 2000
+
+# Log growth since the baseline, in 0.5% wide bins; values outside the range land in the end bins
+LOG_RANGE = (-1.0, 1.5)
+LOG_BINS = 500
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+# HUD codes ZIPs outside every CBSA as 99999
+NO_CBSA = 99999
+
+
+@traced()
+def load_crosswalk(path=CROSSWALK):
+    """
+    ZIP -> CBSA pairs with a housing-stock weight, from HUD's USPS ZIP-CBSA
+    crosswalk (columns ZIP, CBSA, RES_RATIO) plus an optional HousingUnits
+    column (ACS B25001 by ZCTA). Weight is RES_RATIO x HousingUnits; either
+    missing counts as 1. Returns None when the file does not exist.
+    """
+    if not os.path.exists(path):
+        return None
+    xw = pd.read_csv(path, dtype={'ZIP': str})
+    ratio = xw['RES_RATIO'] if 'RES_RATIO' in xw.columns else 1.0
+    units = xw['HousingUnits'] if 'HousingUnits' in xw.columns else 1.0
+    xw = pd.DataFrame({'ZIP': xw['ZIP'].str.zfill(5), 'CBSA': pd.to_numeric(xw['CBSA'], errors='coerce'),
+                       'Weight': ratio * units})
+    xw = xw[xw['CBSA'].notna() & (xw['CBSA'] != NO_CBSA) & (xw['Weight'] > 0)]
+    xw = xw.astype({'CBSA': np.int64, 'Weight': np.float64})
+    # Share of the ZIP's stock in this metro; only majority pairs name a metro after the ZIP's Metro column
+    xw['Share'] = xw['Weight'] / xw.groupby('ZIP')['Weight'].transform('sum')
+    return xw.reset_index(drop=True)
+
+
+# What each ZIP's weight measures, by crosswalk contents (see weight_basis):
+# (report line, what the cohort means weight each metro by)
+WEIGHT_BASES = {
+    'housing': ("housing units x RES_RATIO from the ZIP crosswalk", "its housing stock"),
+    'ratio': ("RES_RATIO from the ZIP crosswalk (no HousingUnits column)", "its RES_RATIO-weighted ZIP count, not housing stock"),
+    'equal': ("equal per ZIP (no crosswalk)", "its number of ZIPs, not housing stock"),
+}
+
+
+def weight_basis(path=CROSSWALK):
+    """Key into WEIGHT_BASES for the crosswalk at `path`."""
+    if not os.path.exists(path):
+        return 'equal'
+    return 'housing' if 'HousingUnits' in pd.read_csv(path, nrows=0).columns else 'ratio'
+
+
+class ZipRollup:
+    """Running per-metro sums over ZIP rows, keyed by CBSA code (or Metro name without a crosswalk)."""
+
+    def __init__(self, periods, base_pos):
+        self.periods = periods
+        self.base_pos = base_pos
+        self.rows = {}
+        self.keys, self.names = [], []
+        n = len(periods)
+        self.ratio_sums = np.zeros((0, n))
+        self.ratio_weights = np.zeros((0, n))
+        self.base_sums = np.zeros(0)
+        self.stock = np.zeros(0)
+        self.zips = np.zeros(0, dtype=np.int64)
+        self.hist = np.zeros((0, LOG_BINS))
+        self.unmapped = 0
+        self.no_baseline = 0
+
+    def _rows(self, keys, names):
+        # A metro keeps the first name it is given (None until a majority ZIP names it)
+        n_old = len(self.keys)
+        for k, n in zip(keys, names):
+            row = self.rows.get(k)
+            if row is None:
+                self.rows[k] = len(self.keys)
+                self.keys.append(k)
+                self.names.append(n)
+            elif self.names[row] is None:
+                self.names[row] = n
+        m = len(self.keys) - n_old
+        if m:
+            self.ratio_sums = np.vstack([self.ratio_sums, np.zeros((m, len(self.periods)))])
+            self.ratio_weights = np.vstack([self.ratio_weights, np.zeros((m, len(self.periods)))])
+            self.base_sums = np.r_[self.base_sums, np.zeros(m)]
+            self.stock = np.r_[self.stock, np.zeros(m)]
+            self.zips = np.r_[self.zips, np.zeros(m, dtype=np.int64)]
+            self.hist = np.vstack([self.hist, np.zeros((m, LOG_BINS))])
+        return np.array([self.rows[k] for k in keys], dtype=np.int64)
+
+    def add(self, keys, names, values, weights):
+        """Folds one block of (metro key, metro name, ZIP price row, weight) into the sums."""
+        rows = self._rows(keys, names)
+        np.add.at(self.stock, rows, weights)
+        base = values[:, self.base_pos]
+        ok = base > 0
+        self.no_baseline += int((~ok).sum())
+        rows, values, weights, base = rows[ok], values[ok], weights[ok], base[ok]
+
+        ratio = values / base[:, None]
+        valid = np.isfinite(ratio)
+        np.add.at(self.ratio_sums, rows, np.where(valid, ratio * weights[:, None], 0.0))
+        np.add.at(self.ratio_weights, rows, valid * weights[:, None])
+        np.add.at(self.base_sums, rows, base * weights)
+        np.add.at(self.zips, rows, 1)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            growth = np.log(ratio[:, -1])
+        seen = np.isfinite(growth)
+        lo, hi = LOG_RANGE
+        bins = np.clip(((growth[seen] - lo) / (hi - lo) * LOG_BINS).astype(np.int64), 0, LOG_BINS - 1)
+        np.add.at(self.hist, (rows[seen], bins), weights[seen])
+
+    def frame(self):
+        """Wide metro frame (Zillow layout plus HousingStock/ZipCount); the histograms ride in attrs."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            base_level = self.base_sums / self.ratio_weights[:, self.base_pos]
+            levels = base_level[:, None] * self.ratio_sums / self.ratio_weights
+        keys = np.asarray(self.keys, dtype=object)
+        names = _metro_names(keys, self.names)
+        codes = (np.array([k if isinstance(k, (int, np.integer)) else -1 for k in keys], dtype=np.int64)
+                 if len(keys) else np.zeros(0, dtype=np.int64))
+        if (codes < 0).any():
+            codes = np.where(codes < 0, get_index().codes(names), codes)
+        ids = pd.DataFrame({
+            'RegionID': codes,
+            'RegionName': names,
+            'RegionType': 'msa',
+            'HousingStock': self.stock,
+            'ZipCount': self.zips,
+        })
+        dates = self.periods.to_timestamp(how='end').normalize().strftime('%Y-%m-%d')
+        df = pd.concat([ids, pd.DataFrame(levels, columns=dates)], axis=1)
+        df.attrs.update({'growth_hist': self.hist, 'unmapped': self.unmapped, 'no_baseline': self.no_baseline})
+        return df
+
+
+def _metro_names(keys, metros):
+    # The ZIP file's Metro column where available, then the CBSA index, then the bare code
+    if all(isinstance(m, str) for m in metros):
+        return list(metros)
+    index = get_index()
+    return [m if isinstance(m, str) else index.names.get(int(k), f"CBSA {k}") for k, m in zip(keys, metros)]
+
+
+@traced()
+def rollup_stream(stream, crosswalk=None, baseline=BASELINE, chunk_rows=CHUNK_ROWS):
+    """
+    Streams a wide ZIP ZHVI CSV in blocks of `chunk_rows` and returns the
+    weighted metro frame. Without a crosswalk, ZIPs go to the metro in their
+    Metro column with equal weights.
+    """
+    rollup = None
+    for chunk in pd.read_csv(stream, chunksize=chunk_rows, dtype={'RegionName': str, 'Metro': str}):
+        if rollup is None:
+            date_cols = [c for c in chunk.columns if DATE_COL.match(c)]
+            periods = pd.PeriodIndex(date_cols, freq='M')
+            base_pos = periods.get_indexer([pd.Period(baseline, freq='M')])[0]
+            if base_pos < 0:
+                raise ValueError(f"Baseline {pd.Timestamp(baseline).date()} not in data")
+            rollup = ZipRollup(periods, base_pos)
+        values = chunk[date_cols].to_numpy(dtype=np.float64)
+        metros = chunk['Metro'].to_numpy(dtype=object) if 'Metro' in chunk.columns else np.full(len(chunk), None)
+
+        if crosswalk is None:
+            mapped = pd.notna(metros)
+            keys = metros[mapped]
+            rollup.add(list(keys), list(keys), values[mapped], np.ones(int(mapped.sum())))
+        else:
+            pairs = pd.DataFrame({'ZIP': chunk['RegionName'].str.zfill(5).to_numpy(), 'row': np.arange(len(chunk))})
+            pairs = pairs.merge(crosswalk, on='ZIP', how='inner')
+            mapped = np.zeros(len(chunk), dtype=bool)
+            mapped[pairs['row'].to_numpy()] = True
+            rows, codes = pairs['row'].to_numpy(), pairs['CBSA'].to_numpy()
+            names = [m if isinstance(m, str) else None
+                     for m in np.where(pairs['Share'].to_numpy() >= 0.5, metros[rows], None)]
+            rollup.add([int(c) for c in codes], names, values[rows], pairs['Weight'].to_numpy())
+        rollup.unmapped += int((~mapped).sum())
+    if rollup is None:
+        raise ValueError("ZIP file has no rows")
+    return rollup.frame()
+
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+@traced()
+def fetch_rollup(url=ZIP_URL, crosswalk_path=CROSSWALK, baseline=BASELINE, chunk_rows=CHUNK_ROWS):
+    """Metro frame rolled up from the ZIP file, cached per (ZIP file, crosswalk, baseline, bins)."""
+    crosswalk = load_crosswalk(crosswalk_path)
+    if crosswalk is None:
+        print(f"No ZIP crosswalk at {crosswalk_path}; using the ZIP file's Metro column with equal weights")
+    print(f"Streaming ZIP data from {url} ({chunk_rows} rows per block)...")
+    spec = repr((_file_digest(crosswalk_path) if crosswalk is not None else None,
+                 str(pd.Timestamp(baseline).date()), LOG_RANGE, LOG_BINS))
+    variant = "zip_rollup:" + hashlib.sha256(spec.encode()).hexdigest()[:16]
+    parse = partial(rollup_stream, crosswalk=crosswalk, baseline=baseline, chunk_rows=chunk_rows)
+    return cached_fetch(url, parse=parse, variant=variant)
+
+
+def hist_quantiles(hist, qs=QUANTILES):
+    """Weighted quantiles (as % change) per histogram row, interpolated linearly within a bin."""
+    lo, hi = LOG_RANGE
+    width = (hi - lo) / LOG_BINS
+    cum = np.cumsum(hist, axis=1)
+    total = cum[:, -1]
+    r = np.arange(len(hist))
+    out = np.full((len(hist), len(qs)), np.nan)
+    for j, q in enumerate(qs):
+        target = q * total
+        k = np.minimum((cum < target[:, None]).sum(axis=1), LOG_BINS - 1)
+        before = np.where(k > 0, cum[r, np.maximum(k - 1, 0)], 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            frac = np.clip(np.where(hist[r, k] > 0, (target - before) / hist[r, k], 0.0), 0, 1)
+        out[:, j] = np.expm1(lo + (k + frac) * width) * 100
+    out[total <= 0] = np.nan
+    return out
+
+
+@traced()
+def aggregate(df_metro, baseline=BASELINE):
+    """
+    (panel, weighted df_agg, unweighted df_agg) over the cohort metros: the
+    same Date/Cohort/mean/min/max frame process_and_aggregate returns.
+    """
+    cohort_map = resolve_cohorts(COHORTS, df_metro['RegionName'].unique())
+    panel = Panel.from_wide(df_metro, cohort_map)
+    print(panel.report())
+    pct = pct_change_from_baseline(panel.values, panel.dates, baseline)
+    weights = panel.meta['HousingStock'].to_numpy()
+    df_agg = aggregate_cohorts(pct, panel.cohorts, panel.dates, weights=weights)
+    df_unweighted = aggregate_cohorts(pct, panel.cohorts, panel.dates)
+    return panel, df_agg, df_unweighted
+
+
+def metro_quantiles(panel, hist):
+    """Per-metro ZIP growth quantiles to the latest month, with housing stock and ZIP counts."""
+    q = hist_quantiles(hist)
+    df = pd.DataFrame({
+        'CBSA': panel.meta['RegionID'].to_numpy(),
+        'RegionName': panel.region_names,
+        'Cohort': np.asarray(panel.cohorts, dtype=object),
+        'HousingStock': panel.meta['HousingStock'].to_numpy(),
+        'ZipCount': panel.meta['ZipCount'].to_numpy(),
+    })
+    for j, level in enumerate(QUANTILES):
+        df[f'P{int(level * 100)}'] = q[:, j]
+    df['IQR'] = df['P75'] - df['P25']
+    return df
+
+
+def format_report(df_metro, df_agg, df_unweighted, df_q, hist, basis):
+    latest = df_agg['Date'].max()
+    text = f"""
+    ZIP-TO-METRO ROLLUP
+    ===================
+    {int(df_metro['ZipCount'].sum())} ZIPs with a baseline value in {len(df_metro)} metros; \
+{df_metro.attrs['unmapped']} ZIPs without a metro, {df_metro.attrs['no_baseline']} metro ZIP rows without a baseline value
+    Weights: {WEIGHT_BASES[basis][0]}
+    Cohort means below weight each metro by {WEIGHT_BASES[basis][1]}.
+    """
+    text += format_summary(df_agg)
+
+    unweighted = df_unweighted[df_unweighted['Date'] == latest].set_index('Cohort')['mean']
+    text += f"\n    Within-cohort ZIP growth {BASELINE.strftime('%b %Y')} to {latest.strftime('%b %Y')} ({'weighted' if basis != 'equal' else 'per-ZIP'} quantiles):\n"
+    for cohort in COHORTS:
+        members = (df_q['Cohort'] == cohort).to_numpy()
+        if not members.any():
+            continue
+        p = hist_quantiles(hist[members].sum(axis=0, keepdims=True))[0]
+        text += (f"\n    {cohort}:\n      - Unweighted metro mean: {unweighted.get(cohort, np.nan):.2f}%\n"
+                 f"      - ZIP P10 / P50 / P90: {p[0]:.2f}% / {p[2]:.2f}% / {p[4]:.2f}%\n")
+        for row in df_q[members].sort_values('HousingStock', ascending=False).itertuples():
+            text += (f"      - {row.RegionName}: median {row.P50:.2f}%, IQR {row.IQR:.2f} pp"
+                     f" ({row.ZipCount} ZIPs)\n")
+    return text
+
+
+def main(url=ZIP_URL, crosswalk_path=CROSSWALK, chunk_rows=CHUNK_ROWS, plots=True):
+    df_metro = fetch_rollup(url, crosswalk_path, chunk_rows=chunk_rows)
+    hist = df_metro.attrs['growth_hist']
+    panel, df_agg, df_unweighted = aggregate(df_metro)
+
+    df_metro.assign(Cohort=np.asarray(panel.cohorts, dtype=object)).to_csv('output/zip_metro_rollup.csv', index=False)
+    df_q = metro_quantiles(panel, hist)
+    df_q.to_csv('output/zip_metro_quantiles.csv', index=False)
+    print("Metro rollup saved to output/zip_metro_rollup.csv and output/zip_metro_quantiles.csv")
+
+    text = format_report(df_metro, df_agg, df_unweighted, df_q, hist, weight_basis(crosswalk_path))
+    with open('output/zip_cohort_summary.txt', 'w') as f:
+        f.write(text)
+    print("Summary saved to output/zip_cohort_summary.txt")
+    print(text)
+    if plots:
+        render(hierarchy_chart(df_agg, path='output/zip_weighted_hierarchy.png'))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Housing-stock weighted metro/cohort rollup of the ZIP-level ZHVI file.")
+    parser.add_argument('--url', default=ZIP_URL)
+    parser.add_argument('--crosswalk', default=CROSSWALK, help="ZIP-CBSA crosswalk (ZIP, CBSA, RES_RATIO[, HousingUnits])")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help="ZIP rows held in memory at a time")
+    parser.add_argument('--no-plots', action='store_true',
+                        help="Write the rollup and summary only; never imports matplotlib")
+    parser.add_argument('--trace', action='store_true',
+                        help="Record per-stage wall/CPU time and memory to output/trace_zip_rollup.json")
+    args = parser.parse_args()
+    tracing.enable(args.trace or tracing.ENABLED)
+    main(args.url, args.crosswalk, args.chunk_rows, plots=not args.no_plots)
+    tracing.finish('output/trace_zip_rollup.json')
@@ -0,0 +1,147 @@
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from region_index import resolve_cohorts
+from panel import Panel
+from normalize import pct_change_from_baseline, aggregate_cohorts
+from tracing import traced
+
+# Incremental update mode for analysis_zoom_hierarchy.
+# The normalized panel and per-cohort aggregates from the last run are kept in
+# STATE_PATH. On the next run only newly published month columns are
+# normalized and aggregated; regions whose history Zillow restated are
+# detected by comparing the overlapping months and recomputed on their own.
+# The loader still reads every month from 2018 on: revision detection needs
+# the full overlap, so only the normalize/aggregate work is saved. Outputs
+# (cohort_summary.txt, the chart) are rewritten whole unless nothing changed.
+STATE_PATH = os.path.join(os.environ.get("ZHVI_CACHE_DIR", "data/cache"), "zoom_state.pkl")
+BASELINE_DATE = pd.Timestamp('2020-03-31')
+STATS = ['mean', 'min', 'max']
+
+# Differences below this (in dollars) are treated as float noise, not revisions
+REVISION_ATOL = 1e-6
+
+
+def load_state(path=STATE_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def save_state(state, path=STATE_PATH):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + '.tmp', path)
+
+
+def build_state(regions, dates, values, cohorts):
+    """Full computation of the normalized panel and aggregates."""
+    pct = pct_change_from_baseline(values, dates, BASELINE_DATE)
+    if pct is None:
+        raise ValueError(f"Baseline {BASELINE_DATE.date()} not in data")
+    return {
+        'regions': np.asarray(regions),
+        'cohorts': list(cohorts),
+        'dates': dates,
+        'values': values,
+        'pct': pct,
+        'df_agg': aggregate_cohorts(pct, cohorts, dates, stats=STATS),
+    }
+
+
+def revised_rows(old_values, new_values):
+    """Boolean mask of regions whose already-published months changed upstream."""
+    same = np.isclose(old_values, new_values, rtol=0, atol=REVISION_ATOL)
+    same |= np.isnan(old_values) & np.isnan(new_values)
+    return ~same.all(axis=1)
+
+
+def update_state(state, regions, dates, values, cohorts):
+    """
+    Advances `state` to the current panel. Returns (state, changes) where
+    changes['mode'] is 'full', 'incremental' or 'unchanged'.
+    """
+    n_old = len(state['dates'])
+    same_layout = (
+        np.array_equal(state['regions'], np.asarray(regions))
+        and state['cohorts'] == list(cohorts)
+        and len(dates) >= n_old
+        and dates[:n_old].equals(state['dates'])
+    )
+    if not same_layout:
+        # Cohort membership or the date axis itself moved: nothing to reuse
+        return build_state(regions, dates, values, cohorts), {'mode': 'full', 'new_months': list(dates), 'revised': list(regions)}
+
+    revised = revised_rows(state['values'], values[:, :n_old])
+    new_dates = dates[n_old:]
+    changes = {'new_months': list(new_dates), 'revised': list(np.asarray(regions)[revised])}
+    if not revised.any() and len(new_dates) == 0:
+        changes['mode'] = 'unchanged'
+        return state, changes
+    changes['mode'] = 'incremental'
+
+    base_pos = dates.get_indexer([BASELINE_DATE])[0]
+    base = values[:, base_pos:base_pos + 1].astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pct_new = ((values[:, n_old:] - base) / base) * 100
+    pct = np.hstack([state['pct'], pct_new])
+
+    df_agg = state['df_agg']
+    if revised.any():
+        # Targeted recompute: only revised regions' history and their cohorts' aggregates
+        pct[revised, :n_old] = pct_change_from_baseline(values[revised], dates, BASELINE_DATE)[:, :n_old]
+        affected = sorted({c for c, r in zip(cohorts, revised) if r})
+        rows = np.isin(np.asarray(cohorts, dtype=object), affected)
+        redone = aggregate_cohorts(pct[rows, :n_old], np.asarray(cohorts, dtype=object)[rows], state['dates'], stats=STATS)
+        df_agg = pd.concat([df_agg[~df_agg['Cohort'].isin(affected)], redone])
+
+    if len(new_dates):
+        appended = aggregate_cohorts(pct[:, n_old:], cohorts, new_dates, stats=STATS)
+        df_agg = pd.concat([df_agg, appended])
+    df_agg = df_agg.sort_values(['Date', 'Cohort'], kind='stable').reset_index(drop=True)
+
+    return {
+        'regions': np.asarray(regions),
+        'cohorts': list(cohorts),
+        'dates': dates,
+        'values': values,
+        'pct': pct,
+        'df_agg': df_agg,
+    }, changes
+
+
+@traced()
+def run_incremental(df, cohorts_def, path=STATE_PATH):
+    """
+    Brings the persisted Zoom Town state up to date with `df`.
+    Returns (df_agg, changes).
+    """
+    cohort_map = resolve_cohorts(cohorts_def, df['RegionName'].unique())
+    all_found_cities = [city for cities in cohort_map.values() for city in cities]
+    panel = Panel.from_wide(df[df['RegionName'].isin(all_found_cities)], cohort_map)
+    regions, dates, values, cohorts = panel.region_names, panel.dates, panel.values, panel.cohorts
+
+    state = load_state(path)
+    if state is None:
+        state, changes = build_state(regions, dates, values, cohorts), {'mode': 'full', 'new_months': list(dates), 'revised': list(regions)}
+    else:
+        state, changes = update_state(state, regions, dates, values, cohorts)
+
+    if changes['mode'] == 'incremental':
+        print(f"Incremental update: {len(changes['new_months'])} new month(s), "
+              f"{len(changes['revised'])} revised region(s)")
+        for region in changes['revised']:
+            print(f"  Upstream revision detected for {region}")
+    elif changes['mode'] == 'full':
+        print("No reusable state; computed full history")
+    else:
+        print("No new months or revisions since last run")
+
+    if changes['mode'] != 'unchanged':
+        save_state(state, path)
+    return state['df_agg'], changes
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+# The analysis modules are flat scripts under src/, imported the same way the
+# benchmarks import them
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    # Scripts resolve data/ and output/ against the working directory
+    monkeypatch.chdir(ROOT)
@@ -0,0 +1,62 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import census_fetch
+from census_fetch import CensusFetchError, combine_vintages, fetch_json, redact
+from mock_server import serve
+
+PATH = "/data/2019/pep/components"
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(census_fetch, "BACKOFF_BASE", 0.0)
+
+
+def _payload(rate):
+    return json.dumps([["NAME", "RNETMIG"], ["Bend-Redmond, OR Metro Area", rate]]).encode(), "application/json"
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_transient_errors_are_retried_then_cached(tmp_path, status):
+    with serve({PATH: _payload("12.5")}, failures={PATH: 2}, failure_status=status) as server:
+        url = f"{server.url}{PATH}?get=NAME,RNETMIG"
+        assert fetch_json(url, cache_dir=str(tmp_path))[1][1] == "12.5"
+        assert fetch_json(url, cache_dir=str(tmp_path))[1][1] == "12.5"
+        assert len(server.requests) == 3
+
+
+def test_cached_response_is_kept_until_refresh(tmp_path):
+    routes = {PATH: _payload("12.5")}
+    with serve(routes) as server:
+        url = f"{server.url}{PATH}"
+        fetch_json(url, cache_dir=str(tmp_path))
+        routes[PATH] = _payload("13.0")
+        assert fetch_json(url, cache_dir=str(tmp_path))[1][1] == "12.5"
+        assert fetch_json(url, cache_dir=str(tmp_path), refresh=True)[1][1] == "13.0"
+
+
+def test_giving_up_does_not_leak_the_api_key(tmp_path):
+    with serve({PATH: _payload("12.5")}, failures={PATH: 10}) as server:
+        with pytest.raises(CensusFetchError) as error:
+            fetch_json(f"{server.url}{PATH}?get=NAME&key=s3cret", cache_dir=str(tmp_path), retries=1)
+        assert len(server.requests) == 2
+    assert "s3cret" not in str(error.value)
+    assert "key=REDACTED" in str(error.value)
+    assert redact("ConnectionError(url: /x?key=abc&get=NAME)") == "ConnectionError(url: /x?key=REDACTED&get=NAME)"
+
+
+def test_newest_vintage_wins_per_variable():
+    old = pd.DataFrame({'CBSA': [13460, 13460], 'NAME': ["Bend, OR"] * 2, 'Year': [2019, 2020],
+                        'Vintage': 2019, 'RNETMIG': [10.0, 11.0], 'POP': [190000.0, 195000.0]})
+    new = pd.DataFrame({'CBSA': [13460], 'NAME': ["Bend-Redmond, OR"], 'Year': [2020],
+                        'Vintage': 2024, 'RNETMIG': [15.0], 'POP': [np.nan]})
+    df = combine_vintages([old, new])
+    assert df['Year'].tolist() == [2019, 2020]
+    row = df.set_index('Year').loc[2020]
+    assert (row['RNETMIG'], row['Vintage'], row['NAME']) == (15.0, 2024, "Bend-Redmond, OR")
+    # The newer vintage has no POP for 2020, so the older estimate is kept
+    assert row['POP'] == 195000.0
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+from cohort_discovery import build_features, discover_cohorts, migration_features
+from panel import Panel
+
+
+def _migration_table(path):
+    # Two metros x 2011-2019; only Bend's rate changes between the early and late years
+    years = np.arange(2011, 2020)
+    pd.DataFrame({
+        'CBSA': np.repeat([13460, 43780], len(years)),
+        'NAME': np.repeat(["Bend-Redmond, OR Metro Area", "South Bend-Mishawaka, IN-MI Metro Area"], len(years)),
+        'Year': np.tile(years, 2),
+        'RNETMIG': np.r_[np.where(years <= 2013, 10.0, 20.0), np.full(len(years), -1.0)],
+    }).to_csv(path, index=False)
+
+
+def test_migration_features_follow_the_requested_regions(tmp_path):
+    path = tmp_path / "migration_all_metros.csv"
+    _migration_table(path)
+    names = np.array(["South Bend, IN", "Nowhere, ZZ", "Bend, OR"], dtype=object)
+    mig = migration_features(names, path=str(path))
+    assert mig.shape == (3, 2)
+    np.testing.assert_allclose(mig[0], [-1.0, 0.0])
+    assert np.isnan(mig[1]).all()
+    np.testing.assert_allclose(mig[2], [(3 * 10 + 6 * 20) / 9, 10.0])
+
+
+def _panel():
+    # Three growth regimes x 3 metros over the pre-period; Metro 9 starts in 2015
+    rng = np.random.default_rng(0)
+    dates = pd.period_range('2010-01', '2019-12', freq='M').to_timestamp(how='end').strftime('%Y-%m-%d')
+    trend = np.repeat([0.010, 0.004, -0.002], 3)
+    values = 2e5 * np.exp(np.cumsum(trend[:, None] + rng.normal(0, 0.001, size=(9, len(dates))), axis=1))
+    values = np.vstack([values, values[:1]])
+    values[9, :60] = np.nan
+    df = pd.DataFrame(values, columns=list(dates))
+    df.insert(0, 'RegionName', [f"Metro {i}, ST" for i in range(10)])
+    return Panel.from_wide(df)
+
+
+def _metro_migration(path, metros):
+    # Rates differ across metros but never change over time, so the shift column is constant
+    years = np.arange(2011, 2020)
+    pd.DataFrame({
+        'CBSA': np.repeat(90000 + np.arange(len(metros)), len(years)),
+        'NAME': np.repeat([f"Metro {i}, ST Metro Area" for i in metros], len(years)),
+        'Year': np.tile(years, len(metros)),
+        'RNETMIG': np.repeat([10.0 - i for i in metros], len(years)),
+    }).to_csv(path, index=False)
+
+
+def test_features_join_migration_for_matched_regions(tmp_path, capsys):
+    path = tmp_path / "migration_all_metros.csv"
+    _metro_migration(path, range(6))
+    X, names, growth, mig = build_features(_panel(), migration_path=str(path))
+    # 40 quarterly growth points + 2 migration columns, Metro 9 dropped (incomplete pre-period)
+    assert X.shape == (9, 42)
+    assert "Migration features matched for 6 of 9 regions" in capsys.readouterr().out
+    assert (mig[6:] == 0).all() and (mig[:6] != 0).any()
+
+
+def test_clusters_follow_growth_and_are_named_by_it(tmp_path):
+    path = tmp_path / "migration_all_metros.csv"
+    _metro_migration(path, range(6))
+    cohorts, df = discover_cohorts(_panel(), k=3, migration_path=str(path))
+    names = list(cohorts)
+    assert [n.split(':')[0] for n in names] == ["Cluster 1", "Cluster 2", "Cluster 3"]
+    assert [sorted(cohorts[n]) for n in names] == [[f"Metro {i}, ST" for i in range(j, j + 3)] for j in (0, 3, 6)]
+    assert {'MigrationZ', 'MigrationShiftZ'} <= set(df.columns)
+
+
+def test_growth_only_without_a_migration_table(tmp_path):
+    X, _, _, mig = build_features(_panel(), migration_path=str(tmp_path / "missing.csv"))
+    assert mig is None and X.shape == (9, 40)
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+import statsmodels.api as sm
+
+from event_study import build_design, fit_event_study
+from panel import Panel
+
+
+def _panel():
+    # 10 metros x 36 months around the event, two cohorts, some months missing
+    rng = np.random.default_rng(0)
+    dates = pd.period_range('2018-09', periods=36, freq='M').to_timestamp(how='end').strftime('%Y-%m-%d')
+    names = [f"Metro {i}, ST" for i in range(10)]
+    values = 2e5 * np.exp(rng.normal(0, 0.05, size=(10, 1)) + np.cumsum(rng.normal(0.003, 0.01, size=(10, 36)), axis=1))
+    values[rng.random(values.shape) < 0.1] = np.nan
+    df = pd.DataFrame(values, columns=list(dates))
+    df.insert(0, 'RegionName', names)
+    return Panel.from_wide(df, {'Zoom': names[:3], 'Hub': names[3:6]})
+
+
+def test_within_transform_matches_dummies():
+    panel = _panel()
+    table, vcov, names = fit_event_study(panel, tol=1e-13)
+
+    y, X, _, region, month = build_design(panel)
+    dummies = pd.get_dummies(pd.DataFrame({'r': region, 'm': month}).astype(str), drop_first=True, dtype=float)
+    lsdv = np.column_stack([X, np.ones(len(y)), dummies.to_numpy()])
+    fit = sm.OLS(y, lsdv).fit(cov_type='cluster', cov_kwds={'groups': region}, use_t=True)
+    k = X.shape[1]
+    np.testing.assert_allclose(table['coef'], fit.params[:k], rtol=1e-6, atol=1e-8)
+    np.testing.assert_allclose(table['se'], fit.bse[:k], rtol=1e-6)
+    np.testing.assert_allclose(vcov, fit.cov_params()[:k, :k], rtol=1e-6, atol=1e-12)
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+from normalize import cohort_reduce
+
+
+def test_cohort_reduce_matches_groupby():
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=(30, 6))
+    values[rng.random(values.shape) < 0.2] = np.nan
+    codes = rng.integers(0, 4, size=30)
+    groups, stats = cohort_reduce(values, codes)
+
+    expected = pd.DataFrame(values).groupby(codes).agg(['mean', 'min', 'max'])
+    np.testing.assert_array_equal(groups, expected.index)
+    for stat in ('mean', 'min', 'max'):
+        np.testing.assert_allclose(stats[stat], expected.xs(stat, axis=1, level=1), rtol=1e-12)
+
+
+def test_weighted_mean_matches_groupby():
+    rng = np.random.default_rng(1)
+    values = rng.normal(size=(20, 3))
+    values[3, 1] = np.nan
+    codes = rng.integers(0, 3, size=20)
+    weights = rng.uniform(1, 5, size=20)
+    _, stats = cohort_reduce(values, codes, weights)
+
+    for j in range(values.shape[1]):
+        df = pd.DataFrame({'x': values[:, j], 'w': weights, 'g': codes}).dropna()
+        expected = (df['x'] * df['w']).groupby(df['g']).sum() / df['w'].groupby(df['g']).sum()
+        np.testing.assert_allclose(stats['mean'][:, j], expected, rtol=1e-12)
@@ -0,0 +1,55 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from panel import Panel
+from panel_store import attach_array, open_store, share_array, store_panel
+
+
+def _panel():
+    dates = ['2020-01-31', '2020-02-29', '2020-03-31']
+    df = pd.DataFrame([[1.0, np.nan, 3.0], [4.0, 5.0, 6.0], [7.0, 8.0, 9.0]], columns=dates)
+    df.insert(0, 'RegionID', [11, 12, 13])
+    df.insert(1, 'RegionName', ["Bend, OR", "Boise City, ID", "Austin, TX"])
+    return Panel.from_wide(df, {'A': ["Bend, OR"], 'B': ["Austin, TX"]})
+
+
+def _row_sum(args):
+    path, row = args
+    return float(np.nansum(open_store(path).values[row]))
+
+
+def test_store_round_trips_and_is_written_once(tmp_path):
+    panel = _panel()
+    path = store_panel(panel, str(tmp_path))
+    stamp = os.stat(os.path.join(path, "values.npy")).st_mtime_ns
+    assert store_panel(panel, str(tmp_path)) == path
+    assert os.stat(os.path.join(path, "values.npy")).st_mtime_ns == stamp
+
+    stored = open_store(path)
+    # A read-only view of the mapped file, not a copy
+    assert isinstance(stored.values.base, np.memmap)
+    assert not stored.values.flags.owndata and not stored.values.flags.writeable
+    np.testing.assert_array_equal(stored.values, panel.values)
+    np.testing.assert_array_equal(stored.mask, panel.mask)
+    assert stored.periods.equals(panel.periods)
+    assert list(stored.region_names) == list(panel.region_names)
+    assert list(stored.cohorts) == list(panel.cohorts)
+    assert stored.meta['RegionID'].tolist() == [11, 12, 13]
+
+
+def test_workers_read_the_same_store(tmp_path):
+    path = store_panel(_panel(), str(tmp_path))
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        sums = list(executor.map(_row_sum, [(path, r) for r in range(3)]))
+    assert sums == [4.0, 15.0, 24.0]
+
+
+def test_shared_arrays_are_content_addressed(tmp_path):
+    arr = np.arange(12.0).reshape(3, 4)
+    path = share_array(arr, str(tmp_path))
+    assert share_array(arr.copy(), str(tmp_path)) == path
+    assert share_array(arr + 1, str(tmp_path)) != path
+    np.testing.assert_array_equal(attach_array(path), arr)
@@ -0,0 +1,96 @@
+import json
+import threading
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from panel import Panel
+from query_service import QueryEngine, make_server
+
+REGIONS = ["New York, NY", "Boston, MA", "Austin, TX", "Bend-Redmond, OR", "Boise City, ID"]
+
+
+@pytest.fixture(scope="module")
+def engine():
+    rng = np.random.default_rng(0)
+    dates = pd.period_range('2019-01', '2021-12', freq='M').to_timestamp(how='end').strftime('%Y-%m-%d')
+    values = 3e5 * np.exp(np.cumsum(rng.normal(0.005, 0.01, size=(len(REGIONS), len(dates))), axis=1))
+    df = pd.DataFrame(values, columns=list(dates))
+    df.insert(0, 'RegionName', REGIONS)
+    return QueryEngine(Panel.from_wide(df))
+
+
+def _growth(engine, region, baseline, end):
+    return engine.cube.growth(baseline, end)[list(engine.names).index(region)]
+
+
+def test_cohort_means_and_moves(engine):
+    cohorts = {'Core': ["New York, NY", "Boston, MA"], 'Enclaves': ["Bend, OR"]}
+    result = engine.query(cohorts=cohorts, baseline='2020-03', end='2021-06', series=False)
+    core = result['cohorts']['Core']['latest']['mean']
+    expected = np.mean([_growth(engine, r, '2020-03', '2021-06') for r in cohorts['Core']])
+    assert core == pytest.approx(expected, abs=1e-4)
+    # The alias resolves through its CBSA
+    assert result['cohorts']['Enclaves']['regions'] == ["Bend-Redmond, OR"]
+
+    before = engine.cache_info()['partial']
+    moved = engine.query(cohorts=cohorts, move={"Boston, MA": 'Enclaves'}, baseline='2020-03', end='2021-06', series=False)
+    assert moved['cohorts']['Core']['regions'] == ["New York, NY"]
+    assert sorted(moved['cohorts']['Enclaves']['regions']) == ["Bend-Redmond, OR", "Boston, MA"]
+    # Both cohorts changed membership, so both were reduced afresh
+    assert engine.cache_info()['partial']['misses'] == before['misses'] + 2
+
+
+def test_unresolved_or_empty_cohorts_are_errors(engine):
+    with pytest.raises(ValueError, match="No requested regions"):
+        engine.query(cohorts={'X': ["Nowhere, ZZ"]})
+    with pytest.raises(ValueError, match="at least one cohort"):
+        engine.query(cohorts={})
+
+
+@pytest.fixture(scope="module")
+def server(engine):
+    server = make_server(engine, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _post(server, body):
+    request = Request(f"{server.url}/query", data=json.dumps(body).encode())
+    try:
+        with urlopen(request) as r:
+            return r.status, json.load(r)
+    except HTTPError as e:
+        return e.code, json.load(e)
+
+
+@pytest.mark.parametrize("body, message", [
+    ([1, 2], "JSON object"),
+    ({'cohorts': {}}, "at least one cohort"),
+    ({'cohorts': {'A': "Austin, TX"}}, "'cohorts'"),
+    ({'move': ["Austin, TX"]}, "'move'"),
+    ({'baseline': 202003}, "'baseline'"),
+    ({'series': "no"}, "'series'"),
+    ({'cohorts': {'A': ["Nowhere, ZZ"]}}, "No requested regions"),
+    ({'end': "2030-01"}, "not in data"),
+])
+def test_bad_requests_get_400(server, body, message):
+    status, payload = _post(server, body)
+    assert status == 400
+    assert message in payload['error']
+
+
+def test_valid_request_and_unexpected_errors(server, monkeypatch):
+    status, payload = _post(server, {'cohorts': {'A': ["Austin, TX"]}, 'baseline': '2020-03'})
+    assert status == 200
+    assert payload['cohorts']['A']['series']['date'][-1] == '2021-12-31'
+
+    monkeypatch.setattr(server.engine, 'query', lambda **kw: 1 / 0)
+    status, payload = _post(server, {})
+    assert status == 500
+    assert "ZeroDivisionError" in payload['error']
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from panel import Panel
+from rebase import LogCube, cohort_grid, month_range
+
+
+def _cube():
+    rng = np.random.default_rng(0)
+    dates = pd.period_range('2019-01', periods=12, freq='M').to_timestamp(how='end').strftime('%Y-%m-%d')
+    values = 3e5 * np.exp(np.cumsum(rng.normal(0.005, 0.01, size=(6, 12)), axis=1))
+    df = pd.DataFrame(values, columns=list(dates))
+    df.insert(0, 'RegionName', [f"Metro {i}, ST" for i in range(6)])
+    panel = Panel.from_wide(df, {'A': ["Metro 0, ST", "Metro 1, ST", "Metro 2, ST"], 'B': ["Metro 3, ST", "Metro 4, ST"]})
+    return LogCube.from_panel(panel), panel
+
+
+def test_growth_matches_direct_percent_change():
+    cube, panel = _cube()
+    values = panel.values.astype(np.float64)
+    np.testing.assert_allclose(cube.growth('2019-03', '2019-10'), (values[:, 9] / values[:, 2] - 1) * 100, rtol=1e-9)
+    with pytest.raises(ValueError, match="2018-12"):
+        cube.growth('2018-12', '2019-10')
+
+
+def test_grid_matches_per_pair_cohort_means():
+    cube, _ = _cube()
+    grid = cohort_grid(cube, ['2019-02', '2019-06'], ['2019-04', '2019-12'])
+    row = grid[(grid['Cohort'] == 'A') & (grid['Baseline'] == '2019-06-30') & (grid['End'] == '2019-12-31')]
+    assert row['mean'].item() == pytest.approx(cube.growth('2019-06', '2019-12')[:3].mean())
+    # An end date before its baseline is left empty; Metro 5 is in no cohort
+    assert grid[(grid['Baseline'] == '2019-06-30') & (grid['End'] == '2019-04-30')]['mean'].isna().all()
+    assert set(grid['Cohort']) == {'A', 'B'}
+
+
+def test_empty_ranges_raise():
+    cube, _ = _cube()
+    with pytest.raises(ValueError, match="Empty grid"):
+        cohort_grid(cube, month_range('2019-09', '2019-03', cube.periods), ['2019-12'])
+
+
+def test_save_load_round_trip(tmp_path):
+    cube, _ = _cube()
+    cube.save(tmp_path / "cube.npz")
+    loaded = LogCube.load(tmp_path / "cube.npz")
+    np.testing.assert_array_equal(loaded.log_values, cube.log_values)
+    assert loaded.periods.equals(cube.periods)
+    assert list(loaded.cohorts.categories) == ['A', 'B']
+    assert pd.isna(loaded.cohorts[5])
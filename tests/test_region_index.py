@@ -0,0 +1,34 @@
+import pandas as pd
+
+from region_index import RegionIndex, load_index
+
+
+def _index():
+    crosswalk = pd.DataFrame({'CBSA': [35620, 13460], 'Name': ["New York, NY", "Bend, OR"],
+                              'Aliases': ["New York-Newark-Jersey City, NY-NJ-PA", None]})
+    return RegionIndex(crosswalk)
+
+
+def test_spellings_resolve_to_one_code_and_bare_names_do_not():
+    index = _index()
+    assert list(index.codes(["New York, NY", "New York-Newark-Jersey City, NY-NJ-PA Metro Area",
+                             "Bend-Redmond, OR", "New York", None])) == [35620, 35620, 13460, -1, -1]
+
+
+def test_extended_returns_a_copy():
+    index = _index()
+    extended = index.extended(["Reno, NV Metro Area"], [39900])
+    assert extended.lookup("Reno, NV") == 39900
+    assert index.lookup("Reno, NV") is None
+    assert extended.lookup("Bend, OR") == 13460
+
+
+def test_load_index_reads_census_tables(tmp_path):
+    crosswalk = tmp_path / "crosswalk.csv"
+    pd.DataFrame({'CBSA': [13460], 'Name': ["Bend, OR"], 'Aliases': [None]}).to_csv(crosswalk, index=False)
+    table = tmp_path / "census.csv"
+    pd.DataFrame({'CBSA': [43780, 43780], 'NAME': ["South Bend-Mishawaka, IN-MI Metro Area"] * 2,
+                  'Year': [2011, 2012]}).to_csv(table, index=False)
+    index = load_index(str(crosswalk), census_tables=(str(table), str(tmp_path / "missing.csv")))
+    assert index.lookup("South Bend, IN") == 43780
+    assert index.lookup("Bend, OR") == 13460
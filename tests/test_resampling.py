@@ -0,0 +1,30 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import resampling
+from resampling import chunk_sizes, run_inference
+
+
+def _cohorts():
+    rng = np.random.default_rng(0)
+    labels = np.repeat(np.array(["A", "B", "C"], dtype=object), 8)
+    return rng.normal(40, 10, size=len(labels)) + (labels == "A") * 15, labels
+
+
+def test_results_do_not_depend_on_the_pool(monkeypatch):
+    values, labels = _cohorts()
+    # Several chunks per pair, so the pool really splits the work
+    monkeypatch.setattr(resampling, "CHUNK_CELLS", 16 * 300)
+    serial, _ = run_inference(values, labels, n_draws=3000, seed=7, workers=1)
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        pooled, _ = run_inference(values, labels, n_draws=3000, seed=7, executor=executor)
+    pd.testing.assert_frame_equal(serial, pooled)
+    assert serial.loc[serial['cohort_b'] == 'A', 'p_value'].max() < 0.05
+
+
+def test_chunks_cover_every_draw():
+    sizes = chunk_sizes(10_001, 400)
+    assert sum(sizes) == 10_001
+    assert max(sizes) * 400 <= resampling.CHUNK_CELLS
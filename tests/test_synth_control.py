@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+import panel_store
+from synth_control import project_simplex, solve_all, solve_weights
+
+
+def _donors(seed=0, months=60, k=12):
+    rng = np.random.default_rng(seed)
+    Y0 = np.cumsum(rng.normal(0, 1, size=(months, k)), axis=0)
+    w = np.zeros(k)
+    w[[1, 4, 7]] = [0.5, 0.3, 0.2]
+    return Y0, w
+
+
+def test_projection_lands_on_the_simplex():
+    w = project_simplex(np.array([0.9, -0.4, 0.8, 0.1]))
+    assert w.sum() == pytest.approx(1.0)
+    assert (w >= 0).all()
+    np.testing.assert_allclose(project_simplex(np.array([0.2, 0.3, 0.5])), [0.2, 0.3, 0.5])
+
+
+def test_weights_recover_an_exact_convex_combination():
+    Y0, w_true = _donors()
+    w, iterations = solve_weights(Y0 @ w_true, Y0, tol=1e-12)
+    np.testing.assert_allclose(w, w_true, atol=1e-3)
+    assert w.sum() == pytest.approx(1.0)
+    assert iterations < 20000
+
+
+def test_solutions_are_cached_by_problem(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(panel_store, "STORE_DIR", str(tmp_path / "panels"))
+    Y0, w_true = _donors()
+    pre = np.column_stack([Y0 @ w_true, Y0])
+    jobs = [(0, list(range(1, 13))), (1, [2, 3, 4])]
+    first = solve_all(pre, jobs, workers=1, cache_dir=str(tmp_path / "synth"))
+    assert len(list((tmp_path / "synth").iterdir())) == 2
+    capsys.readouterr()
+    second = solve_all(pre, jobs, workers=1, cache_dir=str(tmp_path / "synth"))
+    assert "2 cached, 0 to solve" in capsys.readouterr().out
+    for a, b in zip(first, second):
+        np.testing.assert_array_equal(a, b)
+    np.testing.assert_allclose(first[0], w_true, atol=1e-3)
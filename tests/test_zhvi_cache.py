@@ -0,0 +1,52 @@
+import pandas as pd
+import pytest
+
+import zhvi_cache
+from zhvi_cache import cached_fetch, cache_stats
+from mock_server import serve
+
+
+@pytest.fixture(autouse=True)
+def online(monkeypatch):
+    monkeypatch.setattr(zhvi_cache, "FIXTURE_DIR", None)
+    monkeypatch.setattr(zhvi_cache, "OFFLINE", False)
+
+
+def _csv(value):
+    return f'RegionName,2020-01-31\n"Bend, OR",{value}\n'.encode(), "text/csv"
+
+
+def test_unchanged_source_is_revalidated_not_refetched(tmp_path):
+    routes = {"/a.csv": _csv(1.0)}
+    with serve(routes) as server:
+        first = cached_fetch(server.url + "/a.csv", cache_dir=str(tmp_path))
+        second = cached_fetch(server.url + "/a.csv", cache_dir=str(tmp_path))
+        routes["/a.csv"] = _csv(2.0)
+        third = cached_fetch(server.url + "/a.csv", cache_dir=str(tmp_path))
+    pd.testing.assert_frame_equal(first, second)
+    assert third.iloc[0, 1] == 2.0
+    stats = cache_stats(str(tmp_path))
+    assert (stats["misses"], stats["revalidated"]) == (2, 1)
+
+
+def test_cached_copy_is_served_when_the_source_is_down(tmp_path):
+    with serve({"/a.csv": _csv(1.0)}) as server:
+        url = server.url + "/a.csv"
+        cached_fetch(url, cache_dir=str(tmp_path))
+    df = cached_fetch(url, cache_dir=str(tmp_path))
+    assert df.iloc[0, 1] == 1.0
+    assert cache_stats(str(tmp_path))["stale"] == 1
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    routes = {f"/{name}.csv": _csv(value) for name, value in [("a", 1.0), ("b", 2.0), ("c", 3.0)]}
+    with serve(routes) as server:
+        cached_fetch(server.url + "/a.csv", cache_dir=str(tmp_path))
+        blob = cache_stats(str(tmp_path))["bytes"]
+        cached_fetch(server.url + "/b.csv", cache_dir=str(tmp_path))
+        cached_fetch(server.url + "/a.csv", cache_dir=str(tmp_path))  # a is now the most recent
+        cached_fetch(server.url + "/c.csv", cache_dir=str(tmp_path), max_bytes=2 * blob)
+    index = zhvi_cache._load_index(str(tmp_path))
+    urls = sorted(e["url"].rsplit("/", 1)[1] for e in index["entries"].values())
+    assert urls == ["a.csv", "c.csv"]
+    assert index["stats"]["evictions"] == 1
@@ -0,0 +1,27 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from zhvi_loader import _iter_lines, parse_zhvi
+
+CSV = (
+    "RegionID,RegionName,StateName,2019-12-31,2020-01-31,2020-02-29,2020-03-31\n"
+    '1,"Bend-Redmond, OR",OR,400000,401000,,403000\n'
+    '2,"Boise City, ID",ID,300000,301000,302000,303000\n'
+    '3,"Austin, TX",TX,350000,351000,352000,353000\n'
+)
+
+
+def test_lines_survive_chunk_boundaries_and_multibyte_characters():
+    text = "\ufeffName\nCoeur d\u2019Alene, ID\nlast"
+    lines = list(_iter_lines(io.BytesIO(text.encode("utf-8")), chunk_size=3))
+    assert lines == ["Name\n", "Coeur d\u2019Alene, ID\n", "last"]
+
+
+def test_pushdown_matches_filtering_the_full_frame():
+    df = parse_zhvi(io.BytesIO(CSV.encode()), regions=["Bend, OR", "Austin, TX"], start="2020-01-01", end="2020-02-29")
+    full = pd.read_csv(io.StringIO(CSV))
+    expected = full.loc[[0, 2], ["RegionID", "RegionName", "StateName", "2020-01-31", "2020-02-29"]].reset_index(drop=True)
+    pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+    assert np.isnan(df.loc[0, "2020-02-29"])
@@ -0,0 +1,90 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import zip_rollup
+from zip_rollup import rollup_stream, load_crosswalk, hist_quantiles, weight_basis
+
+# Six month-end columns; the baseline is March. 00003 is split 75/25 across
+# the two metros, 00004 has no metro and 00005 has no baseline value.
+ZIP_CSV = """RegionID,RegionName,Metro,2020-01-31,2020-02-29,2020-03-31,2020-04-30,2020-05-31,2020-06-30
+1,00001,"Alpha, XX",100,100,100,110,120,130
+2,00002,"Alpha, XX",200,200,200,200,210,220
+3,00003,"Beta, YY",50,50,50,55,60,60
+4,00004,,80,80,80,80,80,80
+5,00005,"Beta, YY",,,,70,70,70
+"""
+
+CROSSWALK_CSV = """ZIP,CBSA,RES_RATIO,HousingUnits
+1,10001,1.0,300
+2,10001,1.0,100
+3,10002,0.75,40
+3,10001,0.25,40
+5,10002,1.0,10
+"""
+
+
+def _rollup(crosswalk=None, chunk_rows=zip_rollup.CHUNK_ROWS):
+    return rollup_stream(io.StringIO(ZIP_CSV), crosswalk, chunk_rows=chunk_rows).set_index('RegionName')
+
+
+def _crosswalk(tmp_path, text=CROSSWALK_CSV):
+    path = tmp_path / "xw.csv"
+    path.write_text(text)
+    return load_crosswalk(str(path))
+
+
+def test_metro_column_rollup_weights_zips_equally():
+    df = _rollup()
+    # Mean growth since March (1.3, 1.1) on the mean baseline price (150)
+    assert df.loc['Alpha, XX', '2020-06-30'] == pytest.approx(150 * 1.2)
+    assert df.loc['Alpha, XX', ['ZipCount', 'HousingStock']].tolist() == [2, 2]
+    # The row without a baseline counts toward stock, not toward the series
+    assert df.loc['Beta, YY', ['ZipCount', 'HousingStock']].tolist() == [1, 2]
+    assert df.attrs['unmapped'] == 1 and df.attrs['no_baseline'] == 1
+
+
+def test_crosswalk_rollup_weights_by_housing_stock(tmp_path):
+    df = _rollup(_crosswalk(tmp_path))
+    assert set(df.index) == {'Alpha, XX', 'Beta, YY'}
+    assert df.loc['Alpha, XX', 'RegionID'] == 10001
+    # Weights 300, 100 and 10 (a quarter of 00003's 40 units)
+    stock = 300 + 100 + 10
+    growth = (1.3 * 300 + 1.1 * 100 + 1.2 * 10) / stock
+    base = (100 * 300 + 200 * 100 + 50 * 10) / stock
+    assert df.loc['Alpha, XX', '2020-06-30'] == pytest.approx(base * growth)
+    assert df.loc['Alpha, XX', 'HousingStock'] == pytest.approx(stock)
+    assert df.loc['Beta, YY', 'HousingStock'] == pytest.approx(30 + 10)
+    assert df.attrs['unmapped'] == 1
+
+
+def test_block_size_does_not_change_the_rollup(tmp_path):
+    crosswalk = _crosswalk(tmp_path)
+    whole = _rollup(crosswalk).sort_index()
+    rows = _rollup(crosswalk, chunk_rows=1).sort_index()
+    pd.testing.assert_frame_equal(whole, rows)
+    np.testing.assert_array_equal(whole.attrs['growth_hist'], rows.attrs['growth_hist'])
+
+
+def test_hist_quantiles_interpolate_within_bins():
+    lo, hi = zip_rollup.LOG_RANGE
+    width = (hi - lo) / zip_rollup.LOG_BINS
+    hist = np.zeros((2, zip_rollup.LOG_BINS))
+    # Equal weight in the bins starting at log growth 0 and 0.1
+    first, second = round(-lo / width), round((0.1 - lo) / width)
+    hist[0, [first, second]] = 1.0
+    q = hist_quantiles(hist, qs=(0.25, 0.5, 1.0))
+    np.testing.assert_allclose(q[0], np.expm1([width / 2, width, 0.1 + width]) * 100)
+    assert np.isnan(q[1]).all()
+
+
+def test_weight_basis_follows_crosswalk_columns(tmp_path):
+    assert weight_basis(str(tmp_path / "missing.csv")) == 'equal'
+    ratio = tmp_path / "ratio.csv"
+    ratio.write_text("ZIP,CBSA,RES_RATIO\n1,10001,1.0\n")
+    assert weight_basis(str(ratio)) == 'ratio'
+    housing = tmp_path / "housing.csv"
+    housing.write_text(CROSSWALK_CSV)
+    assert weight_basis(str(housing)) == 'housing'